@@ -0,0 +1,45 @@
+import copy
+import timeit
+
+from vdv736.delivery import SituationExchangeDelivery
+from vdv736.delivery import SituationExchangeDeliveryTemplate
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+
+
+def create_situation(num_lines: int) -> PublicTransportSituation:
+    affected_lines = ''.join(f"<AffectedLine><LineRef>LINE_{n}</LineRef></AffectedLine>" for n in range(num_lines))
+
+    return PublicTransportSituation.unserialize(f"""<PtSituationElement>
+        <SituationNumber>BENCHMARK_SITUATION</SituationNumber>
+        <Summary>Construction works in the city centre</Summary>
+        <Description>{'Due to construction works, several lines are diverted. ' * 10}</Description>
+        <Affects><Networks><AffectedNetwork>{affected_lines}</AffectedNetwork></Networks></Affects>
+    </PtSituationElement>""")
+
+
+def publish_per_subscriber(situation, subscriptions):
+    for subscription in subscriptions:
+        delivery = SituationExchangeDelivery('BENCHMARK_PUBLISHER', subscription)
+        delivery.add_situation(copy.deepcopy(situation))
+        delivery.xml()
+
+
+def publish_template(situation, subscriptions):
+    template = SituationExchangeDeliveryTemplate('BENCHMARK_PUBLISHER')
+    template.add_situation(situation)
+
+    for subscription in subscriptions:
+        template.render(subscription).xml()
+
+
+if __name__ == '__main__':
+    situation = create_situation(50)
+
+    for num_subscriptions in [1, 10, 100, 500]:
+        subscriptions = [Subscription.create(f"subscription-{n}", None, None, None, f"SUBSCRIBER_{n}", None) for n in range(num_subscriptions)]
+
+        per_subscriber = min(timeit.repeat(lambda: publish_per_subscriber(situation, subscriptions), number=3, repeat=3)) / 3
+        template = min(timeit.repeat(lambda: publish_template(situation, subscriptions), number=3, repeat=3)) / 3
+
+        print(f"{num_subscriptions:>4} subscriptions: per subscriber {per_subscriber * 1000:8.2f}ms, template {template * 1000:8.2f}ms, speedup {per_subscriber / template:6.1f}x")
@@ -0,0 +1,48 @@
+import asyncio
+import httpx
+import time
+import uuid
+
+from vdv736.delivery import SituationExchangeDelivery
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+from vdv736.subscriber import SubscriberEndpoint
+from vdv736.writer import Durability
+
+
+def create_delivery(num_situations: int) -> bytes:
+    delivery = SituationExchangeDelivery('BENCHMARK_PUBLISHER', Subscription.create('BENCHMARK_SUBSCRIPTION', None, None, None, 'BENCHMARK_SUBSCRIBER', None))
+    for n in range(num_situations):
+        delivery.add_situation(PublicTransportSituation.create(str(uuid.uuid4())))
+
+    return delivery.xml()
+
+
+async def deliver(endpoint, num_deliveries: int, concurrency: int, num_situations: int) -> float:
+    deliveries = [create_delivery(num_situations) for _ in range(num_deliveries)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    transport = httpx.ASGITransport(app=endpoint.create_endpoint('BENCHMARK_SUBSCRIBER'))
+    async with httpx.AsyncClient(transport=transport, base_url='http://subscriber') as client:
+
+        async def post(delivery):
+            async with semaphore:
+                response = await client.post('/delivery', content=delivery)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[post(delivery) for delivery in deliveries])
+
+        return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    for durability in Durability:
+        for num_situations in [1, 10]:
+            endpoint = SubscriberEndpoint('BENCHMARK_SUBSCRIBER', durability=durability)
+
+            duration = asyncio.run(deliver(endpoint, 1000, 50, num_situations))
+            print(f"{durability.value:>9}, {num_situations:>2} situation(s) per delivery: {1000 / duration:8.1f} deliveries/s")
+
+            endpoint.terminate()
+            endpoint._local_node_database.close(True)
@@ -0,0 +1,56 @@
+import timeit
+
+from vdv736.request import SituationExchangeSubscriptionRequest
+from vdv736.request import xml2siri_request
+from vdv736.model import Subscription
+from vdv736.sirixml import get_value
+
+
+def legacy_exists(obj, path):
+    path = path.split('.')
+    
+    level0 = path[0]
+    level1 = '.'.join(path[1:])
+    
+    return obj is not None and hasattr(obj, level0) if len(path) == 1 else legacy_exists(getattr(obj, level0), level1) if hasattr(obj, level0) else False
+
+
+def legacy_get_value(obj, path, default=None):
+    if legacy_exists(obj, path):
+        path = path.split('.')
+        
+        destination = obj
+        for element in path:
+            destination = getattr(destination, element)
+            
+        if hasattr(destination, 'text'):
+            return destination.text
+        else:
+            return default
+        
+    return default
+
+
+PATHS = [
+    'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SubscriptionIdentifier',
+    'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.InitialTerminationTime',
+    'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SubscriberRef',
+    'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SituationExchangeRequest.MissingElement'
+]
+
+
+def lookup(function, request):
+    for path in PATHS:
+        function(request, path)
+
+
+if __name__ == '__main__':
+    subscription = Subscription.create('BENCHMARK_SUBSCRIPTION', None, None, None, 'BENCHMARK_SUBSCRIBER', '2024-01-01T00:00:00+00:00')
+    request = xml2siri_request(SituationExchangeSubscriptionRequest(subscription).xml())
+
+    number = 10000
+
+    legacy = min(timeit.repeat(lambda: lookup(legacy_get_value, request), number=number, repeat=3)) / number
+    compiled = min(timeit.repeat(lambda: lookup(get_value, request), number=number, repeat=3)) / number
+
+    print(f"{len(PATHS)} lookups: legacy {legacy * 1000000:8.2f}us, compiled {compiled * 1000000:8.2f}us, speedup {legacy / compiled:6.1f}x")
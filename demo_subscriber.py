@@ -18,9 +18,9 @@ with Subscriber('PY_TEST_SUBSCRIBER', 'demo_participants.yaml') as subscriber:
         subscriber.unsubscribe(sid)
         sid = subscriber.subscribe('PY_TEST_PUBLISHER')
 
+        # subscriptions are checked by the heartbeat monitor in the background
         while True:
             time.sleep(60)
-            subscriber.status()
 
     else:
 
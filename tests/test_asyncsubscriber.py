@@ -0,0 +1,122 @@
+import asyncio
+import httpx
+import os
+import tempfile
+import unittest
+import yaml
+
+from vdv736.asyncsubscriber import AsyncSubscriber
+from vdv736.delivery import SituationExchangeDelivery
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+from vdv736.publisher import PublisherEndpoint
+from vdv736.response import SubscriptionResponse
+from vdv736.writer import Durability
+
+
+class AsyncSubscriber_Test(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        participant_config = {
+            'PY_TEST_SUBSCRIBER': {'host': '127.0.0.1', 'port': 9090, 'protocol': 'http'}
+        }
+
+        for n in range(2):
+            participant_config[f"PY_TEST_PUBLISHER_{n}"] = {
+                'host': '127.0.0.1',
+                'port': 9091 + n,
+                'protocol': 'http',
+                'status_endpoint': '/status',
+                'subscribe_endpoint': '/subscribe',
+                'unsubscribe_endpoint': '/unsubscribe',
+                'request_endpoint': '/request'
+            }
+
+        self._participant_config_file = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False)
+        yaml.safe_dump(participant_config, self._participant_config_file)
+        self._participant_config_file.close()
+
+        self._subscriber = AsyncSubscriber('PY_TEST_SUBSCRIBER', self._participant_config_file.name, remove_database=True)
+
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+        for publisher_ref in ['PY_TEST_PUBLISHER_0', 'PY_TEST_PUBLISHER_1']:
+            self._subscriber._transport._sessions[publisher_ref] = httpx.AsyncClient(transport=httpx.MockTransport(self._handle))
+
+    async def asyncTearDown(self):
+        await self._subscriber.aclose()
+
+    def tearDown(self):
+        os.remove(self._participant_config_file.name)
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        self._in_flight = self._in_flight + 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+        await asyncio.sleep(0.01)
+
+        self._in_flight = self._in_flight - 1
+
+        if request.url.path == '/subscribe':
+            response = SubscriptionResponse(f"PY_TEST_PUBLISHER_{request.url.port - 9091}")
+            response.ok('PY_TEST_SUBSCRIPTION', '2024-01-01T00:00:00Z')
+
+            return httpx.Response(200, content=response.xml())
+        elif request.url.path == '/request':
+            if request.headers.get('If-None-Match') == '"1"':
+                return httpx.Response(304)
+
+            delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+            delivery.add_situation(PublicTransportSituation.create(f"PY_TEST_SITUATION_{request.url.port}"))
+
+            return httpx.Response(200, content=delivery.xml(), headers={'ETag': '"1"'})
+
+        return httpx.Response(404)
+
+    async def test_subscribe_all(self):
+        subscription_ids = await self._subscriber.subscribe_all(['PY_TEST_PUBLISHER_0', 'PY_TEST_PUBLISHER_1'])
+
+        self.assertTrue(all(subscription_id is not None for subscription_id in subscription_ids.values()))
+        self.assertEqual(len(self._subscriber._local_node_database.get_subscriptions()), 2)
+
+        # both publishers were contacted at the same time
+        self.assertEqual(self._max_in_flight, 2)
+
+    async def test_request_all(self):
+        results = await self._subscriber.request_all(['PY_TEST_PUBLISHER_0', 'PY_TEST_PUBLISHER_1'])
+
+        self.assertEqual(results, {'PY_TEST_PUBLISHER_0': True, 'PY_TEST_PUBLISHER_1': True})
+        self.assertEqual(len(await self._subscriber.get_situations()), 2)
+
+        # conditional request is answered with 304 Not Modified
+        self.assertTrue(await self._subscriber.request('PY_TEST_PUBLISHER_0'))
+        self.assertEqual(self._subscriber.transport_stats()['PY_TEST_PUBLISHER_0'].requests, 2)
+
+    async def test_request_pages(self):
+        publisher_endpoint = PublisherEndpoint('PY_TEST_PUBLISHER_0', request_streaming=True, request_max_situations=2)
+        publisher_endpoint._local_node_database.add_situations({f"PY_TEST_SITUATION_{n}": PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}") for n in range(5)})
+
+        self._subscriber._transport._sessions['PY_TEST_PUBLISHER_0'] = httpx.AsyncClient(transport=httpx.ASGITransport(app=publisher_endpoint.create_endpoint('PY_TEST_PUBLISHER_0')))
+
+        # all pages are requested and stored, the next request isn't modified
+        try:
+            self.assertTrue(await self._subscriber.request('PY_TEST_PUBLISHER_0'))
+            self.assertEqual(len(await self._subscriber.get_situations()), 5)
+
+            self.assertTrue(await self._subscriber.request('PY_TEST_PUBLISHER_0'))
+            self.assertEqual(self._subscriber.transport_stats()['PY_TEST_PUBLISHER_0'].requests, 4)
+        finally:
+            publisher_endpoint._local_node_database.close(True)
+
+    async def test_parameters(self):
+        subscriber = AsyncSubscriber('PY_TEST_SUBSCRIBER', self._participant_config_file.name, heartbeat_interval=None, delivery_durability=Durability.QUEUED, delivery_message_window=60.0, remove_database=True)
+
+        # parameters of the blocking subscriber are forwarded
+        self.assertIsNone(subscriber._subscriber._heartbeat_monitor)
+        self.assertEqual(subscriber._subscriber._delivery_durability, Durability.QUEUED)
+        self.assertEqual(subscriber._subscriber._delivery_message_window, 60.0)
+
+        # blocking close of the transport doesn't raise on a running event loop
+        subscriber._transport.close()
+        await subscriber.aclose()
@@ -0,0 +1,39 @@
+import unittest
+
+from vdv736.cache import SituationCache
+
+
+class SituationCache_Test(unittest.TestCase):
+
+    def test_versions(self):
+        cache = SituationCache()
+        cache.put('S1', 1, 'situation', 10)
+
+        self.assertEqual(cache.get('S1', 1), 'situation')
+        self.assertIsNone(cache.get('S1', 2))
+        self.assertIsNone(cache.get('S2', 1))
+
+        stats = cache.stats()
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 2)
+
+    def test_eviction(self):
+        cache = SituationCache(25)
+        cache.put('S1', 1, 'first', 10)
+        cache.put('S2', 1, 'second', 10)
+
+        # S1 was used most recently, so S2 is evicted
+        cache.get('S1', 1)
+        cache.put('S3', 1, 'third', 10)
+
+        self.assertEqual(cache.get('S1', 1), 'first')
+        self.assertIsNone(cache.get('S2', 1))
+        self.assertEqual(cache.get('S3', 1), 'third')
+
+        stats = cache.stats()
+        self.assertEqual(stats.evictions, 1)
+        self.assertEqual(stats.size, 20)
+
+        # oversized situations are never cached
+        cache.put('S4', 1, 'fourth', 30)
+        self.assertIsNone(cache.get('S4', 1))
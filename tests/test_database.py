@@ -0,0 +1,332 @@
+import datetime
+import os
+import time
+import unittest
+import uuid
+
+from lxml.etree import tostring
+from lxml.objectify import Element
+
+from vdv736.database import local_node_database
+from vdv736.database import UpsertOutcome
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+
+
+class LocalNodeDatabase_Test(unittest.TestCase):
+
+    def setUp(self):
+        name = f"vdv736.test.{uuid.uuid4()}"
+
+        self._database = local_node_database(name)
+        self._other_database = local_node_database(name)
+
+    def tearDown(self):
+        self._other_database.close()
+        self._database.close(True)
+
+    def _create_subscription(self, subscription_id: str, subscriber_ref: str) -> Subscription:
+        return Subscription.create(subscription_id, '127.0.0.1', 9091, 'http', subscriber_ref, None)
+
+    def test_subscription_index(self):
+        self._database.add_subscription('S1', self._create_subscription('S1', 'PY_TEST_SUBSCRIBER_A'))
+        self._database.add_subscription('S2', self._create_subscription('S2', 'PY_TEST_SUBSCRIBER_A'))
+        self._database.add_subscription('S3', self._create_subscription('S3', 'PY_TEST_SUBSCRIBER_B'))
+
+        self.assertEqual(self._database.get_subscription('S1').subscriber, 'PY_TEST_SUBSCRIBER_A')
+        self.assertIsNone(self._database.get_subscription('S4'))
+        self.assertEqual(set(self._database.get_subscriptions_by_subscriber('PY_TEST_SUBSCRIBER_A').keys()), {'S1', 'S2'})
+
+        self._database.remove_subscription('S1')
+        self.assertEqual(set(self._database.get_subscriptions_by_subscriber('PY_TEST_SUBSCRIBER_A').keys()), {'S2'})
+        self.assertEqual(set(self._database.get_subscriptions().keys()), {'S2', 'S3'})
+
+    def test_subscription_index_across_connections(self):
+        self._database.add_subscription('S1', self._create_subscription('S1', 'PY_TEST_SUBSCRIBER_A'))
+        self.assertEqual(set(self._other_database.get_subscriptions().keys()), {'S1'})
+
+        self._other_database.add_subscription('S2', self._create_subscription('S2', 'PY_TEST_SUBSCRIBER_B'))
+        self.assertEqual(self._database.get_subscription('S2').subscriber, 'PY_TEST_SUBSCRIBER_B')
+
+        self._other_database.remove_subscription('S1')
+        self.assertIsNone(self._database.get_subscription('S1'))
+        self.assertEqual(len(self._database.get_subscriptions_by_subscriber('PY_TEST_SUBSCRIBER_A')), 0)
+
+    def test_subscription_index_revision(self):
+        self._database.add_subscription('S1', self._create_subscription('S1', 'PY_TEST_SUBSCRIBER_A'))
+        self._database.get_subscriptions()
+
+        # situations written by another connection don't invalidate the index
+        subscriptions = self._database._subscriptions
+        self._other_database.add_situation('S1', self._create_situation('S1', 1, '2024-01-01T10:00:00Z', 'summary'))
+
+        self._database.get_subscriptions()
+        self.assertIs(self._database._subscriptions, subscriptions)
+
+        # returned subscriptions are copies of the indexed ones
+        self._database.get_subscription('S1').remote_service_startup_time = '2024-01-01T10:00:00Z'
+        self.assertIsNone(self._database.get_subscription('S1').remote_service_startup_time)
+
+        # own changes following changes of another connection aren't written through into a stale index
+        self._other_database.add_subscription('S2', self._create_subscription('S2', 'PY_TEST_SUBSCRIBER_B'))
+        self._database.add_subscription('S3', self._create_subscription('S3', 'PY_TEST_SUBSCRIBER_B'))
+        self.assertEqual(set(self._database.get_subscriptions_by_subscriber('PY_TEST_SUBSCRIBER_B').keys()), {'S2', 'S3'})
+
+    def test_journal_mode(self):
+        cursor = self._database._connection.cursor()
+        cursor.execute("PRAGMA journal_mode")
+
+        self.assertEqual(cursor.fetchone()[0], 'wal')
+
+    def test_bulk_situations(self):
+        situations = {f"S{n}": PublicTransportSituation.create(f"S{n}") for n in range(100)}
+        self.assertTrue(self._database.add_situations(situations))
+        self.assertEqual(len(self._other_database.get_situations()), 100)
+
+        # adding fails as a whole if one of the situations exists already
+        self.assertFalse(self._database.add_situations({'S0': situations['S0'], 'S100': PublicTransportSituation.create('S100')}))
+        self.assertEqual(len(self._database.get_situations()), 100)
+
+        outcomes = self._database.upsert_situations({'S0': situations['S0'], 'S100': PublicTransportSituation.create('S100')})
+        self.assertEqual(outcomes, {'S0': UpsertOutcome.UNCHANGED, 'S100': UpsertOutcome.INSERTED})
+        self.assertEqual(len(self._database.get_situations()), 101)
+
+        self.assertTrue(self._database.remove_situations([f"S{n}" for n in range(50)]))
+        self.assertEqual(len(self._other_database.get_situations()), 51)
+
+    def _create_situation(self, situation_id: str, version: int|None, versioned_at: str|None, summary: str = None) -> PublicTransportSituation:
+        situation = PublicTransportSituation.create(situation_id)
+        if versioned_at is not None:
+            situation.VersionedAtTime = versioned_at
+        if version is not None:
+            situation.Version = version
+        if summary is not None:
+            situation.Summary = summary
+
+        return situation
+
+    def test_upsert_situation_versions(self):
+        upsert = self._database.upsert_situation
+
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T10:00:00Z')), UpsertOutcome.INSERTED)
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T10:00:00Z', 'different')), UpsertOutcome.UNCHANGED)
+        self.assertEqual(upsert('S1', self._create_situation('S1', 2, '2024-01-01T11:00:00Z')), UpsertOutcome.UPDATED)
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T12:00:00Z')), UpsertOutcome.STALE)
+        self.assertEqual(upsert('S1', self._create_situation('S1', 2, '2024-01-01T10:30:00+00:00')), UpsertOutcome.STALE)
+        self.assertEqual(upsert('S1', self._create_situation('S1', 2, '2024-01-01T12:00:00+01:00')), UpsertOutcome.UNCHANGED)
+
+        self.assertEqual(self._other_database.get_situations()['S1'].Version, 2)
+
+    def test_upsert_situation_without_versions(self):
+        upsert = self._database.upsert_situation
+
+        self.assertEqual(upsert('S1', self._create_situation('S1', None, None, 'first')), UpsertOutcome.INSERTED)
+        self.assertEqual(upsert('S1', self._create_situation('S1', None, None, 'first')), UpsertOutcome.UNCHANGED)
+        self.assertEqual(upsert('S1', self._create_situation('S1', None, None, 'second')), UpsertOutcome.UPDATED)
+
+        self.assertEqual(self._database.get_situations()['S1'].Summary, 'second')
+
+    def _create_affecting_situation(self, situation_id: str, line_refs: list[str], stop_point_refs: list[str], start: str, end: str|None, progress: str = 'open') -> PublicTransportSituation:
+        lines = ''.join(f"<AffectedLine><LineRef>{l}</LineRef></AffectedLine>" for l in line_refs)
+        stop_points = ''.join(f"<AffectedStopPoint><StopPointRef>{s}</StopPointRef></AffectedStopPoint>" for s in stop_point_refs)
+        end_time = f"<EndTime>{end}</EndTime>" if end is not None else ''
+
+        return PublicTransportSituation.unserialize(f"""<PtSituationElement xmlns="http://www.siri.org.uk/siri">
+            <ParticipantRef>PY_TEST_PUBLISHER</ParticipantRef>
+            <SituationNumber>{situation_id}</SituationNumber>
+            <ValidityPeriod><StartTime>{start}</StartTime>{end_time}</ValidityPeriod>
+            <Progress>{progress}</Progress>
+            <Severity>normal</Severity>
+            <Affects>
+                <Networks><AffectedNetwork>{lines}</AffectedNetwork></Networks>
+                <StopPoints>{stop_points}</StopPoints>
+            </Affects>
+        </PtSituationElement>""")
+
+    def test_query_situations(self):
+        self._database.add_situations({
+            'S1': self._create_affecting_situation('S1', ['L1', 'L2'], ['SP1'], '2024-01-01T00:00:00Z', '2024-01-31T00:00:00Z'),
+            'S2': self._create_affecting_situation('S2', ['L2'], ['SP2'], '2024-02-01T00:00:00Z', None, 'closing'),
+            'S3': self._create_affecting_situation('S3', [], ['SP1', 'SP2'], '2024-01-15T00:00:00Z', '2024-02-15T00:00:00Z')
+        })
+
+        self.assertEqual(set(self._database.query_situations(line_ref='L2').keys()), {'S1', 'S2'})
+        self.assertEqual(set(self._database.query_situations(stop_point_ref='SP1').keys()), {'S1', 'S3'})
+        self.assertEqual(set(self._database.query_situations(line_ref='L2', stop_point_ref='SP2').keys()), {'S2'})
+        self.assertEqual(set(self._database.query_situations(progress='closing').keys()), {'S2'})
+        self.assertEqual(set(self._database.query_situations(participant_ref='PY_TEST_PUBLISHER', severity='normal').keys()), {'S1', 'S2', 'S3'})
+        self.assertEqual(set(self._database.query_situations(valid_at=datetime.datetime(2024, 1, 20, tzinfo=datetime.timezone.utc)).keys()), {'S1', 'S3'})
+        self.assertEqual(set(self._database.query_situations(valid_at=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)).keys()), {'S2'})
+
+        # affected refs follow updates and removals
+        self._database.update_situation('S1', self._create_affecting_situation('S1', ['L3'], [], '2024-01-01T00:00:00Z', None))
+        self.assertEqual(set(self._database.query_situations(line_ref='L2').keys()), {'S2'})
+        self.assertEqual(set(self._other_database.query_situations(line_ref='L3').keys()), {'S1'})
+
+        self._database.remove_situation('S2')
+        self.assertEqual(len(self._database.query_situations(line_ref='L2')), 0)
+
+    def test_remove_expired(self):
+        self._database.add_situations({
+            'S1': self._create_affecting_situation('S1', ['L1'], [], '2024-01-01T00:00:00Z', '2024-01-31T00:00:00Z'),
+            'S2': self._create_affecting_situation('S2', ['L1'], [], '2024-01-01T00:00:00Z', None)
+        })
+
+        expired_subscription = self._create_subscription('S1', 'PY_TEST_SUBSCRIBER_A')
+        expired_subscription.termination = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self._database.add_subscription('S1', expired_subscription)
+
+        active_subscription = self._create_subscription('S2', 'PY_TEST_SUBSCRIBER_A')
+        active_subscription.termination = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=60)
+        self._database.add_subscription('S2', active_subscription)
+
+        self.assertEqual(self._database.remove_expired_situations(), 1)
+        self.assertEqual(set(self._database.get_situations().keys()), {'S2'})
+        self.assertEqual(len(self._database.query_situations(line_ref='L1')), 1)
+
+        self.assertEqual(self._database.remove_expired_subscriptions(), 1)
+        self.assertEqual(set(self._database.get_subscriptions().keys()), {'S2'})
+        self.assertEqual(set(self._other_database.get_subscriptions().keys()), {'S2'})
+
+        self.assertEqual(self._database.remove_expired_situations(), 0)
+        self.assertEqual(self._database.remove_expired_subscriptions(), 0)
+
+    def test_situation_changes(self):
+        self._database.add_situations({
+            'S1': PublicTransportSituation.create('S1'),
+            'S2': PublicTransportSituation.create('S2')
+        })
+
+        snapshot = self._database.get_situation_changes()
+        self.assertFalse(snapshot.incremental)
+        self.assertEqual(set(snapshot.situations.keys()), {'S1', 'S2'})
+
+        self._database.add_situation('S3', PublicTransportSituation.create('S3'))
+        self._other_database.remove_situation('S1')
+
+        changes = self._database.get_situation_changes(snapshot.epoch, snapshot.sequence)
+        self.assertTrue(changes.incremental)
+        self.assertGreater(changes.sequence, snapshot.sequence)
+        self.assertEqual(set(changes.situations.keys()), {'S3'})
+        self.assertEqual(changes.removed, ['S1'])
+
+        # nothing changed since the last sequence number
+        changes = self._database.get_situation_changes(changes.epoch, changes.sequence)
+        self.assertTrue(changes.incremental)
+        self.assertEqual(len(changes.situations), 0)
+        self.assertEqual(len(changes.removed), 0)
+
+        # unknown epochs and pruned tombstones require a full snapshot
+        self.assertFalse(self._database.get_situation_changes('other', snapshot.sequence).incremental)
+
+        self.assertEqual(self._database.remove_situation_tombstones(time.time() + 1), 1)
+        self.assertFalse(self._database.get_situation_changes(snapshot.epoch, snapshot.sequence).incremental)
+        self.assertTrue(self._database.get_situation_changes(changes.epoch, changes.sequence).incremental)
+
+    def test_iter_situations(self):
+        self._database.add_situations({f"S{n:02d}": PublicTransportSituation.create(f"S{n:02d}") for n in range(25)})
+
+        self.assertEqual([s[0] for s in self._database.iter_situations(chunk_size=4)], [f"S{n:02d}" for n in range(25)])
+        self.assertEqual([s[0] for s in self._database.iter_situations('S09', 10, 4)], [f"S{n:02d}" for n in range(10, 20)])
+        self.assertEqual(self._database.count_situations('S19'), 5)
+
+    def test_subscription_migration(self):
+        element = Element('subscription')
+        for name in Subscription.__slots__:
+            setattr(element, name, None)
+
+        element.id = 'S1'
+        element.port = 9091
+        element.subscriber = 'PY_TEST_SUBSCRIBER_A'
+        element.termination = '2024-01-01T00:00:00+00:00'
+
+        self._database._connection.execute("INSERT INTO subscriptions (id, serialized) VALUES (?, ?)", ('S1', tostring(element)))
+        self._database._connection.commit()
+
+        database = local_node_database(os.path.basename(self._database._filename))
+        serialized = database._connection.execute("SELECT serialized FROM subscriptions WHERE id = 'S1'").fetchone()['serialized']
+        subscription = database.get_subscription('S1')
+        database.close()
+
+        self.assertTrue(serialized.startswith('['))
+        self.assertEqual(subscription.port, 9091)
+        self.assertEqual(subscription.termination, datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+    def test_query_situation_summaries(self):
+        self._database.add_situations({
+            'S1': self._create_affecting_situation('S1', ['L1', 'L2'], ['SP1'], '2024-01-01T00:00:00Z', '2024-01-31T00:00:00Z'),
+            'S2': self._create_affecting_situation('S2', ['L2'], [], '2024-02-01T00:00:00Z', None, 'closing')
+        })
+
+        summaries = self._database.query_situation_summaries(line_ref='L2')
+        self.assertEqual(set(summaries.keys()), {'S1', 'S2'})
+
+        self.assertEqual(sorted(summaries['S1'].line_refs), ['L1', 'L2'])
+        self.assertEqual(summaries['S1'].stop_point_refs, ['SP1'])
+        self.assertEqual(summaries['S1'].validity_end, datetime.datetime(2024, 1, 31, tzinfo=datetime.timezone.utc))
+        self.assertEqual(summaries['S2'].stop_point_refs, [])
+        self.assertIsNone(summaries['S2'].validity_end)
+        self.assertEqual(summaries['S2'].progress, 'closing')
+
+        self.assertEqual(summaries['S1'].situation().SituationNumber.text, 'S1')
+        self.assertEqual(set(self._database.query_situation_summaries(progress='closing').keys()), {'S2'})
+
+    def test_upsert_situation_deduplicated(self):
+        upsert = self._database.upsert_situation
+
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T10:00:00Z', 'summary')), UpsertOutcome.INSERTED)
+
+        # republished with a new timestamp but identical content
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T11:00:00Z', 'summary')), UpsertOutcome.UNCHANGED)
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T11:00:00Z', 'summary'), False), UpsertOutcome.UPDATED)
+
+        self.assertEqual(upsert('S1', self._create_situation('S1', 1, '2024-01-01T12:00:00Z', 'changed')), UpsertOutcome.UPDATED)
+        self.assertEqual(self._database.get_situations()['S1'].Summary.text, 'changed')
+
+    def test_situation_annotations(self):
+        self._database.add_situation('S1', self._create_situation('S1', 1, '2024-01-01T10:00:00Z', 'summary'))
+
+        cursor = self._database._connection.cursor()
+        cursor.execute("SELECT serialized FROM situations WHERE id = 'S1'")
+        self.assertNotIn(b'pytype', cursor.fetchone()['serialized'])
+
+        # situations stored with annotations by earlier versions are cleaned once
+        cursor.execute("UPDATE situations SET serialized = ? WHERE id = 'S1'", (PublicTransportSituation.serialize(self._create_situation('S1', 1, '2024-01-01T10:00:00Z', 'summary')),))
+        self._database._connection.commit()
+
+        self._other_database.close()
+        self._other_database = local_node_database(os.path.basename(self._database._filename))
+
+        cursor.execute("SELECT serialized FROM situations WHERE id = 'S1'")
+        self.assertNotIn(b'pytype', cursor.fetchone()['serialized'])
+        self.assertEqual(self._database.get_situations()['S1'].Summary.text, 'summary')
+
+    def test_situation_cache(self):
+        self._database.add_situations({
+            'S1': self._create_situation('S1', 1, '2024-01-01T10:00:00Z', 'summary'),
+            'S2': self._create_situation('S2', 1, '2024-01-01T10:00:00Z', 'summary')
+        })
+
+        situations = self._database.get_situations()
+        self.assertEqual(self._database.situation_cache_stats().misses, 2)
+
+        # unchanged store is served from the cache
+        self.assertIs(self._database.get_situations()['S1'], situations['S1'])
+        self.assertIs(self._database.query_situations()['S2'], situations['S2'])
+        self.assertEqual(self._database.situation_cache_stats().hits, 4)
+
+        # updates of another connection invalidate the cached situation
+        self._other_database.update_situation('S1', self._create_situation('S1', 2, '2024-01-01T11:00:00Z', 'changed'))
+        self.assertEqual(self._database.get_situations()['S1'].Summary.text, 'changed')
+
+        self._database.remove_situation('S2')
+        self.assertEqual(set(self._database.get_situations().keys()), {'S1'})
+        self.assertEqual(self._database.situation_cache_stats().entries, 1)
+
+    def test_delivery_messages(self):
+        self._database.upsert_situation_rows(dict(), delivery_messages=[('PY_TEST_PUBLISHER', 'M1', 1000.0), ('PY_TEST_PUBLISHER', 'M2', 2000.0)])
+
+        self.assertEqual(self._other_database.get_delivery_messages(1500.0), [('PY_TEST_PUBLISHER', 'M2', 2000.0)])
+
+        self.assertEqual(self._database.remove_delivery_messages(1500.0), 1)
+        self.assertEqual(self._database.get_delivery_messages(0.0), [('PY_TEST_PUBLISHER', 'M2', 2000.0)])
@@ -0,0 +1,108 @@
+import re
+import unittest
+
+from vdv736.delivery import SituationExchangeDelivery
+from vdv736.delivery import SituationExchangeDeliveryReader
+from vdv736.delivery import SituationExchangeDeliveryTemplate
+from vdv736.delivery import xml2siri_delivery
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+from vdv736.sirixml import get_value as sirixml_get_value
+
+
+class SituationExchangeDeliveryTemplate_Test(unittest.TestCase):
+
+    def _normalize(self, xml: bytes) -> bytes:
+        xml = re.sub(rb'<ResponseTimestamp>[^<]*</ResponseTimestamp>', b'<ResponseTimestamp/>', xml)
+        xml = re.sub(rb'<ResponseMessageIdentifier>[^<]*</ResponseMessageIdentifier>', b'<ResponseMessageIdentifier/>', xml)
+
+        return xml
+
+    def test_render(self):
+        subscription = Subscription.create('PY_TEST_SUBSCRIPTION&1', None, None, None, 'PY_TEST_SUBSCRIBER', None)
+        situation = PublicTransportSituation.create('PY_TEST_SITUATION')
+
+        template = SituationExchangeDeliveryTemplate('PY_TEST_PUBLISHER')
+        template.add_situation(situation)
+
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', subscription)
+        delivery.add_situation(situation)
+
+        self.assertEqual(self._normalize(template.render(subscription).xml()), self._normalize(delivery.xml()))
+
+        rendered = xml2siri_delivery(template.render(subscription).xml())
+        self.assertEqual(sirixml_get_value(rendered, 'Siri.ServiceDelivery.SituationExchangeDelivery.SubscriptionRef'), 'PY_TEST_SUBSCRIPTION&1')
+        self.assertEqual(sirixml_get_value(rendered, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement.SituationNumber'), 'PY_TEST_SITUATION')
+
+    def test_render_without_subscription(self):
+        template = SituationExchangeDeliveryTemplate('PY_TEST_PUBLISHER')
+        template.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+
+        first = template.render(None).xml()
+        second = template.render(None).xml()
+
+        self.assertNotIn(b'SubscriberRef', first)
+        self.assertNotEqual(
+            sirixml_get_value(xml2siri_delivery(first), 'Siri.ServiceDelivery.ResponseMessageIdentifier'),
+            sirixml_get_value(xml2siri_delivery(second), 'Siri.ServiceDelivery.ResponseMessageIdentifier')
+        )
+
+    def test_render_stream(self):
+        template = SituationExchangeDeliveryTemplate('PY_TEST_PUBLISHER', True)
+        situations = (PublicTransportSituation.serialize(PublicTransportSituation.clean(PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}"))) for n in range(3))
+
+        xml = b''.join(template.render_stream(None, situations))
+        self.assertNotIn(b'pytype', xml)
+
+        rendered = xml2siri_delivery(xml)
+
+        self.assertEqual(sirixml_get_value(rendered, 'Siri.ServiceDelivery.MoreData'), 'true')
+        self.assertEqual(
+            [s.SituationNumber.text for s in rendered.Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement], 
+            ['PY_TEST_SITUATION_0', 'PY_TEST_SITUATION_1', 'PY_TEST_SITUATION_2']
+        )
+
+
+class SituationExchangeDeliveryReader_Test(unittest.TestCase):
+
+    def test_read(self):
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None), True)
+        for n in range(7):
+            delivery.add_situation(PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}"))
+
+        delivery.set_changes('epoch', 42, True, ['PY_TEST_SITUATION_X'])
+
+        xml = delivery.xml()
+        reader = SituationExchangeDeliveryReader(3)
+
+        batches = list()
+        for batch in reader.read(xml[n:n + 64] for n in range(0, len(xml), 64)):
+            batches.append(list(batch.keys()))
+
+            # stored situations are removed from the tree
+            situations = next(iter(batch.values())).getparent()
+            self.assertLessEqual(len(situations), 3)
+
+        self.assertEqual(batches, [
+            ['PY_TEST_SITUATION_0', 'PY_TEST_SITUATION_1', 'PY_TEST_SITUATION_2'], 
+            ['PY_TEST_SITUATION_3', 'PY_TEST_SITUATION_4', 'PY_TEST_SITUATION_5'], 
+            ['PY_TEST_SITUATION_6']
+        ])
+
+        self.assertEqual(reader.num_situations, 7)
+        self.assertEqual(reader.last_situation_id, 'PY_TEST_SITUATION_6')
+        self.assertEqual(reader.values['SubscriberRef'], 'PY_TEST_SUBSCRIBER')
+        self.assertTrue(reader.more_data)
+        self.assertEqual(reader.sequence, 42)
+        self.assertEqual(reader.removed, ['PY_TEST_SITUATION_X'])
+
+    def test_read_without_situation_number(self):
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', None)
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+        delivery.add_situation(PublicTransportSituation.unserialize('<PtSituationElement><Version>1</Version></PtSituationElement>'))
+
+        reader = SituationExchangeDeliveryReader()
+
+        # situations without identifier are skipped
+        self.assertEqual([list(batch.keys()) for batch in reader.read([delivery.xml()])], [['PY_TEST_SITUATION']])
+        self.assertEqual(reader.num_situations, 1)
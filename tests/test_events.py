@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+
+from vdv736.database import UpsertOutcome
+from vdv736.events import EventDispatcher
+from vdv736.events import EventStreamOverflow
+from vdv736.events import OverflowPolicy
+from vdv736.events import SituationEventType
+from vdv736.model import PublicTransportSituation
+
+
+class EventDispatcher_Test(unittest.IsolatedAsyncioTestCase):
+
+    def _create_row(self, situation_id: str, progress: str = None) -> dict:
+        return {
+            'serialized': PublicTransportSituation.serialize(PublicTransportSituation.create(situation_id)), 
+            'progress': progress
+        }
+
+    async def test_listener(self):
+        dispatcher = EventDispatcher()
+
+        events = list()
+        dispatcher.add_listener(events.append)
+
+        rows = {
+            'S1': self._create_row('S1'), 
+            'S2': self._create_row('S2'), 
+            'S3': self._create_row('S3', 'closed')
+        }
+
+        dispatcher.emit_outcomes(rows, {'S1': UpsertOutcome.INSERTED, 'S2': UpsertOutcome.UNCHANGED, 'S3': UpsertOutcome.UPDATED})
+        dispatcher.emit_removed(['S4'])
+
+        self.assertEqual([(e.type, e.situation_id) for e in events], [
+            (SituationEventType.ADDED, 'S1'), 
+            (SituationEventType.CLOSED, 'S3'), 
+            (SituationEventType.REMOVED, 'S4')
+        ])
+
+        # events carry the situation parsed from the stored row
+        self.assertEqual(events[0].situation.SituationNumber.text, 'S1')
+
+        dispatcher.remove_listener(events.append)
+        self.assertFalse(dispatcher.active)
+
+    async def test_stream(self):
+        dispatcher = EventDispatcher()
+
+        async with dispatcher.stream(max_size=2) as stream:
+            # emitted from another thread like the delivery endpoint does
+            await asyncio.to_thread(dispatcher.emit_removed, ['S1', 'S2', 'S3'])
+
+            self.assertEqual((await anext(stream)).situation_id, 'S2')
+            self.assertEqual((await anext(stream)).situation_id, 'S3')
+            self.assertEqual(stream.dropped, 1)
+
+        self.assertFalse(dispatcher.active)
+
+    async def test_stream_overflow(self):
+        dispatcher = EventDispatcher()
+
+        stream = dispatcher.stream(max_size=2, overflow=OverflowPolicy.CLOSE)
+        dispatcher.emit_removed(['S1', 'S2', 'S3'])
+
+        # queued events are delivered before the overflow is reported
+        self.assertEqual([(await anext(stream)).situation_id for _ in range(2)], ['S1', 'S2'])
+        with self.assertRaises(EventStreamOverflow):
+            await anext(stream)
+
+        self.assertFalse(dispatcher.active)
@@ -0,0 +1,127 @@
+import logging
+import time
+import unittest
+import uuid
+
+from vdv736.database import local_node_database
+from vdv736.heartbeat import HeartbeatMonitor
+from vdv736.isotime import parse_timestamp
+from vdv736.isotime import timestamp
+from vdv736.model import Subscription
+from vdv736.request import SituationExchangeSubscriptionRequest
+from vdv736.response import xml2siri_response
+from vdv736.response import CheckStatusResponse
+from vdv736.response import SubscriptionResponse
+from vdv736.subscriber import Subscriber
+
+from threading import Lock
+
+
+class HeartbeatMonitor_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._database = local_node_database(f"vdv736.test.{uuid.uuid4()}")
+
+    def tearDown(self):
+        self._database.close(True)
+
+    def _create_subscriber(self, service_started_time: str):
+        database = self._database
+
+        class StubSubscriber():
+            _check_subscription = Subscriber._check_subscription
+            _renew_subscription = Subscriber._renew_subscription
+            _renew_restarted_subscriptions = Subscriber._renew_restarted_subscriptions
+            _renewal_due = Subscriber._renewal_due
+            _process_status_response = Subscriber._process_status_response
+            _process_subscription_response = Subscriber._process_subscription_response
+
+            def __init__(self):
+                self._local_node_database = database
+                self._logger = logging.getLogger('uvicorn')
+                self._subscription_renewal = 3600.0
+                self._renewal_lock = Lock()
+
+                self.requests = list()
+                self.subscribed = list()
+                self.unreachable = False
+
+            def _send_request(self, subscription, request):
+                if isinstance(request, SituationExchangeSubscriptionRequest):
+                    self.subscribed.append(subscription.id)
+
+                    if self.unreachable:
+                        return None
+
+                    response = SubscriptionResponse('PY_TEST_PUBLISHER', service_started_time)
+                    response.ok(subscription.id, subscription.termination.isoformat())
+
+                    return xml2siri_response(response.xml())
+
+                self.requests.append(subscription.id)
+                return xml2siri_response(CheckStatusResponse(service_started_time).xml())
+            
+        return StubSubscriber()
+    
+    def _add_subscription(self, subscription_id: str, service_started_time: str, termination: str = None, shortest_possible_cycle: float = 0.1) -> None:
+        subscription = Subscription.create(subscription_id, '127.0.0.1', 9091, 'http', 'PY_TEST_SUBSCRIBER', termination)
+        subscription.remote_service_participant_ref = 'PY_TEST_PUBLISHER'
+        subscription.remote_service_startup_time = service_started_time
+        subscription.shortest_possible_cycle = shortest_possible_cycle
+
+        self._database.add_subscription(subscription_id, subscription)
+
+    def test_cycle(self):
+        self._add_subscription('S1', '2024-01-01T00:00:00+00:00')
+        subscriber = self._create_subscriber('2024-01-01T00:00:00+00:00')
+
+        monitor = HeartbeatMonitor(subscriber, jitter=0.0)
+        monitor.start()
+        time.sleep(0.5)
+        monitor.stop()
+
+        # checked once after the initial cycle, then rescheduled with the cycle advertised in the response
+        self.assertEqual(subscriber.requests, ['S1'])
+        self.assertEqual(self._database.get_subscription('S1').shortest_possible_cycle, 60.0)
+
+    def test_restart(self):
+        self._add_subscription('S1', '2024-01-01T00:00:00+00:00')
+        self._add_subscription('S2', '2024-01-01T00:00:00+00:00', shortest_possible_cycle=60.0)
+        subscriber = self._create_subscriber('2024-01-02T00:00:00+00:00')
+
+        monitor = HeartbeatMonitor(subscriber, jitter=0.0)
+        monitor.start()
+        time.sleep(0.5)
+        monitor.stop()
+
+        # the restart detected by the check of S1 renews S2 as well, each subscription with its own identifier
+        self.assertEqual(subscriber.requests, ['S1'])
+        self.assertEqual(sorted(subscriber.subscribed), ['S1', 'S2'])
+        self.assertEqual(sorted(self._database.get_subscriptions().keys()), ['S1', 'S2'])
+        self.assertTrue(all(s.remote_service_startup_time == '2024-01-02T00:00:00+00:00' for s in self._database.get_subscriptions().values()))
+
+    def test_renewal(self):
+        self._add_subscription('S1', '2024-01-01T00:00:00+00:00', timestamp(600))
+        self._add_subscription('S2', '2024-01-01T00:00:00+00:00', timestamp(60 * 60 * 12))
+        subscriber = self._create_subscriber('2024-01-01T00:00:00+00:00')
+
+        monitor = HeartbeatMonitor(subscriber, jitter=0.0)
+        monitor.start()
+        time.sleep(0.5)
+        monitor.stop()
+
+        # only the subscription close to its termination time is subscribed again and not lost
+        self.assertEqual(subscriber.subscribed, ['S1'])
+        self.assertGreater(self._database.get_subscription('S1').termination, parse_timestamp(timestamp(60 * 60 * 23)))
+
+    def test_renewal_failed(self):
+        self._add_subscription('S1', '2024-01-01T00:00:00+00:00', timestamp(600))
+        termination = self._database.get_subscription('S1').termination
+
+        subscriber = self._create_subscriber('2024-01-01T00:00:00+00:00')
+        subscriber.unreachable = True
+
+        # the subscription keeps its termination time, so the renewal is retried
+        self.assertFalse(subscriber._check_subscription('S1'))
+        self.assertEqual(subscriber.subscribed, ['S1'])
+        self.assertEqual(self._database.get_subscription('S1').termination, termination)
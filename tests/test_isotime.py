@@ -3,6 +3,7 @@ import datetime
 
 from vdv736.isotime import timestamp
 from vdv736.isotime import interval
+from vdv736.isotime import parse_interval
 
 
 class Timestamp_Test(unittest.TestCase):
@@ -21,3 +22,10 @@ class Timestamp_Test(unittest.TestCase):
         self.assertEqual(interval(1, 0, 5, 0, 10, 0), 'P1Y5DT10M')
         self.assertEqual(interval(0, 0, 0, 0, 0, 15), 'PT15S')
         self.assertEqual(interval(0, 0, 0, 0, 5, 0), 'PT5M')
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval(interval(0, 0, 0, 0, 1, 0)), 60.0)
+        self.assertEqual(parse_interval('P1DT1H30S'), 90030.0)
+        self.assertEqual(parse_interval('PT0.5S'), 0.5)
+        self.assertIsNone(parse_interval('1 minute'))
+        self.assertIsNone(parse_interval(None))
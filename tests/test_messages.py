@@ -0,0 +1,27 @@
+import unittest
+
+from vdv736.messages import ReceivedMessages
+
+
+class ReceivedMessages_Test(unittest.TestCase):
+
+    def test_window(self):
+        messages = ReceivedMessages(60.0)
+        messages.add('PY_TEST_PUBLISHER', 'M1', 1000.0)
+
+        self.assertTrue(messages.contains('PY_TEST_PUBLISHER', 'M1', 1030.0))
+        self.assertFalse(messages.contains('PY_TEST_PUBLISHER', 'M1', 1061.0))
+        self.assertFalse(messages.contains('PY_OTHER_PUBLISHER', 'M1', 1030.0))
+
+        # deliveries without identifier are never considered retries
+        self.assertIsNone(messages.add('PY_TEST_PUBLISHER', None, 1030.0))
+        self.assertFalse(messages.contains('PY_TEST_PUBLISHER', None, 1030.0))
+
+    def test_max_per_producer(self):
+        messages = ReceivedMessages(60.0, 2)
+        messages.load([('PY_TEST_PUBLISHER', 'M1', 1000.0), ('PY_TEST_PUBLISHER', 'M2', 1001.0), ('PY_OTHER_PUBLISHER', 'M1', 1001.0)])
+        messages.add('PY_TEST_PUBLISHER', 'M3', 1002.0)
+
+        self.assertFalse(messages.contains('PY_TEST_PUBLISHER', 'M1', 1002.0))
+        self.assertTrue(messages.contains('PY_TEST_PUBLISHER', 'M2', 1002.0))
+        self.assertTrue(messages.contains('PY_OTHER_PUBLISHER', 'M1', 1002.0))
@@ -1,5 +1,63 @@
+import datetime
 import unittest
 
+from lxml.etree import tostring
+from lxml.objectify import Element
+
+from vdv736.model import PublicTransportSituation
+from vdv736.model import SituationSummary
+from vdv736.model import Subscription
+
 
 class Model_Test(unittest.TestCase):
-    pass
\ No newline at end of file
+    
+    def test_subscription_codec(self):
+        subscription = Subscription.create('PY_TEST_SUBSCRIPTION', '127.0.0.1', '9091', 'http', 'PY_TEST_SUBSCRIBER', '2024-01-01T00:00:00+00:00')
+        subscription.remote_service_participant_ref = 'PY_TEST_PUBLISHER'
+        subscription.shortest_possible_cycle = 60.0
+
+        self.assertEqual(subscription.port, 9091)
+        self.assertEqual(subscription.termination, datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+        result = Subscription.unserialize(Subscription.serialize(subscription))
+        for name in Subscription.__slots__:
+            self.assertEqual(getattr(result, name), getattr(subscription, name))
+
+        # arrays written before a field was appended decode with its default
+        result = Subscription.unserialize(Subscription.serialize(subscription).rsplit(',', 1)[0] + ']')
+        self.assertIsNone(result.shortest_possible_cycle)
+
+        with self.assertRaises(AttributeError):
+            subscription.other = 'value'
+
+    def test_subscription_codec_xml(self):
+        element = Element('subscription')
+        element.id = 'PY_TEST_SUBSCRIPTION'
+        element.host = '127.0.0.1'
+        element.port = 9091
+        element.protocol = 'http'
+        element.subscriber = 'PY_TEST_SUBSCRIBER'
+        element.termination = '2024-01-01T00:00:00+00:00'
+        element.remote_service_participant_ref = 'PY_TEST_PUBLISHER'
+        element.remote_service_startup_time = None
+        element.status_endpoint = '/status'
+        element.subscribe_endpoint = '/subscribe'
+        element.unsubscribe_endpoint = '/unsubscribe'
+
+        subscription = Subscription.unserialize(tostring(element))
+
+        self.assertEqual(subscription.id, 'PY_TEST_SUBSCRIPTION')
+        self.assertEqual(subscription.port, 9091)
+        self.assertEqual(subscription.termination, datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertIsNone(subscription.remote_service_startup_time)
+        self.assertEqual(subscription.unsubscribe_endpoint, '/unsubscribe')
+
+    def test_situation_summary(self):
+        summary = SituationSummary('PY_TEST_SITUATION', PublicTransportSituation.serialize(PublicTransportSituation.create('PY_TEST_SITUATION')), summary='Construction works')
+
+        self.assertIsNone(summary._situation)
+        self.assertEqual(summary.situation().SituationNumber.text, 'PY_TEST_SITUATION')
+        self.assertIs(summary.situation(), summary.situation())
+
+        with self.assertRaises(AttributeError):
+            summary.other = 'value'
@@ -0,0 +1,324 @@
+import time
+import unittest
+
+from fastapi.testclient import TestClient
+
+from vdv736.compression import compress
+from vdv736.database import UpsertOutcome
+from vdv736.delivery import xml2siri_delivery
+from vdv736.isotime import parse_timestamp
+from vdv736.isotime import timestamp
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+from vdv736.publisher import Publisher
+from vdv736.publisher import PublisherEndpoint
+from vdv736.request import SituationExchangeRequest
+from vdv736.request import SituationExchangeSubscriptionRequest
+from vdv736.response import DataReceivedAcknowledgement
+from vdv736.response import xml2siri_response
+from vdv736.sirixml import get_bool as sirixml_get_bool
+from vdv736.sirixml import get_elements as sirixml_get_elements
+from vdv736.sirixml import get_value as sirixml_get_value
+
+
+class Publisher_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._publisher = Publisher('PY_TEST_PUBLISHER', 'demo_participants.yaml')
+        self._sent_deliveries = list()
+
+    def tearDown(self):
+        self._publisher._delivery_executor.shutdown()
+        self._publisher._local_node_database.close(True)
+
+    def _add_subscriptions(self, count: int):
+        for n in range(count):
+            subscription = Subscription.create(f"subscription-{n}", None, None, None, f"PY_TEST_SUBSCRIBER_{n}", None)
+            self._publisher._local_node_database.add_subscription(subscription.id, subscription)
+
+    def test_publish_situation_concurrently(self):
+        self._add_subscriptions(8)
+
+        def send_delivery(subscription, delivery):
+            time.sleep(0.2)
+
+            acknowledgement = DataReceivedAcknowledgement(subscription.subscriber, 'message')
+            if subscription.id == 'subscription-3':
+                acknowledgement.error()
+            else:
+                acknowledgement.ok()
+
+            return xml2siri_response(acknowledgement.xml())
+
+        self._publisher._send_delivery = send_delivery
+
+        start = time.perf_counter()
+        result = self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+        duration = time.perf_counter() - start
+
+        self.assertLess(duration, 0.2 * 8 / 2)
+        self.assertEqual(len(result.deliveries), 8)
+        self.assertFalse(result.success)
+        self.assertFalse(result.deliveries['subscription-3'].success)
+        self.assertTrue(result.deliveries['subscription-0'].success)
+        self.assertGreaterEqual(result.deliveries['subscription-0'].latency, 0.2)
+
+    def _send_delivery(self, subscription, delivery):
+        self._sent_deliveries.append(xml2siri_delivery(delivery.xml()))
+
+        acknowledgement = DataReceivedAcknowledgement(subscription.subscriber, 'message')
+        acknowledgement.ok()
+
+        return xml2siri_response(acknowledgement.xml())
+
+    def test_publish_situation_coalesced(self):
+        self._add_subscriptions(2)
+
+        self._publisher._send_delivery = self._send_delivery
+        self._publisher._coalesce_window = 0.2
+        self._publisher._coalesce_max_count = 3
+
+        self.assertIsNone(self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_1')))
+        self.assertIsNone(self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_2')))
+
+        result = self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_3'))
+        self.assertEqual(result.situation_ids, ['PY_TEST_SITUATION_1', 'PY_TEST_SITUATION_2', 'PY_TEST_SITUATION_3'])
+        self.assertEqual(len(self._sent_deliveries), 2)
+
+        for delivery in self._sent_deliveries:
+            self.assertEqual(len(sirixml_get_elements(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')), 3)
+
+        # remaining situations are sent after the coalescing window elapsed
+        self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_4'))
+        time.sleep(0.5)
+
+        self.assertEqual(len(self._sent_deliveries), 4)
+
+    def test_publish_situation_more_data(self):
+        self._add_subscriptions(1)
+
+        self._publisher._send_delivery = self._send_delivery
+        self._publisher._coalesce_window = 10.0
+
+        for n in range(5):
+            self._publisher.publish_situation(PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}"))
+
+        self._publisher._coalesce_max_bytes = 300
+        self._publisher.flush()
+
+        more_data = [sirixml_get_value(delivery, 'Siri.ServiceDelivery.MoreData') for delivery in self._sent_deliveries]
+        self.assertGreater(len(more_data), 1)
+        self.assertEqual(more_data[-1], 'false')
+        self.assertTrue(all(m == 'true' for m in more_data[:-1]))
+
+    def test_outbox(self):
+        self._add_subscriptions(1)
+        subscription = self._publisher._local_node_database.get_subscriptions()['subscription-0']
+
+        self._publisher._send_delivery = lambda subscription, delivery: None
+        self._publisher._outbox_max_attempts = 3
+
+        result = self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_1'))
+        self.assertFalse(result.deliveries['subscription-0'].success)
+        self.assertTrue(result.deliveries['subscription-0'].queued)
+
+        # further situations are queued behind the pending ones
+        result = self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_2'))
+        self.assertTrue(result.deliveries['subscription-0'].queued)
+
+        entries = self._publisher._local_node_database.get_outbox_entries('subscription-0')
+        self.assertEqual([e.situation_id for e in entries], ['PY_TEST_SITUATION_1', 'PY_TEST_SITUATION_2'])
+        self.assertEqual(self._publisher._local_node_database.get_outbox_subscription_ids(0), [])
+
+        # failed retry defers all entries
+        self._publisher._drain_outbox(subscription)
+
+        entries = self._publisher._local_node_database.get_outbox_entries('subscription-0')
+        self.assertTrue(all(e.attempts == 1 for e in entries))
+        self.assertTrue(all(e.next_attempt > time.time() for e in entries))
+
+        # successful retry delivers all entries in order and empties the outbox
+        self._publisher._send_delivery = self._send_delivery
+        self._publisher._drain_outbox(subscription)
+
+        self.assertEqual(len(self._publisher._local_node_database.get_outbox_entries('subscription-0')), 0)
+        self.assertEqual(
+            [s.SituationNumber.text for s in sirixml_get_elements(self._sent_deliveries[0], 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')], 
+            ['PY_TEST_SITUATION_1', 'PY_TEST_SITUATION_2']
+        )
+
+    def test_outbox_dead_letter(self):
+        self._add_subscriptions(1)
+        subscription = self._publisher._local_node_database.get_subscriptions()['subscription-0']
+
+        self._publisher._send_delivery = lambda subscription, delivery: None
+        self._publisher._outbox_max_attempts = 3
+
+        self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_1'))
+        for _ in range(3):
+            self._publisher._drain_outbox(subscription)
+
+        self.assertEqual(len(self._publisher._local_node_database.get_outbox_entries('subscription-0')), 0)
+        self.assertEqual(len(self._publisher._local_node_database.get_outbox_entries('subscription-0', 'dead')), 1)
+
+    def test_publish_unchanged_situation(self):
+        self._add_subscriptions(1)
+        self._publisher._send_delivery = self._send_delivery
+
+        self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_1'))
+        result = self._publisher.publish_situation(PublicTransportSituation.create('PY_TEST_SITUATION_1'))
+
+        self.assertEqual(result.outcomes['PY_TEST_SITUATION_1'], UpsertOutcome.UNCHANGED)
+        self.assertEqual(len(result.deliveries), 0)
+        self.assertEqual(len(self._sent_deliveries), 1)
+
+    def test_publish_republished_situation(self):
+        self._add_subscriptions(1)
+        self._publisher._send_delivery = self._send_delivery
+
+        for versioned_at in ['2024-01-01T10:00:00Z', '2024-01-01T11:00:00Z']:
+            situation = PublicTransportSituation.create('PY_TEST_SITUATION_1')
+            situation.VersionedAtTime = versioned_at
+            situation.Summary = 'summary'
+
+            self._publisher.publish_situation(situation)
+
+        stats = self._publisher.publish_stats()
+        self.assertEqual(stats.published, 1)
+        self.assertEqual(stats.deduplicated, 1)
+        self.assertEqual(len(self._sent_deliveries), 1)
+
+
+class PublisherEndpoint_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._endpoint = PublisherEndpoint('PY_TEST_PUBLISHER')
+        self._client = TestClient(self._endpoint.create_endpoint('PY_TEST_PUBLISHER'))
+
+    def tearDown(self):
+        self._endpoint._local_node_database.close(True)
+
+    def _request(self, headers: dict = None):
+        return self._client.post('/request', content=SituationExchangeRequest('PY_TEST_SUBSCRIBER').xml(), headers=headers)
+
+    def test_subscribe_renewal(self):
+        subscription = Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', timestamp(60))
+        self._client.post('/subscribe', content=SituationExchangeSubscriptionRequest(subscription).xml())
+
+        # a request with a known identifier renews the subscription instead of failing
+        subscription.termination = parse_timestamp(timestamp(3600))
+        response = xml2siri_response(self._client.post('/subscribe', content=SituationExchangeSubscriptionRequest(subscription).xml()).content)
+
+        self.assertTrue(sirixml_get_bool(response, 'Siri.SubscriptionResponse.ResponseStatus.Status'))
+        self.assertEqual(len(self._endpoint._local_node_database.get_subscriptions()), 1)
+        self.assertEqual(self._endpoint._local_node_database.get_subscription('PY_TEST_SUBSCRIPTION').termination, subscription.termination)
+
+    def test_request_conditional(self):
+        self._endpoint._local_node_database.add_situation('PY_TEST_SITUATION_1', PublicTransportSituation.create('PY_TEST_SITUATION_1'))
+
+        response = self._request()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Last-Modified', response.headers)
+        self.assertEqual(len(sirixml_get_elements(xml2siri_delivery(response.content), 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')), 1)
+
+        self.assertEqual(self._request({'If-None-Match': response.headers['ETag']}).status_code, 304)
+
+        # Last-Modified only has a resolution of one second, changes within the same second would be missed
+        self.assertEqual(self._request({'If-Modified-Since': response.headers['Last-Modified']}).status_code, 200)
+
+        # cached snapshots get a new message identifier on every response
+        self.assertNotEqual(
+            sirixml_get_value(xml2siri_delivery(self._request().content), 'Siri.ServiceDelivery.ResponseMessageIdentifier'),
+            sirixml_get_value(xml2siri_delivery(response.content), 'Siri.ServiceDelivery.ResponseMessageIdentifier')
+        )
+
+        self._endpoint._local_node_database.add_situation('PY_TEST_SITUATION_2', PublicTransportSituation.create('PY_TEST_SITUATION_2'))
+
+        response = self._request({'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(sirixml_get_elements(xml2siri_delivery(response.content), 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')), 2)
+
+    def test_request_changes(self):
+        self._endpoint._local_node_database.add_situation('PY_TEST_SITUATION_1', PublicTransportSituation.create('PY_TEST_SITUATION_1'))
+        self._endpoint._local_node_database.add_situation('PY_TEST_SITUATION_2', PublicTransportSituation.create('PY_TEST_SITUATION_2'))
+
+        delivery = xml2siri_delivery(self._request().content)
+        self.assertEqual(sirixml_get_value(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.Incremental'), 'false')
+
+        epoch = sirixml_get_value(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.Epoch')
+        sequence = sirixml_get_value(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.SequenceNumber')
+
+        self._endpoint._local_node_database.add_situation('PY_TEST_SITUATION_3', PublicTransportSituation.create('PY_TEST_SITUATION_3'))
+        self._endpoint._local_node_database.remove_situation('PY_TEST_SITUATION_1')
+
+        response = self._client.post('/request', content=SituationExchangeRequest('PY_TEST_SUBSCRIBER', epoch, int(sequence)).xml())
+        delivery = xml2siri_delivery(response.content)
+
+        self.assertEqual(sirixml_get_value(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.Incremental'), 'true')
+        self.assertEqual(
+            [s.SituationNumber.text for s in sirixml_get_elements(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')], 
+            ['PY_TEST_SITUATION_3']
+        )
+        self.assertEqual(
+            [s.text for s in sirixml_get_elements(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.RemovedSituations.SituationNumber')], 
+            ['PY_TEST_SITUATION_1']
+        )
+
+    def test_request_streaming(self):
+        self._endpoint._request_streaming = True
+        self._endpoint._request_max_situations = 2
+
+        self._endpoint._local_node_database.add_situations({f"PY_TEST_SITUATION_{n}": PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}") for n in range(5)})
+
+        pages = list()
+        start_after = None
+        while True:
+            delivery = xml2siri_delivery(self._client.post('/request', content=SituationExchangeRequest('PY_TEST_SUBSCRIBER', start_after=start_after).xml()).content)
+            pages.append([s.SituationNumber.text for s in sirixml_get_elements(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')])
+
+            if sirixml_get_value(delivery, 'Siri.ServiceDelivery.MoreData') != 'true':
+                break
+
+            start_after = pages[-1][-1]
+
+        self.assertEqual(pages, [
+            ['PY_TEST_SITUATION_0', 'PY_TEST_SITUATION_1'], 
+            ['PY_TEST_SITUATION_2', 'PY_TEST_SITUATION_3'], 
+            ['PY_TEST_SITUATION_4']
+        ])
+
+    def test_request_streaming_conditional(self):
+        self._endpoint._request_streaming = True
+        self._endpoint._request_max_situations = 2
+
+        self._endpoint._local_node_database.add_situations({f"PY_TEST_SITUATION_{n}": PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}") for n in range(3)})
+
+        response = self._request()
+        self.assertEqual(self._request({'If-None-Match': response.headers['ETag']}).status_code, 304)
+
+        # next page is a different response, validators of the first page don't match
+        for headers in [{'If-None-Match': response.headers['ETag']}, {'If-Modified-Since': response.headers['Last-Modified']}]:
+            page = self._client.post('/request', content=SituationExchangeRequest('PY_TEST_SUBSCRIBER', start_after='PY_TEST_SITUATION_1').xml(), headers=headers)
+
+            self.assertEqual(page.status_code, 200)
+            self.assertEqual(
+                [s.SituationNumber.text for s in sirixml_get_elements(xml2siri_delivery(page.content), 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')],
+                ['PY_TEST_SITUATION_2']
+            )
+
+    def test_request_max_situations_without_streaming(self):
+        with self.assertRaises(ValueError):
+            PublisherEndpoint('PY_TEST_PUBLISHER', request_streaming=False, request_max_situations=2)
+
+    def test_request_compressed(self):
+        self._endpoint._local_node_database.add_situations({f"PY_TEST_SITUATION_{n}": PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}") for n in range(50)})
+
+        response = self._client.post('/request', content=compress(SituationExchangeRequest('PY_TEST_SUBSCRIBER').xml(), 'deflate'), headers={
+            'Content-Encoding': 'deflate', 
+            'Accept-Encoding': 'gzip'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(sirixml_get_elements(xml2siri_delivery(response.content), 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')), 50)
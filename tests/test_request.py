@@ -4,6 +4,7 @@ import uuid
 from vdv736.isotime import timestamp
 from vdv736.model import Subscription
 from vdv736.request import SiriRequest
+from vdv736.request import CheckStatusRequest
 from vdv736.request import SubscriptionRequest
 from vdv736.request import SituationExchangeSubscriptionRequest
 
@@ -23,6 +24,19 @@ class SiriRequest_Test(unittest.TestCase):
         self.assertEqual(request._address, 'http://127.0.0.1:8080/subscribe')
 
 
+class CheckStatusRequest_Test(unittest.TestCase):
+    def test_CheckStatusRequest(self):
+
+        subscription = Subscription.create(str(uuid.uuid4()), '127.0.0.1', 8080, 'http', 'PY_TEST_SUBSCRIBER', None)
+
+        # requestor is given as subscription or as participant ref
+        for requestor in [subscription, 'PY_TEST_SUBSCRIBER']:
+            request = CheckStatusRequest(requestor)
+
+            self.assertIsNotNone(request.xml())
+            self.assertEqual(request.Siri.CheckStatusRequest.RequestorRef.text, 'PY_TEST_SUBSCRIBER')
+
+
 class SubscriptionRequest_Test(unittest.TestCase):
     def test_SubscriptionRequest(self):
 
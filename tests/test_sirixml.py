@@ -0,0 +1,62 @@
+import datetime
+import unittest
+
+from vdv736.delivery import xml2siri_delivery
+from vdv736.sirixml import compile_path
+from vdv736.sirixml import exists
+from vdv736.sirixml import get_attribute
+from vdv736.sirixml import get_bool
+from vdv736.sirixml import get_datetime
+from vdv736.sirixml import get_elements
+from vdv736.sirixml import get_int
+from vdv736.sirixml import get_value
+
+
+class SiriXml_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._delivery = xml2siri_delivery(b"""<?xml version='1.0' encoding='UTF-8'?>
+        <Siri xmlns="http://www.siri.org.uk/siri" version="2.1">
+            <ServiceDelivery>
+                <ResponseTimestamp>2024-01-01T12:00:00Z</ResponseTimestamp>
+                <MoreData>true</MoreData>
+                <SituationExchangeDelivery version="2.1">
+                    <Situations>
+                        <PtSituationElement><SituationNumber>S1</SituationNumber><Version>3</Version></PtSituationElement>
+                        <PtSituationElement><SituationNumber>S2</SituationNumber><Version>x</Version></PtSituationElement>
+                    </Situations>
+                </SituationExchangeDelivery>
+            </ServiceDelivery>
+        </Siri>""")
+
+    def test_compile_path(self):
+        self.assertIs(compile_path('Siri.ServiceDelivery.MoreData'), compile_path('Siri.ServiceDelivery.MoreData'))
+
+    def test_get_value(self):
+        self.assertTrue(exists(self._delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery'))
+        self.assertFalse(exists(self._delivery, 'Siri.ServiceDelivery.CheckStatusResponse'))
+        self.assertFalse(exists(None, 'Siri'))
+
+        self.assertEqual(get_value(self._delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement.SituationNumber'), 'S1')
+        self.assertEqual(get_value(self._delivery, 'Siri.ServiceDelivery.ProducerRef', 'default'), 'default')
+
+        situations = get_elements(self._delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')
+        self.assertEqual([get_value(s, 'SituationNumber') for s in situations], ['S1', 'S2'])
+        self.assertEqual(get_elements(self._delivery, 'Siri.ServiceDelivery.Situations'), [])
+
+        self.assertEqual(get_attribute(self._delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.version'), '2.1')
+        self.assertIsNone(get_attribute(self._delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.other'))
+
+    def test_typed_getters(self):
+        self.assertTrue(get_bool(self._delivery, 'Siri.ServiceDelivery.MoreData'))
+        self.assertFalse(get_bool(self._delivery, 'Siri.ServiceDelivery.Status', False))
+
+        situations = get_elements(self._delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement')
+        self.assertEqual(get_int(situations[0], 'Version'), 3)
+        self.assertEqual(get_int(situations[1], 'Version', 0), 0)
+
+        self.assertEqual(
+            get_datetime(self._delivery, 'Siri.ServiceDelivery.ResponseTimestamp'), 
+            datetime.datetime(2024, 1, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+        )
+        self.assertIsNone(get_datetime(self._delivery, 'Siri.ServiceDelivery.MoreData'))
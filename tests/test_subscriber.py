@@ -0,0 +1,220 @@
+import time
+import unittest
+import zlib
+
+from fastapi.testclient import TestClient
+from requests import Response as HttpResponse
+from requests.structures import CaseInsensitiveDict
+
+from vdv736.compression import compress
+from vdv736.database import UpsertOutcome
+from vdv736.delivery import SituationExchangeDelivery
+from vdv736.delivery import xml2siri_delivery
+from vdv736.events import EventDispatcher
+from vdv736.events import SituationEventType
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+from vdv736.publisher import PublisherEndpoint
+from vdv736.response import xml2siri_response
+from vdv736.sirixml import get_bool as sirixml_get_bool
+from vdv736.sirixml import get_value as sirixml_get_value
+from vdv736.subscriber import Subscriber
+from vdv736.subscriber import SubscriberEndpoint
+from vdv736.writer import Durability
+
+
+class EndpointTransport():
+
+    # posts requests to an endpoint in the same process and answers like HttpTransport
+    def __init__(self, client: TestClient):
+        self._client = client
+
+    def post(self, participant_ref: str, endpoint: str, data: bytes, headers: dict = None, timeout: float = None, stream: bool = False) -> HttpResponse:
+        response = self._client.post(endpoint, content=data, headers=headers)
+
+        result = HttpResponse()
+        result.status_code = response.status_code
+        result.headers = CaseInsensitiveDict(response.headers)
+        result._content = response.content
+        result._content_consumed = True
+
+        return result
+    
+    def close(self) -> None:
+        pass
+
+
+class Subscriber_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._publisher_endpoint = PublisherEndpoint('PY_TEST_PUBLISHER')
+        self._subscriber = Subscriber('PY_TEST_SUBSCRIBER', 'demo_participants.yaml', EndpointTransport(TestClient(self._publisher_endpoint.create_endpoint('PY_TEST_PUBLISHER'))))
+
+    def tearDown(self):
+        self._subscriber._local_node_database.close(True)
+        self._publisher_endpoint._local_node_database.close(True)
+
+    def test_subscribe_restart(self):
+        subscription_id = self._subscriber.subscribe('PY_TEST_PUBLISHER')
+        self.assertIsNotNone(subscription_id)
+
+        # the database and its subscriptions are kept on restart, subscribing again renews the stored subscription
+        self._subscriber._local_node_database.close()
+        self._subscriber = Subscriber('PY_TEST_SUBSCRIBER', 'demo_participants.yaml', self._subscriber._transport)
+
+        self.assertEqual(self._subscriber.subscribe('PY_TEST_PUBLISHER'), subscription_id)
+        self.assertEqual(list(self._subscriber._local_node_database.get_subscriptions().keys()), [subscription_id])
+        self.assertEqual(list(self._publisher_endpoint._local_node_database.get_subscriptions().keys()), [subscription_id])
+
+    def test_request_snapshot(self):
+        publisher_database = self._publisher_endpoint._local_node_database
+        publisher_database.add_situations({f"PY_TEST_SITUATION_{n}": PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}") for n in range(3)})
+
+        self.assertTrue(self._subscriber.request('PY_TEST_PUBLISHER'))
+        self.assertEqual(len(self._subscriber.get_situations()), 3)
+
+        # situations of another publisher aren't affected by snapshots of this one
+        self._subscriber._local_node_database.upsert_situation_rows(self._subscriber._local_node_database.situation_rows({
+            'PY_OTHER_SITUATION': PublicTransportSituation.create('PY_OTHER_SITUATION')
+        }, 'PY_OTHER_PUBLISHER'))
+
+        # tombstone of the removed situation is pruned before the next request, which is answered with a full snapshot
+        publisher_database.remove_situation('PY_TEST_SITUATION_0')
+        publisher_database.remove_situation_tombstones(time.time() + 1.0)
+
+        self.assertTrue(self._subscriber.request('PY_TEST_PUBLISHER'))
+        self.assertEqual(set(self._subscriber.get_situations().keys()), {'PY_TEST_SITUATION_1', 'PY_TEST_SITUATION_2', 'PY_OTHER_SITUATION'})
+
+
+class SubscriberEndpoint_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._events = EventDispatcher()
+
+        self._endpoint = SubscriberEndpoint('PY_TEST_SUBSCRIBER', ingest_batch_size=10, events=self._events)
+        self._client = TestClient(self._endpoint.create_endpoint('PY_TEST_SUBSCRIBER'))
+
+    def tearDown(self):
+        self._endpoint.terminate()
+        self._endpoint._local_node_database.close(True)
+
+    def test_delivery(self):
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+        for n in range(25):
+            delivery.add_situation(PublicTransportSituation.create(f"PY_TEST_SITUATION_{n}"))
+
+        response = self._client.post('/delivery', content=compress(delivery.xml(), 'gzip'), headers={'Content-Encoding': 'gzip'})
+
+        self.assertTrue(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+        self.assertEqual(len(self._endpoint._local_node_database.get_situations()), 25)
+
+    def test_delivery_raw_deflate(self):
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+
+        # deflate streams without zlib header are accepted like by the other endpoints
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        response = self._client.post('/delivery', content=compressor.compress(delivery.xml()) + compressor.flush(), headers={'Content-Encoding': 'deflate'})
+
+        self.assertTrue(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+        self.assertEqual(len(self._endpoint._local_node_database.get_situations()), 1)
+
+    def test_delivery_without_situation_number(self):
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+        delivery.add_situation(PublicTransportSituation.unserialize('<PtSituationElement><Version>1</Version></PtSituationElement>'))
+
+        # a situation without identifier doesn't reject the other situations of the delivery
+        response = self._client.post('/delivery', content=delivery.xml())
+
+        self.assertTrue(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+        self.assertEqual(list(self._endpoint._local_node_database.get_situations().keys()), ['PY_TEST_SITUATION'])
+
+    def test_delivery_invalid(self):
+        response = self._client.post('/delivery', content=b'<Siri><ServiceDelivery>')
+
+        self.assertFalse(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+
+    def test_delivery_events(self):
+        events = list()
+        self._events.add_listener(events.append)
+
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+
+        self._client.post('/delivery', content=delivery.xml())
+        self._client.post('/delivery', content=delivery.xml())
+
+        # the second, identical delivery doesn't change anything
+        self.assertEqual([(e.type, e.situation_id) for e in events], [(SituationEventType.ADDED, 'PY_TEST_SITUATION')])
+
+    def test_delivery_retried(self):
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+
+        xml = delivery.xml()
+
+        response = self._client.post('/delivery', content=xml)
+        self.assertTrue(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+
+        self._endpoint._local_node_database.remove_situation('PY_TEST_SITUATION')
+
+        # retries of a processed delivery are acknowledged without storing the situations again
+        response = self._client.post('/delivery', content=xml)
+        self.assertTrue(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+        self.assertEqual(len(self._endpoint._local_node_database.get_situations()), 0)
+
+        # processed deliveries are remembered across restarts
+        self._endpoint.terminate()
+        self._endpoint = SubscriberEndpoint('PY_TEST_SUBSCRIBER')
+        self._client = TestClient(self._endpoint.create_endpoint('PY_TEST_SUBSCRIBER'))
+
+        self._client.post('/delivery', content=xml)
+        self.assertEqual(len(self._endpoint._local_node_database.get_situations()), 0)
+
+        # same situations in a new delivery are stored
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_SUBSCRIBER', None))
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+
+        self._client.post('/delivery', content=delivery.xml())
+        self.assertEqual(len(self._endpoint._local_node_database.get_situations()), 1)
+
+    def test_delivery_queued(self):
+        self._endpoint.terminate()
+        self._endpoint = SubscriberEndpoint('PY_TEST_SUBSCRIBER', durability=Durability.QUEUED)
+
+        delivery = SituationExchangeDelivery('PY_TEST_PUBLISHER', Subscription.create('PY_TEST_SUBSCRIPTION', None, None, None, 'PY_TEST_CONSUMER', None))
+        delivery.add_situation(PublicTransportSituation.create('PY_TEST_SITUATION'))
+
+        xml = delivery.xml()
+        message_id = sirixml_get_value(xml2siri_delivery(xml), 'Siri.ServiceDelivery.ResponseMessageIdentifier')
+
+        # the event loop keeps running between requests, so queued deliveries are remembered in the background
+        with TestClient(self._endpoint.create_endpoint('PY_TEST_SUBSCRIBER')) as client:
+
+            # queued deliveries are acknowledged before they're stored, a failed write must not be remembered
+            upsert_situation_rows = self._endpoint._local_node_database.upsert_situation_rows
+            self._endpoint._local_node_database.upsert_situation_rows = lambda *args, **kwargs: {'PY_TEST_SITUATION': UpsertOutcome.FAILED}
+
+            response = client.post('/delivery', content=xml)
+            self.assertTrue(sirixml_get_bool(xml2siri_response(response.content), 'Siri.DataReceivedAcknowledgement.Status'))
+
+            self._endpoint._writer.submit(dict()).result()
+            self._endpoint._local_node_database.upsert_situation_rows = upsert_situation_rows
+
+            # the retry is processed again
+            client.post('/delivery', content=xml)
+            self._endpoint._writer.submit(dict()).result()
+
+            self.assertEqual(len(self._endpoint._local_node_database.get_situations()), 1)
+
+            for _ in range(100):
+                if self._endpoint._received_messages.contains('PY_TEST_PUBLISHER', message_id):
+                    break
+
+                time.sleep(0.01)
+
+            # retries of the stored delivery are acknowledged like the delivery itself
+            response = xml2siri_response(client.post('/delivery', content=xml).content)
+            self.assertTrue(sirixml_get_bool(response, 'Siri.DataReceivedAcknowledgement.Status'))
+            self.assertEqual(sirixml_get_value(response, 'Siri.DataReceivedAcknowledgement.ConsumerRef'), 'PY_TEST_CONSUMER')
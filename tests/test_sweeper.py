@@ -0,0 +1,46 @@
+import time
+import unittest
+import uuid
+
+from vdv736.database import local_node_database
+from vdv736.model import PublicTransportSituation
+from vdv736.model import Subscription
+from vdv736.sweeper import ExpirySweeper
+
+
+class ExpirySweeper_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._database = local_node_database(f"vdv736.test.{uuid.uuid4()}")
+
+    def tearDown(self):
+        self._database.close(True)
+
+    def test_sweep(self):
+        situation = PublicTransportSituation.unserialize("""<PtSituationElement>
+            <SituationNumber>S1</SituationNumber>
+            <ValidityPeriod><StartTime>2024-01-01T00:00:00Z</StartTime><EndTime>2024-01-02T00:00:00Z</EndTime></ValidityPeriod>
+        </PtSituationElement>""")
+        self._database.add_situation('S1', situation)
+
+        sweeper = ExpirySweeper(self._database, 0.1)
+        sweeper.start()
+        time.sleep(0.3)
+        sweeper.stop()
+
+        self.assertEqual(len(self._database.get_situations()), 0)
+        self.assertEqual(sweeper.last_result.situations, 0)
+        self.assertEqual(sweeper.last_result.subscriptions, 0)
+
+        self._database.add_situation('S1', situation)
+        self.assertEqual(sweeper.sweep().situations, 1)
+
+    def test_sweep_subscriptions(self):
+        self._database.add_subscription('S1', Subscription.create('S1', None, None, None, 'PY_TEST_SUBSCRIBER', '2024-01-01T00:00:00+00:00'))
+
+        # subscribers keep their own subscriptions until they're renewed
+        self.assertEqual(ExpirySweeper(self._database, sweep_subscriptions=False).sweep().subscriptions, 0)
+        self.assertEqual(len(self._database.get_subscriptions()), 1)
+
+        self.assertEqual(ExpirySweeper(self._database).sweep().subscriptions, 1)
+        self.assertEqual(len(self._database.get_subscriptions()), 0)
@@ -0,0 +1,63 @@
+import unittest
+
+from vdv736.compression import decompress
+from vdv736.transport import HttpTransport
+from vdv736.transport import TransportStats
+
+
+class HttpTransport_Test(unittest.TestCase):
+    def test_url(self):
+        transport = HttpTransport({
+            'PY_TEST_PUBLISHER': {
+                'host': '127.0.0.1',
+                'port': 9091,
+                'protocol': 'http'
+            }
+        })
+
+        self.assertEqual(transport.url('PY_TEST_PUBLISHER', '/status'), 'http://127.0.0.1:9091/status')
+        self.assertEqual(transport.url('PY_TEST_PUBLISHER', 'status'), 'http://127.0.0.1:9091/status')
+
+    def test_session_per_participant(self):
+        transport = HttpTransport(dict())
+
+        self.assertIs(transport._session('A'), transport._session('A'))
+        self.assertIsNot(transport._session('A'), transport._session('B'))
+
+        stats = transport.stats()
+        self.assertEqual(stats['A'].requests, 0)
+        self.assertEqual(stats['A'].reused, 0)
+
+        transport.close()
+        self.assertEqual(len(transport.stats()), 0)
+
+    def test_stats(self):
+        stats = TransportStats('A', 10, 2)
+        self.assertEqual(stats.reused, 8)
+
+    def test_compression(self):
+        transport = HttpTransport({
+            'PY_TEST_SUBSCRIBER': {
+                'host': '127.0.0.1',
+                'port': 9090,
+                'protocol': 'http',
+                'content_encoding': 'gzip'
+            }
+        }, compression_threshold=100)
+
+        requests = list()
+
+        class Session():
+            def post(self, url, headers, data, timeout, stream):
+                requests.append((headers, data))
+
+        transport._sessions['PY_TEST_SUBSCRIBER'] = Session()
+
+        transport.post('PY_TEST_SUBSCRIBER', '/delivery', b'<Siri/>', {'Content-Type': 'application/xml'})
+        transport.post('PY_TEST_SUBSCRIBER', '/delivery', b'<Siri>' + b' ' * 1000 + b'</Siri>', {'Content-Type': 'application/xml'})
+
+        self.assertNotIn('Content-Encoding', requests[0][0])
+        self.assertEqual(requests[0][1], b'<Siri/>')
+
+        self.assertEqual(requests[1][0]['Content-Encoding'], 'gzip')
+        self.assertEqual(decompress(requests[1][1], 'gzip'), b'<Siri>' + b' ' * 1000 + b'</Siri>')
@@ -0,0 +1,72 @@
+import unittest
+import uuid
+
+from vdv736.database import local_node_database
+from vdv736.database import UpsertOutcome
+from vdv736.model import PublicTransportSituation
+from vdv736.writer import SituationWriter
+
+
+class SituationWriter_Test(unittest.TestCase):
+
+    def setUp(self):
+        self._database = local_node_database(f"vdv736.test.{uuid.uuid4()}")
+
+    def tearDown(self):
+        self._database.close(True)
+
+    def _create_rows(self, *situation_ids) -> dict[str, dict]:
+        return self._database.situation_rows({situation_id: PublicTransportSituation.create(situation_id) for situation_id in situation_ids})
+
+    def test_group_commit(self):
+        writer = SituationWriter(self._database)
+
+        groups = list()
+        write = writer._write
+        writer._write = lambda group: groups.append(len(group)) or write(group)
+
+        # batches queued before the writer runs are stored in one transaction, repeated situations start a new one
+        results = [
+            writer.submit(self._create_rows('S1', 'S2')),
+            writer.submit(self._create_rows('S3')),
+            writer.submit(self._create_rows('S1'))
+        ]
+
+        writer.start()
+        writer.stop()
+
+        self.assertEqual(groups, [2, 1])
+        self.assertEqual(results[0].result(1), {'S1': UpsertOutcome.INSERTED, 'S2': UpsertOutcome.INSERTED})
+        self.assertEqual(results[2].result(1), {'S1': UpsertOutcome.UNCHANGED})
+        self.assertEqual(len(self._database.get_situations()), 3)
+
+    def test_cancelled(self):
+        writer = SituationWriter(self._database)
+
+        # a waiter giving up doesn't stop the writer or discard its rows
+        writer.submit(self._create_rows('S1')).cancel()
+        result = writer.submit(self._create_rows('S2'))
+
+        writer.start()
+        self.assertEqual(result.result(1), {'S2': UpsertOutcome.INSERTED})
+        writer.stop()
+
+        self.assertEqual(len(self._database.get_situations()), 2)
+
+    def test_failed_batch(self):
+        writer = SituationWriter(self._database)
+
+        # a batch failing the group commit doesn't fail the other batches of the group
+        results = [
+            writer.submit(self._create_rows('S1')),
+            writer.submit(self._database.situation_rows({None: PublicTransportSituation.create('S2')})),
+            writer.submit(self._create_rows('S3'))
+        ]
+
+        writer.start()
+        writer.stop()
+
+        self.assertEqual(results[0].result(1), {'S1': UpsertOutcome.INSERTED})
+        self.assertEqual(results[1].result(1), {None: UpsertOutcome.FAILED})
+        self.assertEqual(results[2].result(1), {'S3': UpsertOutcome.INSERTED})
+        self.assertEqual(len(self._database.get_situations()), 2)
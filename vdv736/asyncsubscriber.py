@@ -0,0 +1,223 @@
+import asyncio
+import datetime
+import httpx
+import logging
+
+from .asynctransport import AsyncHttpTransport
+from .cache import CacheStats
+from .events import EventStream
+from .events import OverflowPolicy
+from .events import SituationEvent
+from .request import SiriRequest
+from .request import CheckStatusRequest
+from .request import SituationExchangeSubscriptionRequest
+from .request import TerminateSubscriptionRequest
+from .response import xml2siri_response
+from .response import SiriResponse
+from .sirixml import get_value as sirixml_get_value
+from .model import PublicTransportSituation
+from .model import SituationSummary
+from .model import Subscription
+from .subscriber import Subscriber
+from .transport import TransportStats
+from .writer import Durability
+
+from typing import Callable
+from typing import Generator
+
+
+class AsyncSubscriber():
+
+    def __init__(self, participant_ref: str, participant_config_filename: str, transport: AsyncHttpTransport = None, sweep_interval: float = 60.0, pretty_print: bool = True, compression_threshold: int = 1024, compression_level: int = 6, ingest_batch_size: int = 500, situation_cache_size: int = 32 * 1024 * 1024, max_concurrency: int = 16, heartbeat_interval: float|None = 60.0, heartbeat_concurrency: int = 8, delivery_durability: Durability = Durability.COMMITTED, delivery_message_window: float = 3600.0, remove_database: bool = False, subscription_renewal: float = 3600.0):
+        self._logger = logging.getLogger('uvicorn')
+
+        # the subscriber runs the delivery endpoint, the sweeper and the heartbeat monitor in its own threads, its
+        # blocking transport is used by the heartbeat monitor and subscription renewals
+        self._subscriber = Subscriber(participant_ref, participant_config_filename, None, sweep_interval, pretty_print, compression_threshold, compression_level, ingest_batch_size, situation_cache_size, heartbeat_interval, heartbeat_concurrency, delivery_durability, delivery_message_window, remove_database, subscription_renewal)
+
+        self._service_participant_ref = participant_ref
+        self._participant_config = self._subscriber._participant_config
+        self._local_node_database = self._subscriber._local_node_database
+
+        self._pretty_print = pretty_print
+        self._ingest_batch_size = ingest_batch_size
+
+        self._transport = transport if transport is not None else AsyncHttpTransport(self._participant_config, compression_threshold=compression_threshold, compression_level=compression_level)
+
+        # bulk operations run concurrently, but never more than this many requests at once
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await asyncio.to_thread(self._subscriber.__enter__)
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, exception_traceback) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._transport is not None:
+            await self._transport.aclose()
+            self._transport = None
+
+        # stopping the endpoint thread and the sweeper blocks, keep the event loop free meanwhile
+        await asyncio.to_thread(self._subscriber.__exit__, None, None, None)
+
+    def transport_stats(self) -> dict[str, TransportStats]:
+        return self._transport.stats()
+
+    async def get_situations(self) -> dict[str, PublicTransportSituation]:
+        return await asyncio.to_thread(self._subscriber.get_situations)
+
+    async def query_situations(self, participant_ref: str = None, line_ref: str = None, stop_point_ref: str = None, progress: str = None, severity: str = None, valid_at: datetime.datetime = None) -> dict[str, PublicTransportSituation]:
+        return await asyncio.to_thread(self._subscriber.query_situations, participant_ref, line_ref, stop_point_ref, progress, severity, valid_at)
+
+    def situation_cache_stats(self) -> CacheStats:
+        return self._subscriber.situation_cache_stats()
+
+    async def get_situation_summaries(self) -> dict[str, SituationSummary]:
+        return await asyncio.to_thread(self._subscriber.get_situation_summaries)
+
+    async def query_situation_summaries(self, participant_ref: str = None, line_ref: str = None, stop_point_ref: str = None, progress: str = None, severity: str = None, valid_at: datetime.datetime = None) -> dict[str, SituationSummary]:
+        return await asyncio.to_thread(self._subscriber.query_situation_summaries, participant_ref, line_ref, stop_point_ref, progress, severity, valid_at)
+
+    def add_event_listener(self, callback: Callable[[SituationEvent], None]) -> None:
+        self._subscriber.add_event_listener(callback)
+
+    def remove_event_listener(self, callback: Callable[[SituationEvent], None]) -> None:
+        self._subscriber.remove_event_listener(callback)
+
+    def situation_events(self, max_size: int = 1000, overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> EventStream:
+        return self._subscriber.situation_events(max_size, overflow)
+
+    async def status(self, subscription_id=None) -> bool:
+        if subscription_id is not None:
+            return await self._status(subscription_id)
+        else:
+            subscriptions = await asyncio.to_thread(self._local_node_database.get_subscriptions)
+
+            results = await self._gather(self._status, subscriptions.keys())
+            return all(results.values())
+
+    async def _status(self, subscription_id: str) -> bool:
+        subscription = await asyncio.to_thread(self._local_node_database.get_subscription, subscription_id)
+        if subscription is None:
+            return False
+
+        # renewals share the guarded path of the heartbeat monitor and use the blocking transport
+        if self._subscriber._renewal_due(subscription):
+            return await asyncio.to_thread(self._subscriber._renew_subscription, subscription_id)
+
+        request = CheckStatusRequest(subscription)
+        response = await self._send_request(subscription, request)
+
+        status = await asyncio.to_thread(self._subscriber._process_status_response, subscription, response)
+        if status is None:
+            return await asyncio.to_thread(self._subscriber._renew_restarted_subscriptions, subscription, sirixml_get_value(response, 'Siri.CheckStatusResponse.ServiceStartedTime'))
+
+        return status
+
+    async def subscribe(self, participant_ref: str) -> str|None:
+        subscription = await asyncio.to_thread(self._subscriber._create_subscription, participant_ref)
+
+        request = SituationExchangeSubscriptionRequest(subscription)
+        response = await self._send_request(subscription, request)
+
+        return await asyncio.to_thread(self._subscriber._process_subscription_response, subscription, response)
+
+    async def subscribe_all(self, participant_refs: list[str]) -> dict[str, str|None]:
+        return await self._gather(self.subscribe, participant_refs)
+
+    async def unsubscribe(self, subscription_id: str) -> bool:
+        subscription = await asyncio.to_thread(self._local_node_database.get_subscription, subscription_id)
+        await asyncio.to_thread(self._local_node_database.remove_subscription, subscription_id)
+
+        request = TerminateSubscriptionRequest(self._service_participant_ref)
+        response = await self._send_request(subscription, request)
+
+        return self._subscriber._process_termination_response(subscription, response)
+
+    async def unsubscribe_all(self) -> dict[str, bool]:
+        subscriptions = await asyncio.to_thread(self._local_node_database.get_subscriptions)
+        return await self._gather(self.unsubscribe, subscriptions.keys())
+
+    async def request(self, publisher_ref: str) -> bool:
+        # pages are parsed and stored by the subscriber in a worker thread, the event loop only receives the bodies
+        loop = asyncio.get_running_loop()
+
+        return await asyncio.to_thread(self._subscriber._request_pages, publisher_ref, lambda *args: self._request_page(loop, *args))
+
+    def _request_page(self, loop: asyncio.AbstractEventLoop, publisher_ref: str, siri_request: SiriRequest, conditional: bool) -> tuple[int, str|None, Generator[bytes, None, None]|None]|None:
+        # called by the worker thread, requests and reads are run on the event loop
+        response = asyncio.run_coroutine_threadsafe(self._send_direct_request(publisher_ref, siri_request, conditional), loop).result()
+        if response is None:
+            return None
+
+        if response.status_code == 304:
+            asyncio.run_coroutine_threadsafe(response.aclose(), loop).result()
+            return (response.status_code, None, None)
+
+        async def next_chunk(chunks):
+            return await anext(chunks, None)
+
+        def chunks():
+            try:
+                body = response.aiter_bytes(64 * 1024)
+                while True:
+                    chunk = asyncio.run_coroutine_threadsafe(next_chunk(body), loop).result()
+                    if chunk is None:
+                        break
+
+                    yield chunk
+            finally:
+                asyncio.run_coroutine_threadsafe(response.aclose(), loop).result()
+
+        return (response.status_code, response.headers.get('ETag'), chunks())
+
+    async def request_all(self, publisher_refs: list[str]) -> dict[str, bool]:
+        return await self._gather(self.request, publisher_refs)
+
+    async def _gather(self, operation, keys) -> dict:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def run(key):
+            async with self._semaphore:
+                return await operation(key)
+
+        keys = list(keys)
+        results = await asyncio.gather(*[run(key) for key in keys])
+
+        return dict(zip(keys, results))
+
+    async def _send_request(self, subscription: Subscription, siri_request: SiriRequest) -> SiriResponse|None:
+        try:
+            endpoint = self._subscriber._request_endpoint(subscription, siri_request)
+            headers = {
+                "Content-Type": "application/xml"
+            }
+
+            response_xml = await self._transport.post(subscription.remote_service_participant_ref, endpoint, siri_request.xml(self._pretty_print), headers)
+            response = xml2siri_response(response_xml.content)
+
+            return response
+        except Exception as ex:
+            self._logger.error(ex)
+            return None
+
+    async def _send_direct_request(self, publisher_ref: str, siri_request: SiriRequest, conditional: bool = True) -> httpx.Response|None:
+        try:
+            endpoint = self._participant_config[publisher_ref]['request_endpoint']
+            headers = self._subscriber._direct_request_headers(publisher_ref, conditional)
+
+            response = await self._transport.post(publisher_ref, endpoint, siri_request.xml(self._pretty_print), headers, stream=True)
+
+            # unlike requests, httpx treats 304 Not Modified as an error as well
+            if response.is_error:
+                await response.aclose()
+                response.raise_for_status()
+
+            return response
+        except Exception as ex:
+            self._logger.error(ex)
+            return None
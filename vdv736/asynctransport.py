@@ -0,0 +1,65 @@
+import asyncio
+import httpx
+
+from .transport import HttpTransport
+from .transport import TransportStats
+
+
+class AsyncHttpTransport(HttpTransport):
+
+    def __init__(self, participant_config: dict, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 30.0, compression_threshold: int = 1024, compression_level: int = 6):
+        super().__init__(participant_config, pool_size, connect_timeout, read_timeout, compression_threshold, compression_level)
+
+        # number of requests and opened connections per remote participant, httpx doesn't expose pool statistics
+        self._num_requests = dict()
+        self._num_connections = dict()
+
+        # aclose() scheduled by a blocking close() on a running event loop
+        self._closing = None
+
+    async def post(self, participant_ref: str, endpoint: str, data: bytes, headers: dict = None, timeout: float = None, stream: bool = False) -> httpx.Response:
+        read_timeout = timeout if timeout is not None else self._read_timeout
+        data, headers = self._encode(participant_ref, data, headers)
+
+        client = self._session(participant_ref)
+
+        async def trace(event_name: str, info: dict) -> None:
+            if event_name == 'connection.connect_tcp.complete':
+                self._num_connections[participant_ref] = self._num_connections.get(participant_ref, 0) + 1
+
+        self._num_requests[participant_ref] = self._num_requests.get(participant_ref, 0) + 1
+
+        request = client.build_request('POST', self.url(participant_ref, endpoint), headers=headers, content=data, timeout=httpx.Timeout(read_timeout, connect=self._connect_timeout), extensions={'trace': trace})
+        return await client.send(request, stream=stream)
+
+    def stats(self) -> dict[str, TransportStats]:
+        with self._lock:
+            return {participant_ref: TransportStats(participant_ref, self._num_requests.get(participant_ref, 0), self._num_connections.get(participant_ref, 0)) for participant_ref in self._sessions.keys()}
+
+    async def aclose(self) -> None:
+        with self._lock:
+            clients = list(self._sessions.values())
+            self._sessions.clear()
+
+        for client in clients:
+            await client.aclose()
+
+    def close(self) -> None:
+        # blocking callers can't await aclose(), the clients are closed by the running event loop or a new one
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is not None:
+            self._closing = loop.create_task(self.aclose())
+        else:
+            asyncio.run(self.aclose())
+
+    def _session(self, participant_ref: str) -> httpx.AsyncClient:
+        with self._lock:
+            if participant_ref not in self._sessions:
+                limits = httpx.Limits(max_connections=self._pool_size, max_keepalive_connections=self._pool_size)
+                self._sessions[participant_ref] = httpx.AsyncClient(limits=limits)
+
+            return self._sessions[participant_ref]
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class CacheStats():
+
+    def __init__(self, hits: int, misses: int, evictions: int, entries: int, size: int):
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.entries = entries
+        self.size = size
+
+
+class SituationCache():
+
+    def __init__(self, max_size: int = 32 * 1024 * 1024):
+        # budget is measured in bytes of serialized XML
+        self._max_size = max_size
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, situation_id: str, version: int):
+        with self._lock:
+            entry = self._entries.get(situation_id)
+            if entry is None or entry[0] != version:
+                self._misses = self._misses + 1
+                return None
+
+            self._entries.move_to_end(situation_id)
+            self._hits = self._hits + 1
+
+            return entry[1]
+
+    def put(self, situation_id: str, version: int, situation, size: int) -> None:
+        if size > self._max_size:
+            return
+
+        with self._lock:
+            self._remove(situation_id)
+
+            self._entries[situation_id] = (version, situation, size)
+            self._size = self._size + size
+
+            # evict least recently used situations until the budget is met again
+            while self._size > self._max_size:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size = self._size - evicted_size
+                self._evictions = self._evictions + 1
+
+    def remove(self, situation_id: str) -> None:
+        with self._lock:
+            self._remove(situation_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, len(self._entries), self._size)
+
+    def _remove(self, situation_id: str) -> None:
+        entry = self._entries.pop(situation_id, None)
+        if entry is not None:
+            self._size = self._size - entry[2]
@@ -0,0 +1,78 @@
+import gzip
+import zlib
+
+
+SUPPORTED_ENCODINGS = ['gzip', 'deflate']
+
+
+class IdentityDecompressor():
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+    
+    def flush(self) -> bytes:
+        return b''
+
+
+class DeflateDecompressor():
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj()
+
+        # input is kept until the zlib header has been checked
+        self._head = b''
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._head is None:
+            return self._decompressor.decompress(data)
+        
+        self._head = self._head + data
+        try:
+            result = self._decompressor.decompress(data)
+        except zlib.error:
+            # some clients send raw deflate streams without zlib header
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            result = self._decompressor.decompress(self._head)
+
+        if len(self._head) >= 2:
+            self._head = None
+
+        return result
+    
+    def flush(self) -> bytes:
+        return self._decompressor.flush()
+
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+    elif encoding == 'deflate':
+        return zlib.compress(data, level)
+
+    raise ValueError(f"Unsupported content encoding {encoding}")
+
+def decompress(data: bytes, encoding: str|None) -> bytes:
+    encoding = encoding.strip().lower() if encoding is not None else 'identity'
+
+    if encoding == 'identity' or encoding == '':
+        return data
+    elif encoding == 'gzip' or encoding == 'x-gzip':
+        return gzip.decompress(data)
+    elif encoding == 'deflate':
+        decompressor = DeflateDecompressor()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    raise ValueError(f"Unsupported content encoding {encoding}")
+
+def decompressor(encoding: str|None):
+    encoding = encoding.strip().lower() if encoding is not None else 'identity'
+
+    # incremental decompression of streamed bodies
+    if encoding == 'identity' or encoding == '':
+        return IdentityDecompressor()
+    elif encoding == 'gzip' or encoding == 'x-gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return DeflateDecompressor()
+
+    raise ValueError(f"Unsupported content encoding {encoding}")
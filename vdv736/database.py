@@ -1,147 +1,946 @@
+import copy
+import datetime
+import logging
 import os
 import platform
 import sqlite3
 import tempfile
+import time
+import uuid
 
+from .cache import CacheStats
+from .cache import SituationCache
+from .isotime import parse_timestamp
 from .model import PublicTransportSituation
+from .model import SituationSummary
 from .model import Subscription
 
+from enum import Enum
+from typing import Iterator
+from threading import RLock
+
+
+class UpsertOutcome(Enum):
+    INSERTED = 'inserted'
+    UPDATED = 'updated'
+    UNCHANGED = 'unchanged'
+    STALE = 'stale'
+    FAILED = 'failed'
+
+
+class OutboxEntry:
+
+    def __init__(self, seq: int, subscription_id: str, situation_id: str, serialized: str, attempts: int, next_attempt: float, state: str):
+        self.seq = seq
+        self.subscription_id = subscription_id
+        self.situation_id = situation_id
+        self.serialized = serialized
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+        self.state = state
+
+
+class SituationChanges:
+
+    def __init__(self, epoch: str, sequence: int, situations: dict[str, PublicTransportSituation], removed: list[str], incremental: bool):
+        self.epoch = epoch
+        self.sequence = sequence
+        self.situations = situations
+        self.removed = removed
+        self.incremental = incremental
+
 
 class LocalNodeDatabase:
 
-    def __init__(self, name):
+    _situation_columns = ['serialized', 'version', 'versioned_at', 'participant_ref', 'validity_start', 'validity_end', 'progress', 'severity', 'summary', 'content_hash', 'source']
+
+    def __init__(self, name, situation_cache_size: int = 32 * 1024 * 1024):
         tempdir = "/tmp" if platform.system() == "Darwin" else tempfile.gettempdir()
         self._filename = os.path.join(tempdir, name)
+        self._logger = logging.getLogger('uvicorn')
+
+        # connection is shared by several threads, transactions must not interleave
+        self._lock = RLock()
+
+        # write-through index of all subscriptions, reloaded when another connection changed the subscriptions
+        self._subscriptions = None
+        self._subscriptions_by_subscriber = None
+        self._subscriptions_revision = None
+
+        # parsed situations keyed by their situation_changes sequence, which changes with every write of any connection
+        self._situation_cache = SituationCache(situation_cache_size)
 
         self._connection = sqlite3.connect(self._filename, check_same_thread=False)
         self._connection.row_factory = sqlite3.Row
 
-        # init required tables if not already done
+        # WAL lets the publisher/subscriber thread and the endpoint thread read while the other one writes,
+        # synchronous NORMAL only syncs at checkpoints which is safe in WAL mode
         cursor = self._connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+
+        # init required tables if not already done
         cursor.execute("CREATE TABLE IF NOT EXISTS subscriptions (id TEXT NOT NULL PRIMARY KEY, serialized TEXT NOT NULL)")
+        subscription_columns = self._add_columns(cursor, 'subscriptions', {
+            'termination': 'REAL'
+        })
+        cursor.execute("CREATE INDEX IF NOT EXISTS subscriptions_termination ON subscriptions (termination)")
+
+        if len(subscription_columns) > 0:
+            cursor.execute("SELECT id, serialized FROM subscriptions")
+            cursor.executemany("UPDATE subscriptions SET termination = ? WHERE id = ?", [
+                (self._subscription_termination(Subscription.unserialize(s['serialized'])), s['id']) for s in cursor.fetchall()
+            ])
+
+        # subscriptions stored as XML by earlier versions are converted to the compact codec once
+        cursor.execute("SELECT id, serialized FROM subscriptions WHERE CAST(serialized AS TEXT) LIKE '<%'")
+        cursor.executemany("UPDATE subscriptions SET serialized = ? WHERE id = ?", [
+            (Subscription.serialize(Subscription.unserialize(s['serialized'])), s['id']) for s in cursor.fetchall()
+        ])
         cursor.execute("CREATE TABLE IF NOT EXISTS situations (id TEXT NOT NULL PRIMARY KEY, serialized TEXT NOT NULL)")
+        situation_columns = self._add_columns(cursor, 'situations', {
+            'version': 'INTEGER',
+            'versioned_at': 'REAL',
+            'participant_ref': 'TEXT',
+            'validity_start': 'REAL',
+            'validity_end': 'REAL',
+            'progress': 'TEXT',
+            'severity': 'TEXT',
+            'summary': 'TEXT',
+            'content_hash': 'TEXT',
+            'source': 'TEXT'
+        })
+        cursor.execute("CREATE INDEX IF NOT EXISTS situations_participant_ref ON situations (participant_ref)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situations_validity_start ON situations (validity_start)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situations_validity_end ON situations (validity_end)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situations_progress ON situations (progress)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situations_severity ON situations (severity)")
+
+        # publisher a situation has been received from, the ParticipantRef of a situation may name another participant
+        cursor.execute("CREATE INDEX IF NOT EXISTS situations_source ON situations (source)")
+
+        # affected lines and stop points of each situation, removed together with the situation
+        cursor.execute("CREATE TABLE IF NOT EXISTS situation_lines (situation_id TEXT NOT NULL, line_ref TEXT NOT NULL)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situation_lines_line_ref ON situation_lines (line_ref)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situation_lines_situation_id ON situation_lines (situation_id)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS situation_stop_points (situation_id TEXT NOT NULL, stop_point_ref TEXT NOT NULL)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situation_stop_points_stop_point_ref ON situation_stop_points (stop_point_ref)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situation_stop_points_situation_id ON situation_stop_points (situation_id)")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS situations_delete_refs AFTER DELETE ON situations BEGIN DELETE FROM situation_lines WHERE situation_id = OLD.id; DELETE FROM situation_stop_points WHERE situation_id = OLD.id; END")
+
+        # revision and modification time of the situations and subscriptions tables, maintained for all connections by triggers
+        cursor.execute("CREATE TABLE IF NOT EXISTS revisions (name TEXT NOT NULL PRIMARY KEY, revision INTEGER NOT NULL, modified REAL NOT NULL)")
+        cursor.execute("INSERT OR IGNORE INTO revisions (name, revision, modified) VALUES ('subscriptions', 0, ?)", (time.time(),))
+        for table in ['situations', 'subscriptions']:
+            for operation in ['INSERT', 'UPDATE', 'DELETE']:
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_revision_{operation.lower()} AFTER {operation} ON {table} BEGIN INSERT INTO revisions (name, revision, modified) VALUES ('{table}', 1, (julianday('now') - 2440587.5) * 86400.0) ON CONFLICT (name) DO UPDATE SET revision = revision + 1, modified = excluded.modified; END")
+
+        # change log of the situations table, only the latest change of each situation is kept and
+        # removals remain as tombstones until they're pruned
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'situation_changes'")
+        situation_changes_exist = cursor.fetchone() is not None
+
+        cursor.execute("CREATE TABLE IF NOT EXISTS situation_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, situation_id TEXT NOT NULL UNIQUE, removed INTEGER NOT NULL, changed REAL NOT NULL)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS situation_changes_removed ON situation_changes (removed, changed)")
+        for operation, situation_id, removed in [('INSERT', 'NEW.id', 0), ('UPDATE', 'NEW.id', 0), ('DELETE', 'OLD.id', 1)]:
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS situations_changes_{operation.lower()} AFTER {operation} ON situations BEGIN INSERT OR REPLACE INTO situation_changes (situation_id, removed, changed) VALUES ({situation_id}, {removed}, (julianday('now') - 2440587.5) * 86400.0); END")
+
+        if not situation_changes_exist:
+            cursor.execute("INSERT INTO situation_changes (situation_id, removed, changed) SELECT id, 0, ? FROM situations", (time.time(),))
+
+        # epoch identifies this change log, sequence numbers of another epoch are meaningless
+        cursor.execute("CREATE TABLE IF NOT EXISTS properties (name TEXT NOT NULL PRIMARY KEY, value TEXT NOT NULL)")
+        cursor.execute("INSERT OR IGNORE INTO properties (name, value) VALUES ('situation_changes.epoch', ?)", (uuid.uuid4().hex[:8],))
+        cursor.execute("INSERT OR IGNORE INTO properties (name, value) VALUES ('situation_changes.horizon', '0')")
+
+        # situations stored before the indexed columns existed need to be indexed once, situations stored
+        # with objectify annotations are cleaned once to be streamed as they are
+        if len(situation_columns) > 0:
+            self._reindex_situations(cursor)
+        else:
+            self._reindex_situations(cursor, "CAST(serialized AS TEXT) LIKE '%lxml/objectify/pytype%'")
+
+        cursor.execute("CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, subscription_id TEXT NOT NULL, situation_id TEXT NOT NULL, serialized TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, state TEXT NOT NULL DEFAULT 'pending')")
+        cursor.execute("CREATE INDEX IF NOT EXISTS outbox_subscription_state ON outbox (subscription_id, state, seq)")
+
+        # ResponseMessageIdentifier of recently processed deliveries per producer, used to skip retried deliveries
+        cursor.execute("CREATE TABLE IF NOT EXISTS delivery_messages (producer_ref TEXT NOT NULL, message_id TEXT NOT NULL, received REAL NOT NULL, PRIMARY KEY (producer_ref, message_id)) WITHOUT ROWID")
+        cursor.execute("CREATE INDEX IF NOT EXISTS delivery_messages_received ON delivery_messages (received)")
         self._connection.commit()
 
     def get_subscriptions(self) -> dict[str, Subscription]:
-        cursor = self._connection.cursor()
-        cursor.execute("SELECT * FROM subscriptions")
+        with self._lock:
+            self._load_subscriptions()
 
-        subscriptions = dict()
-        for s in cursor.fetchall():
-            subscription = Subscription.unserialize(s['serialized'])
-            subscriptions[s['id']] = subscription
+            # callers get copies, changing them must not change the index without a write
+            return {subscription_id: copy.copy(subscription) for subscription_id, subscription in self._subscriptions.items()}
+        
+    def get_subscription(self, subscription_id: str) -> Subscription|None:
+        with self._lock:
+            self._load_subscriptions()
+
+            subscription = self._subscriptions.get(subscription_id)
+            return copy.copy(subscription) if subscription is not None else None
+        
+    def get_subscriptions_by_subscriber(self, subscriber_ref: str) -> dict[str, Subscription]:
+        with self._lock:
+            self._load_subscriptions()
 
-        return subscriptions
+            return {subscription_id: copy.copy(subscription) for subscription_id, subscription in self._subscriptions_by_subscriber.get(subscriber_ref, dict()).items()}
 
     def add_subscription(self, subscription_id: str, subscription: Subscription) -> bool:
-        try:
-            serialized = Subscription.serialize(subscription)
-            
-            cursor = self._connection.cursor()
-            cursor.execute("INSERT INTO subscriptions (id, serialized) VALUES (?, ?)", (
-                subscription_id,
-                serialized,
-            ))
-            self._connection.commit()
+        with self._lock:
+            try:
+                serialized = Subscription.serialize(subscription)
+                
+                cursor = self._connection.cursor()
+                cursor.execute("INSERT INTO subscriptions (id, serialized, termination) VALUES (?, ?, ?)", (
+                    subscription_id,
+                    serialized,
+                    self._subscription_termination(subscription),
+                ))
+                self._update_subscriptions_revision(cursor, cursor.rowcount)
+                self._connection.commit()
+
+                self._index_subscription(subscription_id, copy.copy(subscription))
 
-            return True
-        except sqlite3.Error as ex:
-            self._logger.error(ex)
-            return False
+                return True
+            except sqlite3.Error as ex:
+                self._logger.error(ex)
+                return False
         
     def update_subscription(self, subscription_id: str, subscription: Subscription) -> bool:
-        try:
-            serialized = Subscription.serialize(subscription)
-            
-            cursor = self._connection.cursor()
-            cursor.execute("UPDATE subscriptions SET serialized = ? WHERE id = ?", (
-                serialized, 
-                subscription_id
-            ))
-            self._connection.commit()
+        with self._lock:
+            try:
+                serialized = Subscription.serialize(subscription)
+                
+                cursor = self._connection.cursor()
+                cursor.execute("UPDATE subscriptions SET serialized = ?, termination = ? WHERE id = ?", (
+                    serialized, 
+                    self._subscription_termination(subscription),
+                    subscription_id
+                ))
+                updated = cursor.rowcount
+
+                self._update_subscriptions_revision(cursor, updated)
+                self._connection.commit()
+
+                if updated > 0:
+                    self._unindex_subscription(subscription_id)
+                    self._index_subscription(subscription_id, copy.copy(subscription))
 
-            return True
-        except sqlite3.Error as ex:
-            self._logger.error(ex)
-            return False
+                return True
+            except sqlite3.Error as ex:
+                self._logger.error(ex)
+                return False
 
     def remove_subscription(self, subscription_id: str) -> bool:
-        try:
-            cursor = self._connection.cursor()
-            cursor.execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,))
-            self._connection.commit()
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,))
+                self._update_subscriptions_revision(cursor, cursor.rowcount)
 
-            return True
-        except sqlite3.Error as ex:
-            self._logger.error(ex)
-            return False
+                cursor.execute("DELETE FROM outbox WHERE subscription_id = ?", (subscription_id,))
+                self._connection.commit()
 
-    def get_situations(self) -> dict[str, PublicTransportSituation]:
+                self._unindex_subscription(subscription_id)
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
+            
+    def remove_expired_subscriptions(self, now: float = None) -> int:
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("SELECT id FROM subscriptions WHERE termination IS NOT NULL AND termination <= ?", (now,))
+                subscription_ids = [s['id'] for s in cursor.fetchall()]
+
+                cursor.executemany("DELETE FROM subscriptions WHERE id = ?", [(subscription_id,) for subscription_id in subscription_ids])
+                self._update_subscriptions_revision(cursor, cursor.rowcount)
+
+                cursor.executemany("DELETE FROM outbox WHERE subscription_id = ?", [(subscription_id,) for subscription_id in subscription_ids])
+                self._connection.commit()
+
+                for subscription_id in subscription_ids:
+                    self._unindex_subscription(subscription_id)
+
+                return len(subscription_ids)
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return 0
+            
+    def _subscription_termination(self, subscription: Subscription) -> float|None:
+        return subscription.termination.timestamp() if subscription.termination is not None else None
+            
+    def _load_subscriptions(self) -> None:
         cursor = self._connection.cursor()
-        cursor.execute("SELECT * FROM situations")
 
-        subscriptions = dict()
+        # the revision only changes with subscription changes, situations written meanwhile don't invalidate the index
+        revision = self._get_revision(cursor, 'subscriptions')
+        if self._subscriptions is not None and revision == self._subscriptions_revision:
+            return
+        
+        self._subscriptions = dict()
+        self._subscriptions_by_subscriber = dict()
+        self._subscriptions_revision = revision
+
+        cursor.execute("SELECT * FROM subscriptions")
         for s in cursor.fetchall():
-            situation = PublicTransportSituation.unserialize(s['serialized'])
-            subscriptions[s['id']] = situation
+            self._index_subscription(s['id'], Subscription.unserialize(s['serialized']))
+
+    def _update_subscriptions_revision(self, cursor: sqlite3.Cursor, num_changes: int) -> None:
+        # own changes are written through if the index was current before them, otherwise it's reloaded on next access
+        revision = self._get_revision(cursor, 'subscriptions')
+        if self._subscriptions is not None and revision - num_changes != self._subscriptions_revision:
+            self._subscriptions = None
+            self._subscriptions_by_subscriber = None
+
+        self._subscriptions_revision = revision
+
+    def _get_revision(self, cursor: sqlite3.Cursor, name: str) -> int:
+        cursor.execute("SELECT revision FROM revisions WHERE name = ?", (name,))
+
+        revision = cursor.fetchone()
+        return revision['revision'] if revision is not None else 0
+
+    def _index_subscription(self, subscription_id: str, subscription: Subscription) -> None:
+        if self._subscriptions is None:
+            return
+        
+        self._subscriptions[subscription_id] = subscription
+        self._subscriptions_by_subscriber.setdefault(subscription.subscriber, dict())[subscription_id] = subscription
+
+    def _unindex_subscription(self, subscription_id: str) -> None:
+        if self._subscriptions is None:
+            return
+        
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is not None:
+            subscriber_subscriptions = self._subscriptions_by_subscriber.get(subscription.subscriber, dict())
+            subscriber_subscriptions.pop(subscription_id, None)
+
+            if len(subscriber_subscriptions) == 0:
+                self._subscriptions_by_subscriber.pop(subscription.subscriber, None)
+
+    def get_situations(self) -> dict[str, PublicTransportSituation]:
+        with self._lock:
+            cursor = self._connection.cursor()
+            return self._load_situations(cursor, "SELECT id, (SELECT seq FROM situation_changes WHERE situation_id = situations.id) AS seq FROM situations")
+        
+    def query_situations(self, participant_ref: str = None, line_ref: str = None, stop_point_ref: str = None, progress: str = None, severity: str = None, valid_at: datetime.datetime = None) -> dict[str, PublicTransportSituation]:
+        conditions, parameters = self._situation_conditions(participant_ref, line_ref, stop_point_ref, progress, severity, valid_at)
+
+        query = "SELECT id, (SELECT seq FROM situation_changes WHERE situation_id = situations.id) AS seq FROM situations"
+        if len(conditions) > 0:
+            query = query + " WHERE " + " AND ".join(conditions)
+
+        with self._lock:
+            cursor = self._connection.cursor()
+            return self._load_situations(cursor, query, parameters)
+        
+    def query_situation_summaries(self, participant_ref: str = None, line_ref: str = None, stop_point_ref: str = None, progress: str = None, severity: str = None, valid_at: datetime.datetime = None) -> dict[str, SituationSummary]:
+        conditions, parameters = self._situation_conditions(participant_ref, line_ref, stop_point_ref, progress, severity, valid_at)
+
+        # summaries are built from the indexed columns only, the XML remains unparsed
+        query = "SELECT id, serialized, version, versioned_at, participant_ref, validity_start, validity_end, progress, severity, summary, "
+        query = query + "(SELECT group_concat(line_ref, char(31)) FROM situation_lines WHERE situation_id = situations.id) AS line_refs, "
+        query = query + "(SELECT group_concat(stop_point_ref, char(31)) FROM situation_stop_points WHERE situation_id = situations.id) AS stop_point_refs "
+        query = query + "FROM situations"
+        if len(conditions) > 0:
+            query = query + " WHERE " + " AND ".join(conditions)
+
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute(query, parameters)
+
+            rows = cursor.fetchall()
+
+        summaries = dict()
+        for s in rows:
+            summaries[s['id']] = SituationSummary(
+                s['id'],
+                s['serialized'],
+                s['version'],
+                self._datetime(s['versioned_at']),
+                s['participant_ref'],
+                self._datetime(s['validity_start']),
+                self._datetime(s['validity_end']),
+                s['progress'],
+                s['severity'],
+                s['summary'],
+                s['line_refs'].split(chr(31)) if s['line_refs'] is not None else list(),
+                s['stop_point_refs'].split(chr(31)) if s['stop_point_refs'] is not None else list()
+            )
+
+        return summaries
+    
+    def _situation_conditions(self, participant_ref: str, line_ref: str, stop_point_ref: str, progress: str, severity: str, valid_at: datetime.datetime) -> tuple[list[str], list]:
+        conditions = list()
+        parameters = list()
+
+        if participant_ref is not None:
+            conditions.append("participant_ref = ?")
+            parameters.append(participant_ref)
 
-        return subscriptions
+        if line_ref is not None:
+            conditions.append("id IN (SELECT situation_id FROM situation_lines WHERE line_ref = ?)")
+            parameters.append(line_ref)
+
+        if stop_point_ref is not None:
+            conditions.append("id IN (SELECT situation_id FROM situation_stop_points WHERE stop_point_ref = ?)")
+            parameters.append(stop_point_ref)
+
+        if progress is not None:
+            conditions.append("progress = ?")
+            parameters.append(progress)
+
+        if severity is not None:
+            conditions.append("severity = ?")
+            parameters.append(severity)
+
+        if valid_at is not None:
+            conditions.append("(validity_start IS NULL OR validity_start <= ?) AND (validity_end IS NULL OR validity_end > ?)")
+            parameters.extend([valid_at.timestamp(), valid_at.timestamp()])
+
+        return conditions, parameters
+    
+    def _datetime(self, value: float|None) -> datetime.datetime|None:
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc) if value is not None else None
     
     def add_situation(self, situation_id, situation: PublicTransportSituation) -> bool:
-        try:
-            serialized = PublicTransportSituation.serialize(situation)
-            
-            cursor = self._connection.cursor()
-            cursor.execute("INSERT INTO situations (id, serialized) VALUES (?, ?)", (
-                situation_id,
-                serialized,
-            ))
-            self._connection.commit()
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                self._insert_situations(cursor, [self._situation_row(situation_id, situation)])
+                self._connection.commit()
 
-            return True
-        except sqlite3.Error as ex:
-            self._logger.error(ex)
-            return False
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
         
     def update_situation(self, situation_id, situation: PublicTransportSituation) -> bool:
-        try:
-            serialized = PublicTransportSituation.serialize(situation)
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                self._update_situations(cursor, [self._situation_row(situation_id, situation)])
+                self._connection.commit()
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
+
+    def remove_situation(self, situation_id) -> bool:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("DELETE FROM situations WHERE id = ?", (situation_id,))
+                self._connection.commit()
+
+                self._situation_cache.remove(situation_id)
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
+            
+    def add_situations(self, situations: dict[str, PublicTransportSituation]) -> bool:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                self._insert_situations(cursor, [self._situation_row(situation_id, situation) for situation_id, situation in situations.items()])
+                self._connection.commit()
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
+            
+    def upsert_situation(self, situation_id, situation: PublicTransportSituation, deduplicate: bool = True) -> UpsertOutcome:
+        return self.upsert_situations({situation_id: situation}, deduplicate)[situation_id]
+            
+    def upsert_situations(self, situations: dict[str, PublicTransportSituation], deduplicate: bool = True) -> dict[str, UpsertOutcome]:
+        return self.upsert_situation_rows(self.situation_rows(situations), deduplicate)
+    
+    def situation_rows(self, situations: dict[str, PublicTransportSituation], source: str = None) -> dict[str, dict]:
+        # rows can be prepared without the database lock, e.g. by the thread which parsed the situations
+        return {situation_id: self._situation_row(situation_id, situation, source) for situation_id, situation in situations.items()}
+
+    def upsert_situation_rows(self, rows: dict[str, dict], deduplicate: bool = True, delivery_messages: list[tuple[str, str, float]] = None) -> dict[str, UpsertOutcome]:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+
+                stored = dict()
+                situation_ids = list(rows.keys())
+                for n in range(0, len(situation_ids), 500):
+                    chunk = situation_ids[n:n + 500]
+
+                    cursor.execute(f"SELECT id, version, versioned_at, serialized, content_hash FROM situations WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                    for s in cursor.fetchall():
+                        stored[s['id']] = s
+
+                # compare each situation to the stored copy and only write newer ones
+                outcomes = dict()
+                inserts = list()
+                updates = list()
+                for situation_id, row in rows.items():
+                    if situation_id in stored:
+                        outcome = self._compare_situation_version(stored[situation_id], row, deduplicate)
+                    else:
+                        outcome = UpsertOutcome.INSERTED
+                    
+                    if outcome == UpsertOutcome.INSERTED:
+                        inserts.append(row)
+                    elif outcome == UpsertOutcome.UPDATED:
+                        updates.append(row)
+
+                    outcomes[situation_id] = outcome
+
+                self._insert_situations(cursor, inserts)
+                self._update_situations(cursor, updates)
+
+                # processed deliveries are recorded in the same transaction as their situations
+                if delivery_messages is not None:
+                    cursor.executemany("INSERT OR REPLACE INTO delivery_messages (producer_ref, message_id, received) VALUES (?, ?, ?)", delivery_messages)
+
+                self._connection.commit()
+
+                return outcomes
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return {situation_id: UpsertOutcome.FAILED for situation_id in rows.keys()}
+            
+    def remove_situations(self, situation_ids: list[str]) -> bool:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.executemany("DELETE FROM situations WHERE id = ?", [(situation_id,) for situation_id in situation_ids])
+                self._connection.commit()
+
+                for situation_id in situation_ids:
+                    self._situation_cache.remove(situation_id)
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
             
+    def remove_source_situations(self, source: str, situation_ids: set[str], until_sequence: int) -> list[str]|None:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+
+                # situations of the source missing in its full snapshot are gone, situations changed after
+                # the snapshot has been requested are kept
+                cursor.execute("SELECT id FROM situations WHERE source = ? AND id IN (SELECT situation_id FROM situation_changes WHERE seq <= ?)", (source, until_sequence))
+                removed = [s['id'] for s in cursor.fetchall() if s['id'] not in situation_ids]
+
+                cursor.executemany("DELETE FROM situations WHERE id = ?", [(situation_id,) for situation_id in removed])
+                self._connection.commit()
+
+                for situation_id in removed:
+                    self._situation_cache.remove(situation_id)
+
+                return removed
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return None
+
+    def get_situations_revision(self) -> tuple[int, float|None]:
+        with self._lock:
             cursor = self._connection.cursor()
-            cursor.execute("UPDATE situations SET serialized = ? WHERE id = ?", (
-                serialized, 
-                situation_id,
-            ))
-            self._connection.commit()
+            cursor.execute("SELECT revision, modified FROM revisions WHERE name = 'situations'")
+
+            revision = cursor.fetchone()
+            if revision is None:
+                return 0, None
+            
+            return revision['revision'], revision['modified']
 
-            return True
-        except sqlite3.Error as ex:
-            self._logger.error(ex)
-            return False
+    def iter_situations(self, start_after: str = None, limit: int = None, chunk_size: int = 500) -> Iterator[tuple[str, bytes]]:
+        num_situations = 0
+        last_situation_id = start_after if start_after is not None else ''
 
-    def remove_situation(self, situation_id) -> bool:
+        # keyset pagination in chunks keeps memory flat and doesn't hold the lock while the caller consumes rows
+        while limit is None or num_situations < limit:
+            num_rows = chunk_size if limit is None else min(chunk_size, limit - num_situations)
+
+            with self._lock:
+                cursor = self._connection.cursor()
+                cursor.execute("SELECT id, serialized FROM situations WHERE id > ? ORDER BY id LIMIT ?", (last_situation_id, num_rows))
+
+                rows = cursor.fetchall()
+
+            for s in rows:
+                yield s['id'], s['serialized']
+
+            num_situations = num_situations + len(rows)
+            if len(rows) < num_rows:
+                break
+
+            last_situation_id = rows[-1]['id']
+
+    def count_situations(self, start_after: str = None) -> int:
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT COUNT(*) AS num FROM situations WHERE id > ?", (start_after if start_after is not None else '',))
+
+            return cursor.fetchone()['num']
+        
+    def get_situation_changes_sequence(self) -> tuple[str, int]:
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT value FROM properties WHERE name = 'situation_changes.epoch'")
+            epoch = cursor.fetchone()['value']
+
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'situation_changes'")
+            sequence = cursor.fetchone()
+
+            return epoch, sequence['seq'] if sequence is not None else 0
+
+    def get_situation_changes(self, epoch: str = None, since: int = None) -> SituationChanges:
+        with self._lock:
+            cursor = self._connection.cursor()
+
+            # read the change log and the situations in one snapshot
+            cursor.execute("BEGIN")
+            try:
+                cursor.execute("SELECT name, value FROM properties WHERE name LIKE 'situation_changes.%'")
+                properties = {p['name']: p['value'] for p in cursor.fetchall()}
+
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'situation_changes'")
+                sequence = cursor.fetchone()
+                sequence = sequence['seq'] if sequence is not None else 0
+
+                # changes are only complete when nothing after the requested sequence number has been pruned yet
+                incremental = epoch == properties['situation_changes.epoch'] and since is not None and int(properties['situation_changes.horizon']) <= since <= sequence
+
+                situations = dict()
+                removed = list()
+                if incremental:
+                    cursor.execute("SELECT c.situation_id, c.removed, s.serialized FROM situation_changes c LEFT JOIN situations s ON s.id = c.situation_id WHERE c.seq > ? ORDER BY c.seq", (since,))
+                    for c in cursor.fetchall():
+                        if c['removed'] == 1 or c['serialized'] is None:
+                            removed.append(c['situation_id'])
+                        else:
+                            situations[c['situation_id']] = PublicTransportSituation.unserialize(c['serialized'])
+                else:
+                    cursor.execute("SELECT id, serialized FROM situations")
+                    for s in cursor.fetchall():
+                        situations[s['id']] = PublicTransportSituation.unserialize(s['serialized'])
+            finally:
+                self._connection.commit()
+
+            return SituationChanges(properties['situation_changes.epoch'], sequence, situations, removed, incremental)
+        
+    def remove_situation_tombstones(self, before: float) -> int:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("SELECT MAX(seq) AS seq FROM situation_changes WHERE removed = 1 AND changed <= ?", (before,))
+
+                horizon = cursor.fetchone()['seq']
+                if horizon is None:
+                    return 0
+
+                # requests for changes before the pruned tombstones are answered with a full snapshot
+                cursor.execute("DELETE FROM situation_changes WHERE removed = 1 AND seq <= ?", (horizon,))
+                removed = cursor.rowcount
+
+                cursor.execute("UPDATE properties SET value = MAX(CAST(value AS INTEGER), ?) WHERE name = 'situation_changes.horizon'", (horizon,))
+                self._connection.commit()
+
+                return removed
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return 0
+
+    def get_delivery_messages(self, since: float) -> list[tuple[str, str, float]]:
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT producer_ref, message_id, received FROM delivery_messages WHERE received >= ? ORDER BY received", (since,))
+
+            return [(m['producer_ref'], m['message_id'], m['received']) for m in cursor.fetchall()]
+        
+    def remove_delivery_messages(self, before: float) -> int:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("DELETE FROM delivery_messages WHERE received < ?", (before,))
+                self._connection.commit()
+
+                return cursor.rowcount
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return 0
+
+    def remove_expired_situations(self, now: float = None) -> int:
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("DELETE FROM situations WHERE validity_end IS NOT NULL AND validity_end <= ?", (now,))
+                self._connection.commit()
+
+                return cursor.rowcount
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return 0
+            
+    def _situation_row(self, situation_id: str, situation: PublicTransportSituation, source: str = None) -> dict:
         try:
+            version = int(situation.findtext('{*}Version'))
+        except (TypeError, ValueError):
+            version = None
+
+        versioned_at = parse_timestamp(situation.findtext('{*}VersionedAtTime'))
+
+        # validity is the envelope of all validity periods, a period without end time means open-ended
+        validity_start = None
+        validity_end = None
+        validity_open_ended = False
+        for validity_period in situation.iterfind('{*}ValidityPeriod'):
+            start_time = parse_timestamp(validity_period.findtext('{*}StartTime'))
+            if start_time is not None and (validity_start is None or start_time < validity_start):
+                validity_start = start_time
+
+            end_time = parse_timestamp(validity_period.findtext('{*}EndTime'))
+            if end_time is None:
+                validity_open_ended = True
+            elif validity_end is None or end_time > validity_end:
+                validity_end = end_time
+
+        if validity_open_ended:
+            validity_end = None
+
+        line_refs = set()
+        stop_point_refs = set()
+        for affects in situation.iter('{*}Affects'):
+            line_refs.update(e.text for e in affects.iter('{*}LineRef') if e.text is not None)
+            stop_point_refs.update(e.text for e in affects.iter('{*}StopPointRef') if e.text is not None)
+
+        return {
+            'id': situation_id,
+            'serialized': PublicTransportSituation.serialize(PublicTransportSituation.clean(situation)),
+            'version': version,
+            'versioned_at': versioned_at.timestamp() if versioned_at is not None else None,
+            'participant_ref': situation.findtext('{*}ParticipantRef'),
+            'validity_start': validity_start.timestamp() if validity_start is not None else None,
+            'validity_end': validity_end.timestamp() if validity_end is not None else None,
+            'progress': situation.findtext('{*}Progress'),
+            'severity': situation.findtext('{*}Severity'),
+            'summary': situation.findtext('{*}Summary'),
+            'content_hash': PublicTransportSituation.content_hash(situation),
+            'source': source,
+            'line_refs': line_refs,
+            'stop_point_refs': stop_point_refs
+        }
+    
+    def _insert_situations(self, cursor: sqlite3.Cursor, rows: list[dict]) -> None:
+        cursor.executemany(f"INSERT INTO situations (id, {', '.join(self._situation_columns)}) VALUES (:id, {', '.join(':' + c for c in self._situation_columns)})", rows)
+        self._insert_situation_refs(cursor, rows)
+
+    def _update_situations(self, cursor: sqlite3.Cursor, rows: list[dict]) -> None:
+        cursor.executemany(f"UPDATE situations SET {', '.join(c + ' = :' + c for c in self._situation_columns)} WHERE id = :id", rows)
+
+        cursor.executemany("DELETE FROM situation_lines WHERE situation_id = ?", [(r['id'],) for r in rows])
+        cursor.executemany("DELETE FROM situation_stop_points WHERE situation_id = ?", [(r['id'],) for r in rows])
+        self._insert_situation_refs(cursor, rows)
+
+    def _insert_situation_refs(self, cursor: sqlite3.Cursor, rows: list[dict]) -> None:
+        cursor.executemany("INSERT INTO situation_lines (situation_id, line_ref) VALUES (?, ?)", [(r['id'], l) for r in rows for l in r['line_refs']])
+        cursor.executemany("INSERT INTO situation_stop_points (situation_id, stop_point_ref) VALUES (?, ?)", [(r['id'], s) for r in rows for s in r['stop_point_refs']])
+
+    def _reindex_situations(self, cursor: sqlite3.Cursor, condition: str = None) -> None:
+        cursor.execute("SELECT id, serialized, source FROM situations" + (f" WHERE {condition}" if condition is not None else ""))
+        rows = [self._situation_row(s['id'], PublicTransportSituation.unserialize(s['serialized']), s['source']) for s in cursor.fetchall()]
+
+        self._update_situations(cursor, rows)
+    
+    def _compare_situation_version(self, stored: sqlite3.Row, current: dict, deduplicate: bool = True) -> UpsertOutcome:
+        outcome = self._order_situation_versions(stored, current)
+
+        # newer situations with identical content apart from volatile timestamps aren't written again
+        if outcome == UpsertOutcome.UPDATED and deduplicate and stored['content_hash'] is not None and stored['content_hash'] == current['content_hash']:
+            return UpsertOutcome.UNCHANGED
+        
+        return outcome
+    
+    def _order_situation_versions(self, stored: sqlite3.Row, current: dict) -> UpsertOutcome:
+        stored_version, stored_versioned_at, stored_serialized = stored['version'], stored['versioned_at'], stored['serialized']
+        version, versioned_at, serialized = current['version'], current['versioned_at'], current['serialized']
+
+        if version is not None and stored_version is not None and version != stored_version:
+            return UpsertOutcome.UPDATED if version > stored_version else UpsertOutcome.STALE
+        
+        if versioned_at is not None and stored_versioned_at is not None and versioned_at != stored_versioned_at:
+            return UpsertOutcome.UPDATED if versioned_at > stored_versioned_at else UpsertOutcome.STALE
+        
+        # same version and timestamp means same situation, otherwise only identical content is unchanged
+        if version is not None and versioned_at is not None and stored_version is not None and stored_versioned_at is not None:
+            return UpsertOutcome.UNCHANGED
+        
+        if bytes(serialized) == bytes(stored_serialized):
+            return UpsertOutcome.UNCHANGED
+        
+        return UpsertOutcome.UPDATED
+    
+    def _add_columns(self, cursor: sqlite3.Cursor, table: str, columns: dict[str, str]) -> list[str]:
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing_columns = [c['name'] for c in cursor.fetchall()]
+
+        added_columns = list()
+        for column, definition in columns.items():
+            if column not in existing_columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                added_columns.append(column)
+
+        return added_columns
+
+    def get_outbox_subscription_ids(self, due: float = None) -> list[str]:
+        due = due if due is not None else time.time()
+
+        with self._lock:
             cursor = self._connection.cursor()
-            cursor.execute("DELETE FROM situations WHERE id = ?", (situation_id,))
-            self._connection.commit()
+            cursor.execute("SELECT DISTINCT subscription_id FROM outbox WHERE state = 'pending' AND next_attempt <= ?", (due,))
 
-            return True
-        except sqlite3.Error as ex:
-            self._logger.error(ex)
-            return False
+            return [o['subscription_id'] for o in cursor.fetchall()]
         
-    def close(self, remove=False) -> None:
-        self._connection.close()
+    def has_outbox_entries(self, subscription_id: str) -> bool:
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT 1 FROM outbox WHERE subscription_id = ? AND state = 'pending' LIMIT 1", (subscription_id,))
 
-        if remove == True:
+            return cursor.fetchone() is not None
+    
+    def get_outbox_entries(self, subscription_id: str, state: str = 'pending') -> list[OutboxEntry]:
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT * FROM outbox WHERE subscription_id = ? AND state = ? ORDER BY seq", (subscription_id, state))
+
+            return [OutboxEntry(o['seq'], o['subscription_id'], o['situation_id'], o['serialized'], o['attempts'], o['next_attempt'], o['state']) for o in cursor.fetchall()]
+        
+    def add_outbox_entries(self, subscription_id: str, situations: list[tuple[str, str]], next_attempt: float = None) -> bool:
+        next_attempt = next_attempt if next_attempt is not None else time.time()
+
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.executemany("INSERT INTO outbox (subscription_id, situation_id, serialized, next_attempt) VALUES (?, ?, ?, ?)", [
+                    (subscription_id, situation_id, serialized, next_attempt) for situation_id, serialized in situations
+                ])
+                self._connection.commit()
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
+            
+    def update_outbox_entries(self, entries: list[OutboxEntry]) -> bool:
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.executemany("UPDATE outbox SET attempts = ?, next_attempt = ?, state = ? WHERE seq = ?", [
+                    (e.attempts, e.next_attempt, e.state, e.seq) for e in entries
+                ])
+                self._connection.commit()
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
+                self._logger.error(ex)
+                return False
+            
+    def remove_outbox_entries(self, entries: list[OutboxEntry]) -> bool:
+        with self._lock:
             try:
-                os.remove(self._filename)
-            except PermissionError as ex:
+                cursor = self._connection.cursor()
+                cursor.executemany("DELETE FROM outbox WHERE seq = ?", [(e.seq,) for e in entries])
+                self._connection.commit()
+
+                return True
+            except sqlite3.Error as ex:
+                self._connection.rollback()
                 self._logger.error(ex)
+                return False
+        
+    def set_synchronous(self, synchronous: str) -> None:
+        if synchronous not in ['OFF', 'NORMAL', 'FULL', 'EXTRA']:
+            raise ValueError(f"Unsupported synchronous mode {synchronous}")
+
+        with self._lock:
+            self._connection.execute(f"PRAGMA synchronous={synchronous}")
+
+    def situation_cache_stats(self) -> CacheStats:
+        return self._situation_cache.stats()
+
+    def _load_situations(self, cursor: sqlite3.Cursor, query: str, parameters: list = None) -> dict[str, PublicTransportSituation]:
+        cursor.execute(query, parameters if parameters is not None else list())
+
+        # cached situations are shared between callers and must not be modified in place
+        situations = dict()
+        misses = dict()
+        for s in cursor.fetchall():
+            situation = self._situation_cache.get(s['id'], s['seq']) if s['seq'] is not None else None
+            if situation is not None:
+                situations[s['id']] = situation
+            else:
+                situations[s['id']] = None
+                misses[s['id']] = s['seq']
+
+        # only situations missing in the cache are read and parsed, in chunks to stay below the variable limit
+        miss_ids = list(misses.keys())
+        for n in range(0, len(miss_ids), 500):
+            chunk = miss_ids[n:n + 500]
+            cursor.execute(f"SELECT id, serialized FROM situations WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+
+            for s in cursor.fetchall():
+                situation = PublicTransportSituation.unserialize(s['serialized'])
+                situations[s['id']] = situation
+
+                if misses[s['id']] is not None:
+                    self._situation_cache.put(s['id'], misses[s['id']], situation, len(s['serialized']))
+
+        # situations deleted by another connection in between are dropped
+        return {k: v for k, v in situations.items() if v is not None}
+
+    def close(self, remove=False) -> None:
+        with self._lock:
+            self._situation_cache.clear()
+            self._connection.close()
+
+        if remove == True:
+            for filename in [self._filename, f"{self._filename}-wal", f"{self._filename}-shm"]:
+                try:
+                    if os.path.exists(filename):
+                        os.remove(filename)
+                except PermissionError as ex:
+                    self._logger.error(ex)
 
 
-def local_node_database(name: str) -> LocalNodeDatabase:
+def local_node_database(name: str, situation_cache_size: int = 32 * 1024 * 1024) -> LocalNodeDatabase:
     if not name.endswith('.db3'):
         name = name + '.db3'
 
-    return LocalNodeDatabase(name)
\ No newline at end of file
+    return LocalNodeDatabase(name, situation_cache_size)
\ No newline at end of file
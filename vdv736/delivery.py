@@ -1,14 +1,24 @@
+import copy
+import logging
+import re
 import uuid
 
 from abc import ABC
+from typing import Iterable
+from typing import Iterator
 from lxml.etree import cleanup_namespaces
+from lxml.etree import QName
+from lxml.etree import XMLPullParser
 from lxml.etree import tostring
 from lxml.objectify import deannotate
 from lxml.objectify import fromstring
 from lxml.objectify import Element
+from lxml.objectify import ObjectifyElementClassLookup
+from xml.sax.saxutils import escape
 
 from .isotime import timestamp
 from .model import Subscription
+from .sirixml import get_value as sirixml_get_value
 
 
 class SiriDelivery(ABC):
@@ -16,11 +26,11 @@ class SiriDelivery(ABC):
     def __init__(self):
         self.Siri = Element('Siri', xmlns='http://www.siri.org.uk/siri', version='2.1')
 
-    def xml(self) -> str:
+    def xml(self, pretty_print: bool = True) -> str:
         deannotate(self.Siri)
         cleanup_namespaces(self.Siri)
 
-        return tostring(self.Siri, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+        return tostring(self.Siri, pretty_print=pretty_print, xml_declaration=True, encoding='UTF-8')
     
 
 class ServiceDelivery(SiriDelivery):
@@ -38,8 +48,8 @@ class ServiceDelivery(SiriDelivery):
 
 class SituationExchangeDelivery(ServiceDelivery):
 
-    def __init__(self, producer_ref: str, subscription: Subscription):
-        super().__init__(producer_ref)
+    def __init__(self, producer_ref: str, subscription: Subscription, more_data=False):
+        super().__init__(producer_ref, more_data)
 
         self.Siri.ServiceDelivery.SituationExchangeDelivery = Element('SituationExchangeDelivery', version='2.1')
         self.Siri.ServiceDelivery.SituationExchangeDelivery.ResponseTimestamp = timestamp()
@@ -53,6 +63,212 @@ class SituationExchangeDelivery(ServiceDelivery):
     def add_situation(self, situation):
         self.Siri.ServiceDelivery.SituationExchangeDelivery.Situations.append(situation)
 
+    def set_changes(self, epoch: str, sequence: int, incremental: bool, removed: list[str] = None):
+        self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions = Element('Extensions')
+        self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges = Element('SituationChanges')
+        self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.Epoch = epoch
+        self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.SequenceNumber = sequence
+        self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.Incremental = incremental
+
+        # tombstones of situations removed since the requested sequence number
+        if removed is not None and len(removed) > 0:
+            self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.RemovedSituations = Element('RemovedSituations')
+            for situation_id in removed:
+                self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.RemovedSituations.append(Element('SituationNumber'))
+                self.Siri.ServiceDelivery.SituationExchangeDelivery.Extensions.SituationChanges.RemovedSituations.SituationNumber[-1] = situation_id
+
+
+class RenderedDelivery(SiriDelivery):
+
+    def __init__(self, xml: bytes):
+        self._xml = xml
+
+    def xml(self, pretty_print: bool = True) -> bytes:
+        # formatting has been chosen when the delivery was rendered
+        return self._xml
+
+
+class SituationExchangeDeliveryTemplate():
+
+    _placeholder = f"vdv736-placeholder-{uuid.uuid4().hex}"
+    _placeholder_pattern = re.compile(f"{_placeholder}-([A-Za-z]+)".encode('utf-8'))
+
+    def __init__(self, producer_ref: str, more_data=False, pretty_print: bool = True):
+        self._producer_ref = producer_ref
+        self._more_data = more_data
+        self._pretty_print = pretty_print
+
+        self._situations = list()
+        self._changes = None
+        self._segments = dict()
+
+    def add_situation(self, situation):
+        self._situations.append(copy.deepcopy(situation))
+        self._segments.clear()
+
+    def set_changes(self, epoch: str, sequence: int, incremental: bool, removed: list[str] = None):
+        self._changes = (epoch, sequence, incremental, removed)
+        self._segments.clear()
+
+    def render(self, subscription: Subscription|None) -> RenderedDelivery:
+        return RenderedDelivery(b''.join(self._render(self._compile(subscription is not None), subscription, None)))
+    
+    def render_stream(self, subscription: Subscription|None, situations: Iterable[bytes]) -> Iterator[bytes]:
+        return self._render(self._compile(subscription is not None, True), subscription, situations)
+
+    def _render(self, segments: list, subscription: Subscription|None, situations: Iterable[bytes]|None) -> Iterator[bytes]:
+        values = {
+            'ResponseTimestamp': timestamp(),
+            'ResponseMessageIdentifier': str(uuid.uuid4())
+        }
+
+        if subscription is not None:
+            values['SubscriberRef'] = subscription.subscriber
+            values['SubscriptionRef'] = subscription.id
+
+        # odd segments are placeholder names, even segments are static XML
+        for index, segment in enumerate(segments):
+            if index % 2 == 0:
+                yield segment
+            elif segment == 'Situations':
+                # situations are stored without annotations and streamed as they are
+                yield from situations
+            else:
+                yield escape(str(values[segment])).encode('utf-8')
+
+    def _compile(self, with_subscription: bool, streaming: bool = False) -> list:
+        if (with_subscription, streaming) not in self._segments:
+            placeholder_subscription = None
+            if with_subscription:
+                placeholder_subscription = Subscription()
+                placeholder_subscription.subscriber = f"{self._placeholder}-SubscriberRef"
+                placeholder_subscription.id = f"{self._placeholder}-SubscriptionRef"
+
+            delivery = SituationExchangeDelivery(self._producer_ref, placeholder_subscription, self._more_data)
+            delivery.Siri.ServiceDelivery.ResponseTimestamp = f"{self._placeholder}-ResponseTimestamp"
+            delivery.Siri.ServiceDelivery.ResponseMessageIdentifier = f"{self._placeholder}-ResponseMessageIdentifier"
+            delivery.Siri.ServiceDelivery.SituationExchangeDelivery.ResponseTimestamp = f"{self._placeholder}-ResponseTimestamp"
+
+            for situation in self._situations:
+                delivery.add_situation(situation)
+
+            # streamed situations are written in place of the Situations text
+            if streaming:
+                delivery.Siri.ServiceDelivery.SituationExchangeDelivery.Situations = f"{self._placeholder}-Situations"
+
+            if self._changes is not None:
+                delivery.set_changes(*self._changes)
+
+            segments = self._placeholder_pattern.split(delivery.xml(self._pretty_print))
+            self._segments[(with_subscription, streaming)] = [s.decode('utf-8') if i % 2 == 1 else s for i, s in enumerate(segments)]
+
+        return self._segments[(with_subscription, streaming)]
+
+
+class SituationExchangeDeliveryReader():
+
+    _values = ['ProducerRef', 'ResponseMessageIdentifier', 'MoreData', 'SubscriberRef', 'SubscriptionRef', 'Epoch', 'SequenceNumber', 'Incremental']
+
+    def __init__(self, batch_size: int = 500):
+        self._batch_size = batch_size
+        self._logger = logging.getLogger('uvicorn')
+
+        self._parser = XMLPullParser(events=('start', 'end'))
+        self._parser.set_element_class_lookup(ObjectifyElementClassLookup())
+
+        self._batch = dict()
+        self._situation_depth = 0
+
+        self.values = dict()
+        self.removed = list()
+        self.num_situations = 0
+        self.last_situation_id = None
+
+        # values like ProducerRef, ResponseMessageIdentifier and SubscriberRef are known before any situation is parsed
+        self.header_complete = False
+
+    @property
+    def more_data(self) -> bool:
+        return self.values.get('MoreData', 'false').strip() in ['true', '1']
+    
+    @property
+    def incremental(self) -> bool|None:
+        # None if the delivery doesn't carry SituationChanges at all
+        incremental = self.values.get('Incremental')
+        return incremental.strip() in ['true', '1'] if incremental is not None else None
+    
+    @property
+    def sequence(self) -> int|None:
+        try:
+            return int(self.values.get('SequenceNumber'))
+        except (TypeError, ValueError):
+            return None
+
+    def read(self, chunks: Iterable[bytes]) -> Iterator[dict]:
+        for chunk in chunks:
+            yield from self.feed(chunk)
+
+        yield from self.close()
+
+    def feed(self, chunk: bytes) -> Iterator[dict]:
+        self._parser.feed(chunk)
+        yield from self._process()
+
+    def close(self) -> Iterator[dict]:
+        self._parser.close()
+        yield from self._process()
+
+        if len(self._batch) > 0:
+            yield from self._flush()
+
+    def _process(self) -> Iterator[dict]:
+        for event, element in self._parser.read_events():
+            name = QName(element).localname
+
+            # values preceding the situations are complete once they start, or at the end of a delivery without any
+            if event == 'start' and name in ['Situations', 'PtSituationElement'] or event == 'end' and name == 'SituationExchangeDelivery':
+                self.header_complete = True
+
+            if name == 'PtSituationElement':
+                self._situation_depth = self._situation_depth + (1 if event == 'start' else -1)
+                if event == 'end' and self._situation_depth == 0:
+                    situation_id = sirixml_get_value(element, 'SituationNumber')
+
+                    # situations without identifier can't be stored, they're skipped instead of failing the whole batch
+                    if situation_id in [None, '']:
+                        self._logger.warning(f"Skipped PtSituationElement without SituationNumber in delivery {self.values.get('ResponseMessageIdentifier')}")
+                        self._drop(element)
+                        continue
+
+                    self._batch[situation_id] = element
+                    self.num_situations = self.num_situations + 1
+                    self.last_situation_id = situation_id
+
+                    if len(self._batch) >= self._batch_size:
+                        yield from self._flush()
+            elif event == 'end' and self._situation_depth == 0:
+                if name == 'SituationNumber' and QName(element.getparent()).localname == 'RemovedSituations':
+                    self.removed.append(element.text)
+                elif name in self._values and name not in self.values:
+                    self.values[name] = element.text
+
+    def _flush(self) -> Iterator[dict]:
+        batch = self._batch
+        self._batch = dict()
+
+        yield batch
+
+        # stored situations aren't needed anymore, drop them from the tree to keep memory constant
+        for element in batch.values():
+            self._drop(element)
+
+    def _drop(self, element) -> None:
+        element.clear()
+
+        parent = element.getparent()
+        if parent is not None:
+            parent.remove(element)
+
 
 def xml2siri_delivery(xml: str) -> SiriDelivery:
     request = SiriDelivery()
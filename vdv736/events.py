@@ -0,0 +1,198 @@
+import asyncio
+import logging
+
+from .database import UpsertOutcome
+from .model import PublicTransportSituation
+
+from collections import deque
+from enum import Enum
+from threading import Lock
+from typing import Callable
+
+
+class SituationEventType(Enum):
+    ADDED = 'added'
+    UPDATED = 'updated'
+    CLOSED = 'closed'
+    REMOVED = 'removed'
+
+
+class OverflowPolicy(Enum):
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    CLOSE = 'close'
+
+
+class SituationEvent():
+
+    def __init__(self, event_type: SituationEventType, situation_id: str, situation: PublicTransportSituation|None):
+        self.type = event_type
+        self.situation_id = situation_id
+        self.situation = situation
+
+
+class EventStreamOverflow(Exception):
+    pass
+
+
+class EventStream():
+
+    def __init__(self, dispatcher, max_size: int, overflow: OverflowPolicy):
+        # events are emitted by other threads, the queue itself is only touched by the consumer's event loop
+        self._loop = asyncio.get_running_loop()
+        self._dispatcher = dispatcher
+
+        self._queue = deque()
+        self._max_size = max_size
+        self._overflow = overflow
+        self._waiter = None
+
+        self._closed = False
+        self._overflowed = False
+
+        self.dropped = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> SituationEvent:
+        while len(self._queue) == 0:
+            if self._overflowed:
+                raise EventStreamOverflow(f"Event stream closed after {self._max_size} unconsumed events")
+            elif self._closed:
+                raise StopAsyncIteration
+
+            self._waiter = self._loop.create_future()
+            await self._waiter
+
+        return self._queue.popleft()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, exception_traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._dispatcher._remove_stream(self)
+
+        try:
+            self._loop.call_soon_threadsafe(self._close)
+        except RuntimeError:
+            # event loop is already closed
+            self._closed = True
+
+    def _emit(self, events: list[SituationEvent]) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._put, events)
+        except RuntimeError:
+            self._dispatcher._remove_stream(self)
+
+    def _put(self, events: list[SituationEvent]) -> None:
+        if self._closed:
+            return
+
+        for event in events:
+            if len(self._queue) >= self._max_size:
+                if self._overflow == OverflowPolicy.DROP_OLDEST:
+                    self._queue.popleft()
+                elif self._overflow == OverflowPolicy.DROP_NEWEST:
+                    self.dropped = self.dropped + 1
+                    continue
+                else:
+                    # consumer fell behind and has to re-read the store, queued events are still delivered
+                    self._dispatcher._remove_stream(self)
+                    self._overflowed = True
+                    self._closed = True
+                    break
+
+                self.dropped = self.dropped + 1
+
+            self._queue.append(event)
+
+        self._wake()
+
+    def _close(self) -> None:
+        self._closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class EventDispatcher():
+
+    def __init__(self):
+        self._logger = logging.getLogger('uvicorn')
+
+        self._listeners = list()
+        self._streams = list()
+        self._lock = Lock()
+
+    @property
+    def active(self) -> bool:
+        return len(self._listeners) > 0 or len(self._streams) > 0
+
+    def add_listener(self, callback: Callable[[SituationEvent], None]) -> None:
+        with self._lock:
+            self._listeners = self._listeners + [callback]
+
+    def remove_listener(self, callback: Callable[[SituationEvent], None]) -> None:
+        with self._lock:
+            self._listeners = [l for l in self._listeners if l != callback]
+
+    def stream(self, max_size: int = 1000, overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> EventStream:
+        stream = EventStream(self, max_size, overflow)
+
+        with self._lock:
+            self._streams = self._streams + [stream]
+
+        return stream
+
+    def emit_outcomes(self, rows: dict[str, dict], outcomes: dict[str, UpsertOutcome]) -> None:
+        if not self.active:
+            return
+
+        events = list()
+        for situation_id, outcome in outcomes.items():
+            if outcome not in [UpsertOutcome.INSERTED, UpsertOutcome.UPDATED]:
+                continue
+
+            if rows[situation_id]['progress'] == 'closed':
+                event_type = SituationEventType.CLOSED
+            elif outcome == UpsertOutcome.INSERTED:
+                event_type = SituationEventType.ADDED
+            else:
+                event_type = SituationEventType.UPDATED
+
+            # events get their own copy parsed from the stored row, incoming elements may belong to another thread's parser
+            situation = PublicTransportSituation.unserialize(rows[situation_id]['serialized'])
+            events.append(SituationEvent(event_type, situation_id, situation))
+
+        self.emit(events)
+
+    def emit_removed(self, situation_ids: list[str]) -> None:
+        if not self.active:
+            return
+
+        self.emit([SituationEvent(SituationEventType.REMOVED, situation_id, None) for situation_id in situation_ids])
+
+    def emit(self, events: list[SituationEvent]) -> None:
+        if len(events) == 0:
+            return
+
+        # callbacks are invoked in the thread which stored the situations and must return quickly
+        for callback in self._listeners:
+            for event in events:
+                try:
+                    callback(event)
+                except Exception as ex:
+                    self._logger.exception(ex)
+
+        for stream in self._streams:
+            stream._emit(events)
+
+    def _remove_stream(self, stream: EventStream) -> None:
+        with self._lock:
+            self._streams = [s for s in self._streams if s is not stream]
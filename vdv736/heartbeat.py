@@ -0,0 +1,115 @@
+import logging
+import random
+import time
+
+from .model import Subscription
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+
+class HeartbeatMonitor():
+
+    def __init__(self, subscriber, default_interval: float = 60.0, jitter: float = 0.1, max_concurrency: int = 8, renewal_margin: float = 3600.0):
+        self._subscriber = subscriber
+        self._local_node_database = subscriber._local_node_database
+        self._logger = logging.getLogger('uvicorn')
+
+        # subscriptions are checked at the ShortestPossibleCycle of their publisher, default_interval if none is advertised
+        self._default_interval = default_interval
+        self._jitter = jitter
+        self._max_concurrency = max_concurrency
+
+        # subscriptions are renewed this many seconds before their termination time
+        self._renewal_margin = renewal_margin
+
+        # next check per subscription, subscriptions currently being checked are not scheduled
+        self._due = dict()
+        self._in_flight = set()
+
+        self._lock = Lock()
+        self._executor = None
+        self._thread = None
+        self._stop = Event()
+
+    def start(self) -> None:
+        self._stop.clear()
+
+        # checks run in a pool, a slow publisher occupies one worker but never delays the schedule
+        self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix='heartbeat')
+
+        self._thread = Thread(target=self._run, args=(), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(1)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def tick(self, now: float = None) -> float:
+        now = now if now is not None else time.time()
+        subscriptions = self._local_node_database.get_subscriptions()
+
+        with self._lock:
+            for subscription_id in [s for s in self._due.keys() if s not in subscriptions]:
+                del self._due[subscription_id]
+
+            # new subscriptions are checked first after one cycle
+            for subscription_id, subscription in subscriptions.items():
+                if subscription_id not in self._due and subscription_id not in self._in_flight:
+                    self._due[subscription_id] = self._next_check(subscription, now)
+
+            for subscription_id in [s for s, due in self._due.items() if due <= now]:
+                del self._due[subscription_id]
+                self._in_flight.add(subscription_id)
+
+                self._executor.submit(self._check, subscriptions[subscription_id])
+
+            # seconds until the next check is due
+            return min(self._due.values(), default=now + self._default_interval) - now
+
+    def _next_check(self, subscription: Subscription, now: float) -> float:
+        due = now + self._interval(subscription)
+
+        # the check renewing a subscription is brought forward, a failed renewal is retried after the next cycle
+        if subscription.termination is not None:
+            renewal = subscription.termination.timestamp() - self._renewal_margin
+            if renewal > now:
+                due = min(due, renewal)
+
+        return due
+
+    def _interval(self, subscription: Subscription) -> float:
+        interval = subscription.shortest_possible_cycle if subscription.shortest_possible_cycle is not None else self._default_interval
+        return interval * (1.0 + random.uniform(-self._jitter, self._jitter))
+
+    def _check(self, subscription: Subscription) -> None:
+        subscription_id = subscription.id
+
+        try:
+            self._subscriber._check_subscription(subscription_id)
+        except Exception as ex:
+            self._logger.exception(ex)
+        finally:
+            # reschedule with the cycle which may have been updated by the response
+            subscription = self._local_node_database.get_subscription(subscription_id)
+
+            with self._lock:
+                self._in_flight.discard(subscription_id)
+                if subscription is not None:
+                    self._due[subscription_id] = self._next_check(subscription, time.time())
+
+    def _run(self) -> None:
+        timeout = 0.0
+        while not self._stop.wait(max(min(timeout, 1.0), 0.0)):
+            try:
+                timeout = self.tick()
+            except Exception as ex:
+                self._logger.exception(ex)
+                timeout = 1.0
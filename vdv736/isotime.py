@@ -1,4 +1,5 @@
 import datetime
+import re
 
 def timestamp(additional_seconds=0) -> str:
     ts = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
@@ -8,6 +9,20 @@ def timestamp(additional_seconds=0) -> str:
     
     return ts.isoformat()
 
+def parse_timestamp(value: str) -> datetime.datetime|None:
+    if value is None or value == '':
+        return None
+    
+    try:
+        ts = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+
+    return ts
+
 def interval(years: int, months: int, days: int, hours: int, minutes: int, seconds: int) -> str:
     result = 'P'
 
@@ -33,3 +48,16 @@ def interval(years: int, months: int, days: int, hours: int, minutes: int, secon
 
     return result
 
+
+def parse_interval(value: str) -> float|None:
+    if value is None:
+        return None
+    
+    # years and months are approximated, publishers advertise cycles in minutes or seconds anyway
+    match = re.fullmatch(r'P(?:(\d+)Y)?(?:(\d+)M)?(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?', value.strip())
+    if match is None:
+        return None
+    
+    years, months, weeks, days, hours, minutes, seconds = [float(v) if v is not None else 0.0 for v in match.groups()]
+
+    return (((years * 365 + months * 30 + weeks * 7 + days) * 24 + hours) * 60 + minutes) * 60 + seconds
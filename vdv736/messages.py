@@ -0,0 +1,51 @@
+import time
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class ReceivedMessages():
+
+    def __init__(self, window: float = 3600.0, max_per_producer: int = 10000):
+        # message identifiers are remembered for window seconds, but never more than max_per_producer per producer
+        self._window = window
+        self._max_per_producer = max_per_producer
+
+        self._messages = dict()
+        self._lock = Lock()
+
+    def load(self, messages: list[tuple[str, str, float]]) -> None:
+        with self._lock:
+            for producer_ref, message_id, received in messages:
+                self._add(producer_ref, message_id, received)
+
+    def contains(self, producer_ref: str|None, message_id: str|None, now: float = None) -> bool:
+        if producer_ref is None or message_id is None:
+            return False
+
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            received = self._messages.get(producer_ref, dict()).get(message_id)
+            return received is not None and received >= now - self._window
+
+    def add(self, producer_ref: str|None, message_id: str|None, now: float = None) -> tuple[str, str, float]|None:
+        if producer_ref is None or message_id is None:
+            return None
+
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            self._add(producer_ref, message_id, now)
+
+        return (producer_ref, message_id, now)
+
+    def _add(self, producer_ref: str, message_id: str, received: float) -> None:
+        messages = self._messages.setdefault(producer_ref, OrderedDict())
+
+        messages[message_id] = received
+        messages.move_to_end(message_id)
+
+        # identifiers are ordered by reception, expired and surplus ones are dropped from the front
+        while len(messages) > self._max_per_producer or next(iter(messages.values())) < received - self._window:
+            messages.popitem(last=False)
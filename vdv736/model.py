@@ -1,55 +1,82 @@
+import copy
+import datetime
+import hashlib
+import json
+
 from typing import Any
 from lxml.etree import tostring
+from lxml.objectify import deannotate
 from lxml.objectify import fromstring
-from lxml.objectify import Element
 from lxml.objectify import ObjectifiedElement
 
+from .isotime import parse_timestamp
+
 
 class Subscription:
 
+    __slots__ = (
+        'id', 
+        'host', 
+        'port', 
+        'protocol', 
+        'subscriber', 
+        'termination', 
+        'remote_service_participant_ref', 
+        'remote_service_startup_time', 
+        'status_endpoint', 
+        'subscribe_endpoint', 
+        'unsubscribe_endpoint',
+        'shortest_possible_cycle'
+    )
+
     @classmethod
-    def create(cls, id: str, host: str, port: int, protocol: str, subscriber: str, termination: str):
+    def create(cls, id: str, host: str, port: int, protocol: str, subscriber: str, termination: str|datetime.datetime):
 
         obj = cls()
         obj.id = id
         obj.host = host
-        obj.port = port
+        obj.port = int(port) if port is not None else None
         obj.protocol = protocol
         obj.subscriber = subscriber
-        obj.termination = termination
+        obj.termination = termination if isinstance(termination, datetime.datetime) or termination is None else parse_timestamp(termination)
 
         return obj
 
     @classmethod
     def serialize(cls, obj) -> str:
-        element = Element('subscription')
-        element.id = obj.id
-        element.host = obj.host
-        element.port = obj.port
-        element.protocol = obj.protocol
-        element.subscriber = obj.subscriber
-        element.termination = obj.termination
-
-        element.remote_service_participant_ref = obj.remote_service_participant_ref
-        element.remote_service_startup_time = obj.remote_service_startup_time
-
-        element.status_endpoint = obj.status_endpoint
-        element.subscribe_endpoint = obj.subscribe_endpoint
-        element.unsubscribe_endpoint = obj.unsubscribe_endpoint
-
-        return tostring(element)
+        # compact JSON array in slot order, new fields must be appended
+        values = [getattr(obj, name) for name in cls.__slots__]
+        values[cls.__slots__.index('termination')] = obj.termination.isoformat() if obj.termination is not None else None
+
+        return json.dumps(values, separators=(',', ':'))
     
     @classmethod
-    def unserialize(cls, xml: str):
+    def unserialize(cls, data: str|bytes):
+        if data[:1] in ['<', b'<']:
+            return cls._unserialize_xml(data)
+        
+        values = json.loads(data)
+
+        obj = cls()
+        for name, value in zip(cls.__slots__, values):
+            setattr(obj, name, value)
+
+        obj.termination = parse_timestamp(obj.termination)
+
+        return obj
+    
+    @classmethod
+    def _unserialize_xml(cls, xml: str|bytes):
+        # subscriptions stored by earlier versions as objectify XML
         element = fromstring(xml)
 
         obj = cls()
         obj.id = element.id.text
         obj.host = element.host.text
-        obj.port = element.port.text
+        obj.port = int(element.port.text) if element.port.text is not None else None
         obj.protocol = element.protocol.text
         obj.subscriber = element.subscriber.text
-        obj.termination = element.termination.text
+        obj.termination = parse_timestamp(element.termination.text)
 
         obj.remote_service_participant_ref = element.remote_service_participant_ref.text
         obj.remote_service_startup_time = element.remote_service_startup_time.text
@@ -61,22 +88,28 @@ class Subscription:
         return obj
     
     def __init__(self):
-        self.id = None
-        self.host = None
-        self.port = None
-        self.protocol = None
-        self.subscriber = None
-        self.termination = None
+        self.id: str = None
+        self.host: str = None
+        self.port: int = None
+        self.protocol: str = None
+        self.subscriber: str = None
+        self.termination: datetime.datetime = None
+
+        self.remote_service_participant_ref: str = None
+        self.remote_service_startup_time: str = None
 
-        self.remote_service_participant_ref = None
-        self.remote_service_startup_time = None
+        self.status_endpoint: str = '/status'
+        self.subscribe_endpoint: str = '/subscribe'
+        self.unsubscribe_endpoint: str = '/unsubscribe'
 
-        self.status_endpoint = '/status'
-        self.subscribe_endpoint = '/subscribe'
-        self.unsubscribe_endpoint = '/unsubscribe'
+        # seconds between status checks as advertised by the remote server
+        self.shortest_possible_cycle: float = None
 
 
 class PublicTransportSituation(ObjectifiedElement):
+
+    # timestamps which upstream systems refresh on every publication without changing the situation
+    _volatile_elements = ['CreationTime', 'VersionedAtTime', 'RecordedAtTime']
     
     @classmethod
     def create(cls, id: str):
@@ -97,6 +130,25 @@ class PublicTransportSituation(ObjectifiedElement):
         obj = fromstring(xml)
         return obj
     
+    @classmethod
+    def clean(cls, obj):
+        # copy without objectify annotations, as it's stored and streamed
+        element = copy.deepcopy(obj)
+        element.tail = None
+
+        deannotate(element, cleanup_namespaces=True)
+
+        return element
+    
+    @classmethod
+    def content_hash(cls, obj) -> str:
+        element = cls.clean(obj)
+        for name in cls._volatile_elements:
+            for volatile_element in list(element.iter(f"{{*}}{name}")):
+                volatile_element.getparent().remove(volatile_element)
+
+        return hashlib.sha256(tostring(element, method='c14n2', strip_text=True)).hexdigest()
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -104,7 +156,52 @@ class PublicTransportSituation(ObjectifiedElement):
         return self.equals(other)
 
     def __copy__(self):
-        return PublicTransportSituation(super().__copy__())
+        return super().__copy__()
 
     def __deepcopy__(self, memo=None):
-        return PublicTransportSituation(super().__deepcopy__(memo))
\ No newline at end of file
+        return super().__deepcopy__(memo)
+
+class SituationSummary:
+
+    __slots__ = (
+        'id', 
+        'version', 
+        'versioned_at', 
+        'participant_ref', 
+        'validity_start', 
+        'validity_end', 
+        'progress', 
+        'severity', 
+        'summary', 
+        'line_refs', 
+        'stop_point_refs', 
+        '_serialized', 
+        '_situation'
+    )
+
+    def __init__(self, id: str, serialized: bytes, version: int = None, versioned_at: datetime.datetime = None, participant_ref: str = None, validity_start: datetime.datetime = None, validity_end: datetime.datetime = None, progress: str = None, severity: str = None, summary: str = None, line_refs: list[str] = None, stop_point_refs: list[str] = None):
+        self.id = id
+        self.version = version
+        self.versioned_at = versioned_at
+        self.participant_ref = participant_ref
+        self.validity_start = validity_start
+        self.validity_end = validity_end
+        self.progress = progress
+        self.severity = severity
+        self.summary = summary
+        self.line_refs = line_refs if line_refs is not None else list()
+        self.stop_point_refs = stop_point_refs if stop_point_refs is not None else list()
+
+        # raw XML is only parsed when the full situation is requested
+        self._serialized = serialized
+        self._situation = None
+
+    @property
+    def serialized(self) -> bytes:
+        return self._serialized
+
+    def situation(self) -> PublicTransportSituation:
+        if self._situation is None:
+            self._situation = PublicTransportSituation.unserialize(self._serialized)
+
+        return self._situation
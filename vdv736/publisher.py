@@ -1,38 +1,144 @@
+import hashlib
 import logging
-import requests
+import random
 import time
+import uuid
 import uvicorn
 import yaml
 
+from .compression import decompress
+from .isotime import parse_timestamp
 from .isotime import timestamp
 from .database import local_node_database
+from .database import OutboxEntry
+from .database import UpsertOutcome
 from .delivery import ServiceDelivery
 from .delivery import SituationExchangeDelivery
+from .delivery import SituationExchangeDeliveryTemplate
 from .model import PublicTransportSituation
 from .model import Subscription
 from .request import xml2siri_request
+from .request import CheckStatusRequest
 from .response import xml2siri_response
 from .response import SiriResponse
 from .response import CheckStatusResponse
 from .response import SubscriptionResponse
 from .response import TerminateSubscriptionResponse
+from .sirixml import get_bool as sirixml_get_bool
 from .sirixml import get_elements as sirixml_get_elements
+from .sirixml import get_int as sirixml_get_int
 from .sirixml import get_value as sirixml_get_value
+from .sweeper import ExpirySweeper
+from .transport import HttpTransport
+from .transport import TransportStats
 
 from fastapi import FastAPI
 from fastapi import APIRouter
 from fastapi import Request
 from fastapi import Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from email.utils import formatdate
+from threading import Event
+from threading import Lock
 from threading import Thread
+from threading import Timer
+
+
+class DeliveryResult():
+
+    def __init__(self, subscription_id: str, subscriber_ref: str, success: bool, latency: float, queued: bool = False):
+        self.subscription_id = subscription_id
+        self.subscriber_ref = subscriber_ref
+        self.success = success
+        self.latency = latency
+        self.queued = queued
+
+
+class PublishResult():
+
+    def __init__(self, situation_ids: list[str]):
+        self.situation_ids = situation_ids
+        self.outcomes = dict()
+        self.deliveries = dict()
+
+    @property
+    def success(self) -> bool:
+        return all(d.success for d in self.deliveries.values())
+    
+    @property
+    def latency(self) -> float:
+        return max([d.latency for d in self.deliveries.values()], default=0.0)
+
+
+class PublishStats():
+
+    def __init__(self, published: int, deduplicated: int, stale: int, failed: int):
+        self.published = published
+        self.deduplicated = deduplicated
+        self.stale = stale
+        self.failed = failed
 
 
 class Publisher():
 
-    def __init__(self, participant_ref: str, participant_config_filename: str):
+    def __init__(self, participant_ref: str, participant_config_filename: str, max_concurrent_deliveries: int = 16, delivery_timeout: float = 10.0, transport: HttpTransport = None, coalesce_window: float = None, coalesce_max_count: int = 100, coalesce_max_bytes: int = 1024 * 1024, outbox_interval: float = 1.0, outbox_backoff: float = 5.0, outbox_max_backoff: float = 600.0, outbox_max_attempts: int = 10, sweep_interval: float = 60.0, request_streaming: bool = False, request_max_situations: int = None, pretty_print: bool = True, compression_threshold: int = 1024, compression_level: int = 6, deduplicate: bool = True, remove_database: bool = False):
         self._service_participant_ref = participant_ref
         self._logger = logging.getLogger('uvicorn')
 
+        # situations republished with identical content are neither stored nor sent again
+        self._deduplicate = deduplicate
+
+        self._publish_outcomes = {outcome: 0 for outcome in UpsertOutcome}
+        self._publish_outcomes_lock = Lock()
+
+        # pretty-printed XML is easier to debug, compact XML is smaller
+        self._pretty_print = pretty_print
+
+        # payloads above the threshold are compressed for participants configured with a content_encoding and for clients accepting gzip
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+
+        # /request responses can be streamed and split into pages of a maximum number of situations
+        if request_max_situations is not None and not request_streaming:
+            raise ValueError("request_max_situations requires request_streaming")
+
+        self._request_streaming = request_streaming
+        self._request_max_situations = request_max_situations
+
+        # the database holds the outbox and the change log epoch, it's only removed on exit if requested
         self._local_node_database = local_node_database('vdv736.publisher')
+        self._remove_database = remove_database
+
+        self._expiry_sweeper = ExpirySweeper(self._local_node_database, sweep_interval)
+
+        # bounded worker pool for delivering to all subscribers concurrently
+        self._delivery_timeout = delivery_timeout
+        self._delivery_executor = ThreadPoolExecutor(max_workers=max_concurrent_deliveries, thread_name_prefix='vdv736.delivery')
+
+        # optional coalescing of situations published within a short window into one delivery per subscriber
+        self._coalesce_window = coalesce_window
+        self._coalesce_max_count = coalesce_max_count
+        self._coalesce_max_bytes = coalesce_max_bytes
+
+        self._coalesce_buffer = list()
+        self._coalesce_buffer_size = 0
+        self._coalesce_timer = None
+        self._coalesce_lock = Lock()
+        self._flush_lock = Lock()
+
+        # failed deliveries are kept in a persistent outbox and retried with exponential backoff
+        self._outbox_interval = outbox_interval
+        self._outbox_backoff = outbox_backoff
+        self._outbox_max_backoff = outbox_max_backoff
+        self._outbox_max_attempts = outbox_max_attempts
+
+        self._outbox_thread = None
+        self._outbox_stop = Event()
+
+        self._participant_config = dict()
 
         try:
             with open(participant_config_filename) as participant_config_file:
@@ -40,39 +146,268 @@ class Publisher():
         except Exception as ex:
             self._logger.error(ex)
 
+        self._transport = transport if transport is not None else HttpTransport(self._participant_config, pool_size=max_concurrent_deliveries, compression_threshold=compression_threshold, compression_level=compression_level)
+
     def __enter__(self):
         self._endpoint_thread = Thread(target=self._run_endpoint, args=(), daemon=True)
         self._endpoint_thread.start()
 
+        self._expiry_sweeper.start()
+
+        self._outbox_thread = Thread(target=self._run_outbox, args=(), daemon=True)
+        self._outbox_thread.start()
+
         return self
 
     def __exit__(self, exception_type, exception_value, exception_traceback) -> None:
+        self.flush()
+
+        if self._outbox_thread is not None:
+            self._outbox_stop.set()
+            self._outbox_thread.join(1)
+
+        if self._expiry_sweeper is not None:
+            self._expiry_sweeper.stop()
+
         if self._endpoint is not None:
             self._endpoint.terminate()
         
         if self._endpoint_thread is not None:
             self._endpoint_thread.join(1)
 
+        if self._delivery_executor is not None:
+            self._delivery_executor.shutdown(wait=False, cancel_futures=True)
+
+        if self._transport is not None:
+            self._transport.close()
+
         if self._local_node_database is not None:
-            self._local_node_database.close(True)
+            self._local_node_database.close(self._remove_database)
     
-    def publish_situation(self, situation: PublicTransportSituation) -> None:
+    def publish_situation(self, situation: PublicTransportSituation) -> PublishResult|None:
         situation_id = sirixml_get_value(situation, 'SituationNumber')
-        self._local_node_database.add_situation(situation_id, situation)
+        outcome = self._local_node_database.upsert_situation(situation_id, situation, self._deduplicate)
+
+        with self._publish_outcomes_lock:
+            self._publish_outcomes[outcome] = self._publish_outcomes[outcome] + 1
+
+        # situations which are not newer than the stored copy are not sent to any subscriber again
+        if outcome not in [UpsertOutcome.INSERTED, UpsertOutcome.UPDATED]:
+            self._logger.info(f"Skipped delivery of situation {situation_id}, outcome {outcome.value}")
+
+            result = PublishResult([situation_id])
+            result.outcomes[situation_id] = outcome
+
+            return result
+
+        if self._coalesce_window is None:
+            return self._publish([situation])
+
+        # buffer situation until the coalescing window elapses or the buffer limits are reached
+        with self._coalesce_lock:
+            self._coalesce_buffer.append(situation)
+            self._coalesce_buffer_size = self._coalesce_buffer_size + len(PublicTransportSituation.serialize(situation))
+
+            flush_required = len(self._coalesce_buffer) >= self._coalesce_max_count or self._coalesce_buffer_size >= self._coalesce_max_bytes
+            if not flush_required and self._coalesce_timer is None:
+                self._coalesce_timer = Timer(self._coalesce_window, self.flush)
+                self._coalesce_timer.daemon = True
+                self._coalesce_timer.start()
+
+        if flush_required:
+            return self.flush()
+        
+        return None
+    
+    def flush(self) -> PublishResult|None:
+        with self._flush_lock:
+            with self._coalesce_lock:
+                if self._coalesce_timer is not None:
+                    self._coalesce_timer.cancel()
+                    self._coalesce_timer = None
+
+                situations = self._coalesce_buffer
+
+                self._coalesce_buffer = list()
+                self._coalesce_buffer_size = 0
+
+            if len(situations) == 0:
+                return None
+
+            return self._publish(situations)
+
+    def _publish(self, situations: list[PublicTransportSituation]) -> PublishResult:
+        result = PublishResult([sirixml_get_value(situation, 'SituationNumber') for situation in situations])
         
+        # render each batch once and only splice in subscription specific values per delivery, 
+        # all but the last delivery are marked with MoreData
+        items = [(situation, sirixml_get_value(situation, 'SituationNumber'), PublicTransportSituation.serialize(situation)) for situation in situations]
+        batches = self._create_batches(items, [len(serialized) for _, _, serialized in items])
+
+        templates = list()
+        for index, batch in enumerate(batches):
+            template = SituationExchangeDeliveryTemplate(self._service_participant_ref, more_data=index < len(batches) - 1, pretty_print=self._pretty_print)
+            for situation, _, _ in batch:
+                template.add_situation(situation)
+
+            templates.append(template)
+
+        futures = list()
         for _, subscription in self._local_node_database.get_subscriptions().items():
-            delivery = SituationExchangeDelivery(self._service_participant_ref, subscription)
-            delivery.add_situation(situation)
 
+            # queue behind pending outbox entries to keep the delivery order per subscription
+            if self._local_node_database.has_outbox_entries(subscription.id):
+                self._local_node_database.add_outbox_entries(subscription.id, [(situation_id, serialized) for _, situation_id, serialized in items])
+                result.deliveries[subscription.id] = DeliveryResult(subscription.id, subscription.subscriber, False, 0.0, True)
+
+                continue
+
+            deliveries = [template.render(subscription) for template in templates]
+
+            futures.append(self._delivery_executor.submit(self._deliver, subscription, deliveries, batches))
+
+        wait(futures)
+        for future in futures:
+            delivery_result = future.result()
+            result.deliveries[delivery_result.subscription_id] = delivery_result
+
+        return result
+    
+    def _create_batches(self, items: list, sizes: list[int]) -> list[list]:
+        batches = list()
+
+        batch = list()
+        batch_size = 0
+        for item, item_size in zip(items, sizes):
+            if len(batch) > 0 and batch_size + item_size > self._coalesce_max_bytes:
+                batches.append(batch)
+
+                batch = list()
+                batch_size = 0
+
+            batch.append(item)
+            batch_size = batch_size + item_size
+
+        batches.append(batch)
+
+        return batches
+
+    def _deliver(self, subscription: Subscription, deliveries: list[ServiceDelivery], batches: list[list[tuple]]) -> DeliveryResult:
+        start = time.perf_counter()
+
+        # send deliveries of one subscription in order and stop at the first failure
+        failed_index = None
+        for index, delivery in enumerate(deliveries):
             response = self._send_delivery(subscription, delivery)
+            if not sirixml_get_bool(response, 'Siri.DataReceivedAcknowledgement.Status', False):
+                failed_index = index
+                break
+
+        latency = time.perf_counter() - start
+
+        if failed_index is None:
+            self._logger.info(f"Sent {len(deliveries)} delivery(s) for subscription {subscription.id} to {subscription.subscriber} successfully in {latency:.3f}s")
+            return DeliveryResult(subscription.id, subscription.subscriber, True, latency)
+        else:
+            self._logger.error(f"Failed to send delivery for subscription {subscription.id} to {subscription.subscriber} after {latency:.3f}s, queued for retry")
 
-            if sirixml_get_value(response, 'Siri.DataReceivedAcknowledgement.Status', False):
-                self._logger.info(f"Sent delivery for subscription {subscription.id} to {subscription.subscriber} successfully")
+            # keep all situations which were not delivered in the outbox of this subscription
+            undelivered = [(situation_id, serialized) for batch in batches[failed_index:] for _, situation_id, serialized in batch]
+            queued = self._local_node_database.add_outbox_entries(subscription.id, undelivered, time.time() + self._outbox_backoff_delay(1))
+
+            return DeliveryResult(subscription.id, subscription.subscriber, False, latency, queued)
+        
+    def _run_outbox(self) -> None:
+        while not self._outbox_stop.wait(self._outbox_interval):
+            try:
+                futures = list()
+                for subscription_id in self._local_node_database.get_outbox_subscription_ids():
+                    subscription = self._local_node_database.get_subscription(subscription_id)
+                    if subscription is not None:
+                        futures.append(self._delivery_executor.submit(self._drain_outbox, subscription))
+
+                wait(futures)
+            except Exception as ex:
+                self._logger.exception(ex)
+
+    def _drain_outbox(self, subscription: Subscription) -> None:
+        entries = self._local_node_database.get_outbox_entries(subscription.id)
+        if len(entries) == 0:
+            return
+        
+        if not self._check_subscriber_status(subscription):
+            self._defer_outbox_entries(entries)
+            return
+        
+        # deliver queued situations in their original order and stop at the first failure
+        batches = self._create_batches(entries, [len(e.serialized) for e in entries])
+        for index, batch in enumerate(batches):
+            template = SituationExchangeDeliveryTemplate(self._service_participant_ref, more_data=index < len(batches) - 1, pretty_print=self._pretty_print)
+            for entry in batch:
+                template.add_situation(PublicTransportSituation.unserialize(entry.serialized))
+
+            response = self._send_delivery(subscription, template.render(subscription))
+            if sirixml_get_bool(response, 'Siri.DataReceivedAcknowledgement.Status', False):
+                self._local_node_database.remove_outbox_entries(batch)
+                self._logger.info(f"Sent {len(batch)} queued situation(s) for subscription {subscription.id} to {subscription.subscriber} successfully")
+            else:
+                self._defer_outbox_entries([entry for batch in batches[index:] for entry in batch])
+                return
+
+    def _defer_outbox_entries(self, entries: list[OutboxEntry]) -> None:
+        now = time.time()
+        for entry in entries:
+            entry.attempts = entry.attempts + 1
+            
+            if entry.attempts >= self._outbox_max_attempts:
+                entry.state = 'dead'
+                self._logger.error(f"Giving up delivery of situation {entry.situation_id} for subscription {entry.subscription_id} after {entry.attempts} attempts")
             else:
-                self._logger.error(f"Failed to send delivery for subscription {subscription.id} to {subscription.subscriber}")
+                entry.next_attempt = now + self._outbox_backoff_delay(entry.attempts)
+
+        self._local_node_database.update_outbox_entries(entries)
+
+    def _outbox_backoff_delay(self, attempts: int) -> float:
+        delay = min(self._outbox_max_backoff, self._outbox_backoff * 2 ** (attempts - 1))
+
+        # add jitter to avoid all subscriptions of a recovered subscriber being retried at once
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _check_subscriber_status(self, subscription: Subscription) -> bool:
+        status_endpoint = self._participant_config.get(subscription.subscriber, dict()).get('status_endpoint')
+        
+        # without a status endpoint, the next delivery attempt is the health check itself
+        if status_endpoint is None:
+            return True
+        
+        try:
+            headers = {
+                "Content-Type": "application/xml"
+            }
+
+            request = CheckStatusRequest(self._service_participant_ref)
+            response_xml = self._transport.post(subscription.subscriber, status_endpoint, request.xml(self._pretty_print), headers, timeout=self._delivery_timeout)
+            response = xml2siri_response(response_xml.content)
+
+            return sirixml_get_bool(response, 'Siri.CheckStatusResponse.Status', False)
+        except Exception as ex:
+            self._logger.error(ex)
+            return False
+
+    def transport_stats(self) -> dict[str, TransportStats]:
+        return self._transport.stats()
+    
+    def publish_stats(self) -> PublishStats:
+        with self._publish_outcomes_lock:
+            return PublishStats(
+                self._publish_outcomes[UpsertOutcome.INSERTED] + self._publish_outcomes[UpsertOutcome.UPDATED],
+                self._publish_outcomes[UpsertOutcome.UNCHANGED],
+                self._publish_outcomes[UpsertOutcome.STALE],
+                self._publish_outcomes[UpsertOutcome.FAILED]
+            )
 
     def _run_endpoint(self) -> None:
-        self._endpoint = PublisherEndpoint(self._service_participant_ref)
+        self._endpoint = PublisherEndpoint(self._service_participant_ref, self._request_streaming, self._request_max_situations, self._pretty_print, self._compression_threshold, self._compression_level)
 
         # disable uvicorn logs
         logging.getLogger('uvicorn.error').handlers = []
@@ -92,19 +427,13 @@ class Publisher():
 
     def _send_delivery(self, subscription: Subscription, siri_delivery: ServiceDelivery) -> SiriResponse|None:
         try:
-            subscription_host = self._participant_config[subscription.subscriber]['host']
-            subscription_port = self._participant_config[subscription.subscriber]['port']
-            subscription_protocol = self._participant_config[subscription.subscriber]['protocol']
-            
-            if isinstance(siri_delivery, SituationExchangeDelivery):
-                delivery_endpoint = self._participant_config[subscription.subscriber]['delivery_endpoint']
-                endpoint = f"{subscription_protocol}://{subscription_host}:{subscription_port}/{delivery_endpoint}"
+            endpoint = self._participant_config[subscription.subscriber]['delivery_endpoint']
 
             headers = {
                 "Content-Type": "application/xml"
             }
             
-            response_xml = requests.post(endpoint, headers=headers, data=siri_delivery.xml())
+            response_xml = self._transport.post(subscription.subscriber, endpoint, siri_delivery.xml(self._pretty_print), headers, timeout=self._delivery_timeout)
             response = xml2siri_response(response_xml.content)
 
             return response
@@ -116,16 +445,31 @@ class Publisher():
 
 class PublisherEndpoint():
 
-    def __init__(self, participant_ref: str):
+    def __init__(self, participant_ref: str, request_streaming: bool = False, request_max_situations: int = None, pretty_print: bool = True, compression_threshold: int = 1024, compression_level: int = 6):
         self._service_participant_ref = participant_ref
         self._service_startup_time = timestamp()
         self._logger = logging.getLogger('uvicorn')
 
+        # only streamed responses are split into pages
+        if request_max_situations is not None and not request_streaming:
+            raise ValueError("request_max_situations requires request_streaming")
+
+        self._request_streaming = request_streaming
+        self._request_max_situations = request_max_situations
+
+        self._pretty_print = pretty_print
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+
         self._router = APIRouter()
         self._endpoint = FastAPI()
 
         self._local_node_database = local_node_database('vdv736.publisher')
 
+        # rendered /request snapshot, rebuilt only when the situations revision changed
+        self._request_cache = None
+        self._request_etag_prefix = uuid.uuid4().hex[:8]
+
     def create_endpoint(self, participant_ref: str, status_endpoint='/status', subscribe_endpoint='/subscribe', unsubscribe_endpoint='/unsubscribe', request_endpoint='/request') -> FastAPI:
         self._participant_ref = participant_ref
 
@@ -135,6 +479,7 @@ class PublisherEndpoint():
         self._router.add_api_route(request_endpoint, self._request, methods=['POST'])
         
         self._endpoint.include_router(self._router)
+        self._endpoint.add_middleware(GZipMiddleware, minimum_size=self._compression_threshold, compresslevel=self._compression_level)
 
         return self._endpoint
     
@@ -142,30 +487,36 @@ class PublisherEndpoint():
         self._local_node_database.close()
     
     async def _status(self, req: Request) -> Response:
-        request = xml2siri_request(await req.body())
+        request = xml2siri_request(decompress(await req.body(), req.headers.get('Content-Encoding')))
 
         # simply respond with current status
         response = CheckStatusResponse(self._service_startup_time)
-        return Response(content=response.xml(), media_type='application/xml')
+        return Response(content=response.xml(self._pretty_print), media_type='application/xml')
 
     async def _subscribe(self, req: Request) -> Response:
-        request = xml2siri_request(await req.body())
+        request = xml2siri_request(decompress(await req.body(), req.headers.get('Content-Encoding')))
 
         # add subscription parameters to subscription index
-        subscription_id = sirixml_get_value(request, 'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SubscriptionIdentifier')
-        subscription_termination = sirixml_get_value(request, 'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.InitialTerminationTime')
+        subscription_request = sirixml_get_elements(request, 'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest')
+
+        subscription_id = sirixml_get_value(subscription_request, 'SubscriptionIdentifier')
+        subscription_termination = sirixml_get_value(subscription_request, 'InitialTerminationTime')
 
         subscription = Subscription.create(
             subscription_id,
             None,
             None,
             None,
-            sirixml_get_value(request, 'Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SubscriberRef'),
+            sirixml_get_value(subscription_request, 'SubscriberRef'),
             subscription_termination
         )
             
         try:
-            result = self._local_node_database.add_subscription(subscription_id, subscription)
+            # a subscriber renews a subscription by sending a new request with the same identifier
+            if self._local_node_database.get_subscription(subscription_id) is not None:
+                result = self._local_node_database.update_subscription(subscription_id, subscription)
+            else:
+                result = self._local_node_database.add_subscription(subscription_id, subscription)
 
             # respond with SubscriptionResponse OK
             response = SubscriptionResponse(self._participant_ref, self._service_startup_time)
@@ -175,7 +526,7 @@ class PublisherEndpoint():
             else:
                 response.error(subscription_id)
 
-            return Response(content=response.xml(), media_type='application/xml')
+            return Response(content=response.xml(self._pretty_print), media_type='application/xml')
         except Exception as ex:
             # log exception
             self._logger.error(ex)
@@ -184,19 +535,15 @@ class PublisherEndpoint():
             response = SubscriptionResponse(self._participant_ref, self._service_startup_time)
             response.error(subscription_id)
 
-            return Response(content=response.xml(), media_type='application/xml')
+            return Response(content=response.xml(self._pretty_print), media_type='application/xml')
 
     async def _unsubscribe(self, req: Request) -> Response:
-        request = xml2siri_request(await req.body())
+        request = xml2siri_request(decompress(await req.body(), req.headers.get('Content-Encoding')))
 
         subscriber_ref = sirixml_get_value(request, 'Siri.TerminateSubscriptionRequest.RequestorRef')
 
         # check which subscription should be deleted - currently, only all subscriptions by a certain subscriber can be deleted
-        subscriptions_to_delete = list()
-
-        for subscription_id, subscription in self._local_node_database.get_subscriptions().items():
-            if subscription.subscriber == subscriber_ref:
-                subscriptions_to_delete.append(subscription_id)
+        subscriptions_to_delete = list(self._local_node_database.get_subscriptions_by_subscriber(subscriber_ref).keys())
 
         response = TerminateSubscriptionResponse(self._participant_ref)
         for subscription_id in subscriptions_to_delete:
@@ -214,19 +561,95 @@ class PublisherEndpoint():
                 # respond with SubscriptionResponse Error for this subscription
                 response.add_error(subscriber_ref, subscription_id)
 
-        return Response(content=response.xml(), media_type='application/xml')
+        return Response(content=response.xml(self._pretty_print), media_type='application/xml')
 
     async def _request(self, req: Request) -> Response:
-        request = xml2siri_request(await req.body())
+        request = xml2siri_request(decompress(await req.body(), req.headers.get('Content-Encoding')))
 
-        delivery = SituationExchangeDelivery(self._service_participant_ref, None)
+        situation_changes = sirixml_get_elements(request, 'Siri.ServiceRequest.SituationExchangeRequest.Extensions.SituationChanges')
 
-        for _, situation in self._local_node_database.get_situations().items():
-            delivery.add_situation(situation)
+        epoch = sirixml_get_value(situation_changes, 'Epoch')
+        since = sirixml_get_int(situation_changes, 'SequenceNumber')
 
-        return Response(content=delivery.xml(), media_type='application/xml')    
+        start_after = None
+        if self._request_streaming:
+            start_after = sirixml_get_value(request, 'Siri.ServiceRequest.SituationExchangeRequest.Extensions.Paging.StartAfter')
 
-        
+        revision, modified = self._local_node_database.get_situations_revision()
+        if modified is None:
+            modified = parse_timestamp(self._service_startup_time).timestamp()
+
+        # full, incremental and paged responses differ, each variant gets its own validator
+        variant = self._request_variant(epoch, since, start_after)
+
+        headers = {
+            'ETag': f"\"{self._request_etag_prefix}-{revision}\"" if variant is None else f"\"{self._request_etag_prefix}-{revision}-{variant}\"",
+            'Last-Modified': formatdate(modified, usegmt=True)
+        }
+
+        if not self._is_modified(req, headers['ETag']):
+            return Response(status_code=304, headers=headers)
+
+        # incremental requests only receive the situations changed after their sequence number and tombstones
+        changes = None
+
+        if epoch is not None and since is not None:
+            changes = self._local_node_database.get_situation_changes(epoch, since)
+
+            if changes.incremental:
+                delivery = SituationExchangeDelivery(self._service_participant_ref, None)
+                for situation in changes.situations.values():
+                    delivery.add_situation(situation)
+
+                delivery.set_changes(changes.epoch, changes.sequence, True, changes.removed)
 
+                return Response(content=delivery.xml(self._pretty_print), media_type='application/xml', headers=headers)
 
+        if self._request_streaming:
+            return self._stream_situations(start_after, headers)
 
+        if self._request_cache is None or self._request_cache[0] != revision:
+            if changes is None:
+                changes = self._local_node_database.get_situation_changes()
+
+            template = SituationExchangeDeliveryTemplate(self._service_participant_ref, pretty_print=self._pretty_print)
+            for situation in changes.situations.values():
+                template.add_situation(situation)
+
+            template.set_changes(changes.epoch, changes.sequence, False)
+
+            self._request_cache = (revision, template)
+
+        # cached snapshot gets a fresh message identifier and timestamps
+        delivery = self._request_cache[1].render(None)
+
+        return Response(content=delivery.xml(self._pretty_print), media_type='application/xml', headers=headers)
+    
+    def _stream_situations(self, start_after: str|None, headers: dict) -> StreamingResponse:
+        # sequence number is read before the situations, changes while streaming are delivered again with the next request
+        epoch, sequence = self._local_node_database.get_situation_changes_sequence()
+
+        more_data = self._request_max_situations is not None and self._local_node_database.count_situations(start_after) > self._request_max_situations
+
+        template = SituationExchangeDeliveryTemplate(self._service_participant_ref, more_data, self._pretty_print)
+        template.set_changes(epoch, sequence, False)
+
+        situations = (serialized for _, serialized in self._local_node_database.iter_situations(start_after, self._request_max_situations))
+
+        return StreamingResponse(template.render_stream(None, situations), media_type='application/xml', headers=headers)
+    
+    def _request_variant(self, epoch: str|None, since: int|None, start_after: str|None) -> str|None:
+        if (epoch is None or since is None) and start_after is None and (not self._request_streaming or self._request_max_situations is None):
+            return None
+        
+        variant = f"{epoch}|{since}|{start_after}|{self._request_max_situations if self._request_streaming else None}"
+        return hashlib.sha256(variant.encode('utf-8')).hexdigest()[:8]
+    
+    def _is_modified(self, req: Request, etag: str) -> bool:
+        # If-Modified-Since isn't honoured, Last-Modified has a resolution of one second and changes within the 
+        # same second would be answered with 304 Not Modified
+        if_none_match = req.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return not (if_none_match.strip() == '*' or etag in [e.strip() for e in if_none_match.split(',')])
+            
+        return True
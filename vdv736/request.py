@@ -15,21 +15,24 @@ class SiriRequest(ABC):
     def __init__(self):
         self.Siri = Element('Siri', xmlns='http://www.siri.org.uk/siri', version='2.0')
     
-    def xml(self) -> str:
+    def xml(self, pretty_print: bool = True) -> str:
         deannotate(self.Siri)
         cleanup_namespaces(self.Siri)
 
-        return tostring(self.Siri, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+        return tostring(self.Siri, pretty_print=pretty_print, xml_declaration=True, encoding='UTF-8')
 
 
 class CheckStatusRequest(SiriRequest):
 
-    def __init__(self, subscription: Subscription):
+    def __init__(self, requestor: str|Subscription):
         super().__init__()
 
+        # subscribers pass their subscription, publishers checking a subscriber their own participant ref
+        requestor_ref = requestor.subscriber if isinstance(requestor, Subscription) else requestor
+
         self.Siri.CheckStatusRequest = Element('CheckStatusRequest', version='2.0')
         self.Siri.CheckStatusRequest.RequestTimestamp = timestamp()
-        self.Siri.CheckStatusRequest.RequestorRef = subscription.subscriber
+        self.Siri.CheckStatusRequest.RequestorRef = requestor_ref
 
 
 class SubscriptionRequest(SiriRequest):
@@ -72,7 +75,7 @@ class SituationExchangeSubscriptionRequest(SubscriptionRequest):
         self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest = Element('SituationExchangeSubscriptionRequest')
         self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SubscriberRef = subscription.subscriber
         self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SubscriptionIdentifier = subscription.id
-        self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.InitialTerminationTime = subscription.termination
+        self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.InitialTerminationTime = subscription.termination.isoformat() if subscription.termination is not None else None
 
         self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SituationExchangeRequest = Element('SituationExchangeRequest')
         self.Siri.SubscriptionRequest.SituationExchangeSubscriptionRequest.SituationExchangeRequest.RequestTimestamp = timestamp()
@@ -80,12 +83,26 @@ class SituationExchangeSubscriptionRequest(SubscriptionRequest):
 
 class SituationExchangeRequest(ServiceRequest):
 
-    def __init__(self, subscriber_ref: str):
+    def __init__(self, subscriber_ref: str, epoch: str = None, since: int = None, start_after: str = None):
         super().__init__(subscriber_ref)
 
         self.Siri.ServiceRequest.SituationExchangeRequest = Element('SituationExchangeRequest', version='2.0')
         self.Siri.ServiceRequest.SituationExchangeRequest.RequestTimestamp = timestamp()
 
+        if (epoch is not None and since is not None) or start_after is not None:
+            self.Siri.ServiceRequest.SituationExchangeRequest.Extensions = Element('Extensions')
+
+        # request only the changes after a sequence number of a previous delivery
+        if epoch is not None and since is not None:
+            self.Siri.ServiceRequest.SituationExchangeRequest.Extensions.SituationChanges = Element('SituationChanges')
+            self.Siri.ServiceRequest.SituationExchangeRequest.Extensions.SituationChanges.Epoch = epoch
+            self.Siri.ServiceRequest.SituationExchangeRequest.Extensions.SituationChanges.SequenceNumber = since
+
+        # request the next page of a delivery with MoreData
+        if start_after is not None:
+            self.Siri.ServiceRequest.SituationExchangeRequest.Extensions.Paging = Element('Paging')
+            self.Siri.ServiceRequest.SituationExchangeRequest.Extensions.Paging.StartAfter = start_after
+
 
 def xml2siri_request(xml: str) -> SiriRequest:
     request = SiriRequest()
@@ -14,11 +14,11 @@ class SiriResponse(ABC):
     def __init__(self):
         self.Siri = Element('Siri', xmlns='http://www.siri.org.uk/siri', version='2.0')
 
-    def xml(self) -> str:
+    def xml(self, pretty_print: bool = True) -> str:
         deannotate(self.Siri)
         cleanup_namespaces(self.Siri)
 
-        return tostring(self.Siri, pretty_print=True, xml_declaration=True, encoding='UTF-8') 
+        return tostring(self.Siri, pretty_print=pretty_print, xml_declaration=True, encoding='UTF-8') 
     
 
 class CheckStatusResponse(SiriResponse):
@@ -1,52 +1,79 @@
+import datetime
+
+from functools import lru_cache
+from lxml.objectify import ObjectPath
+
+from .isotime import parse_timestamp
+
+
+class CompiledPath():
+
+    def __init__(self, path: str):
+        self.path = path
+
+        # first segment may be a plain python attribute (e.g. SiriRequest.Siri), the remainder is resolved by lxml in one pass
+        self._head, _, tail = path.partition('.')
+        self._tail = ObjectPath(f".{tail}") if tail != '' else None
+
+    def find(self, obj):
+        if obj is None:
+            return None
+
+        destination = getattr(obj, self._head, None)
+        if destination is None or self._tail is None:
+            return destination
+
+        return self._tail.find(destination, None)
+
+
+@lru_cache(maxsize=1024)
+def compile_path(path: str) -> CompiledPath:
+    return CompiledPath(path)
+
 def exists(obj, path):
-    path = path.split('.')
-    
-    level0 = path[0]
-    level1 = '.'.join(path[1:])
-    
-    return obj is not None and hasattr(obj, level0) if len(path) == 1 else exists(getattr(obj, level0), level1) if hasattr(obj, level0) else False
+    return compile_path(path).find(obj) is not None
 
 def get_elements(obj, path):
-    if exists(obj, path):
-        path = path.split('.')
-        
-        destination = obj
-        for element in path:
-            destination = getattr(destination, element)
-            
+    destination = compile_path(path).find(obj)
+    if destination is not None:
         return destination
 
     return list()
-    
+
 def get_value(obj, path, default=None):
-    if exists(obj, path):
-        path = path.split('.')
-        
-        destination = obj
-        for element in path:
-            destination = getattr(destination, element)
-            
-        if hasattr(destination, 'text'):
-            return destination.text
-        else:
-            return default
-        
+    destination = compile_path(path).find(obj)
+    if destination is not None and hasattr(destination, 'text'):
+        return destination.text
+
+    return default
+
+def get_bool(obj, path, default=None) -> bool|None:
+    value = get_value(obj, path)
+    if value is not None and value.strip() in ['true', '1']:
+        return True
+    elif value is not None and value.strip() in ['false', '0']:
+        return False
+
+    return default
+
+def get_int(obj, path, default=None) -> int|None:
+    try:
+        return int(get_value(obj, path))
+    except (TypeError, ValueError):
+        return default
+
+def get_datetime(obj, path, default=None) -> datetime.datetime|None:
+    value = parse_timestamp(get_value(obj, path))
+    if value is not None:
+        return value
+
     return default
 
 def get_attribute(obj, path, default=None):
-    objectpath = path.split('.')
-    objectpath = '.'.join(objectpath[:-1])
-    
-    if exists(obj, objectpath):
-        path = path.split('.')
-        
-        destination = obj
-        for element in path[:-1]:
-            destination = getattr(destination, element)
-            
-        if hasattr(destination, 'attr') and path[-1] in destination.attr:
-            return destination.get(path[-1])
-        else:
-            return default
-            
-    return default
\ No newline at end of file
+    objectpath, _, attribute = path.rpartition('.')
+
+    destination = compile_path(objectpath).find(obj)
+    if destination is not None and hasattr(destination, 'attrib') and attribute in destination.attrib:
+        return destination.get(attribute)
+
+    return default
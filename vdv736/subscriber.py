@@ -1,14 +1,28 @@
+import asyncio
+import datetime
 import logging
-import requests
+import queue
+import time
 import uuid
 import uvicorn
 import yaml
 
+from .cache import CacheStats
+from .compression import decompressor as compression_decompressor
+from .isotime import parse_interval
+from .isotime import parse_timestamp
 from .isotime import timestamp
 from .database import local_node_database
-from .delivery import xml2siri_delivery
-from .delivery import SituationExchangeDelivery
+from .events import EventDispatcher
+from .events import EventStream
+from .events import OverflowPolicy
+from .events import SituationEvent
+from .heartbeat import HeartbeatMonitor
+from .messages import ReceivedMessages
+from .database import UpsertOutcome
+from .delivery import SituationExchangeDeliveryReader
 from .model import PublicTransportSituation
+from .model import SituationSummary
 from .model import Subscription
 from .request import SiriRequest
 from .request import CheckStatusRequest
@@ -19,23 +33,58 @@ from .response import xml2siri_response
 from .response import SiriResponse
 from .response import DataReceivedAcknowledgement
 from .sirixml import exists as sirixml_exists
+from .sirixml import get_bool as sirixml_get_bool
 from .sirixml import get_elements as sirixml_get_elements
 from .sirixml import get_value as sirixml_get_value
+from .sweeper import ExpirySweeper
+from .transport import HttpTransport
+from .transport import TransportStats
+from .writer import Durability
+from .writer import SituationWriter
 
 from fastapi import FastAPI
 from fastapi import APIRouter
 from fastapi import Request
 from fastapi import Response
+from fastapi.middleware.gzip import GZipMiddleware
+from requests import Response as HttpResponse
+from concurrent.futures import Future
+from threading import Lock
 from threading import Thread
+from typing import Callable
+from typing import Generator
+from typing import Iterable
+from typing import Iterator
 
 
 class Subscriber():
 
-    def __init__(self, participant_ref: str, participant_config_filename: str):
+    def __init__(self, participant_ref: str, participant_config_filename: str, transport: HttpTransport = None, sweep_interval: float = 60.0, pretty_print: bool = True, compression_threshold: int = 1024, compression_level: int = 6, ingest_batch_size: int = 500, situation_cache_size: int = 32 * 1024 * 1024, heartbeat_interval: float|None = 60.0, heartbeat_concurrency: int = 8, delivery_durability: Durability = Durability.COMMITTED, delivery_message_window: float = 3600.0, remove_database: bool = False, subscription_renewal: float = 3600.0):
         self._service_participant_ref = participant_ref
         self._logger = logging.getLogger('uvicorn')
 
-        self._local_node_database = local_node_database('vdv736.subscriber')
+        # incoming situations are stored in batches while they're parsed
+        self._ingest_batch_size = ingest_batch_size
+        self._delivery_durability = delivery_durability
+        self._delivery_message_window = delivery_message_window
+
+        self._pretty_print = pretty_print
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+
+        # parsed situations are cached up to this many bytes of serialized XML, the database holds the processed
+        # deliveries and is only removed on exit if requested
+        self._local_node_database = local_node_database('vdv736.subscriber', situation_cache_size)
+        self._remove_database = remove_database
+        self._expiry_sweeper = ExpirySweeper(self._local_node_database, sweep_interval, message_retention=delivery_message_window, sweep_subscriptions=False)
+
+        # subscriptions are checked in the background unless heartbeat_interval is None and renewed subscription_renewal
+        # seconds before their termination time, renewals by the monitor and status() are serialized
+        self._subscription_renewal = subscription_renewal
+        self._renewal_lock = Lock()
+        self._heartbeat_monitor = HeartbeatMonitor(self, heartbeat_interval, max_concurrency=heartbeat_concurrency, renewal_margin=subscription_renewal) if heartbeat_interval is not None else None
+
+        self._participant_config = dict()
 
         try:
             with open(participant_config_filename) as participant_config_file:
@@ -43,55 +92,168 @@ class Subscriber():
         except Exception as ex:
             self._logger.error(ex)
 
+        self._transport = transport if transport is not None else HttpTransport(self._participant_config, compression_threshold=compression_threshold, compression_level=compression_level)
+
+        # ETag of the last /request response per publisher for conditional requests
+        self._request_etags = dict()
+
+        # epoch and sequence number of the last /request response per publisher for incremental requests
+        self._request_sequences = dict()
+
+        # changes received by /request and the delivery endpoint are announced to listeners and event streams
+        self._events = EventDispatcher()
+
+        # the delivery endpoint is only started on __enter__
+        self._endpoint = None
+        self._endpoint_thread = None
+
     def __enter__(self):
         self._endpoint_thread = Thread(target=self._run_endpoint, args=(), daemon=True)
         self._endpoint_thread.start()
 
+        self._expiry_sweeper.start()
+
+        if self._heartbeat_monitor is not None:
+            self._heartbeat_monitor.start()
+
         return self
 
     def __exit__(self, exception_type, exception_value, exception_traceback) -> None:
+        if self._heartbeat_monitor is not None:
+            self._heartbeat_monitor.stop()
+
+        if self._expiry_sweeper is not None:
+            self._expiry_sweeper.stop()
+
         if self._endpoint is not None:
             self._endpoint.terminate()
         
         if self._endpoint_thread is not None:
             self._endpoint_thread.join(1)
 
+        if self._transport is not None:
+            self._transport.close()
+
         if self._local_node_database is not None:
-            self._local_node_database.close(True)
+            self._local_node_database.close(self._remove_database)
+
+    def transport_stats(self) -> dict[str, TransportStats]:
+        return self._transport.stats()
 
     def get_situations(self) -> dict[str, PublicTransportSituation]:
         return self._local_node_database.get_situations()
+    
+    def query_situations(self, participant_ref: str = None, line_ref: str = None, stop_point_ref: str = None, progress: str = None, severity: str = None, valid_at: datetime.datetime = None) -> dict[str, PublicTransportSituation]:
+        return self._local_node_database.query_situations(participant_ref, line_ref, stop_point_ref, progress, severity, valid_at)
+
+    def situation_cache_stats(self) -> CacheStats:
+        return self._local_node_database.situation_cache_stats()
+
+    def get_situation_summaries(self) -> dict[str, SituationSummary]:
+        return self._local_node_database.query_situation_summaries()
+    
+    def query_situation_summaries(self, participant_ref: str = None, line_ref: str = None, stop_point_ref: str = None, progress: str = None, severity: str = None, valid_at: datetime.datetime = None) -> dict[str, SituationSummary]:
+        return self._local_node_database.query_situation_summaries(participant_ref, line_ref, stop_point_ref, progress, severity, valid_at)
+
+    def add_event_listener(self, callback: Callable[[SituationEvent], None]) -> None:
+        self._events.add_listener(callback)
+
+    def remove_event_listener(self, callback: Callable[[SituationEvent], None]) -> None:
+        self._events.remove_listener(callback)
+
+    def situation_events(self, max_size: int = 1000, overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> EventStream:
+        return self._events.stream(max_size, overflow)
 
     def status(self, subscription_id=None) -> bool:
         if subscription_id is not None:
-            return self._status(subscription_id)
+            return self._check_subscription(subscription_id)
         else:
             all_subscriptions_ok = True
             for subscription_id, _ in self._local_node_database.get_subscriptions().items():
-                if self._status(subscription_id) != True:
+                if self._check_subscription(subscription_id) != True:
                     all_subscriptions_ok = False
 
             return all_subscriptions_ok
         
-    def _status(self, subscription_id: str) -> bool:
-        subscription = self._local_node_database.get_subscriptions()[subscription_id]
+    def _check_subscription(self, subscription_id: str) -> bool:
+        # used by status() and the heartbeat monitor, subscriptions of a restarted remote server are renewed
+        subscription = self._local_node_database.get_subscription(subscription_id)
+        if subscription is None:
+            return False
+        
+        if self._renewal_due(subscription):
+            return self._renew_subscription(subscription_id)
 
         request = CheckStatusRequest(subscription)
         response = self._send_request(subscription, request)
 
-        if sirixml_get_value(response, 'Siri.CheckStatusResponse.Status', False):
+        status = self._process_status_response(subscription, response)
+        if status is None:
+            return self._renew_restarted_subscriptions(subscription, sirixml_get_value(response, 'Siri.CheckStatusResponse.ServiceStartedTime'))
+
+        return status
+    
+    def _renew_restarted_subscriptions(self, subscription: Subscription, service_started_time: str) -> bool:
+        # ServiceStartedTime is the same for all subscriptions to the restarted remote server, they're renewed in 
+        # one pass instead of waiting for their own check
+        participant_ref = subscription.remote_service_participant_ref
+        subscription_ids = [s.id for s in self._local_node_database.get_subscriptions().values() if s.remote_service_participant_ref == participant_ref and s.remote_service_startup_time not in [None, service_started_time]]
+
+        self._logger.warning(f"Remote server {participant_ref} restarted at {service_started_time}, renewing {len(subscription_ids)} subscription(s)")
+
+        results = {subscription_id: self._renew_subscription(subscription_id, service_started_time) for subscription_id in subscription_ids}
+        return results.get(subscription.id, True)
+
+    def _renew_subscription(self, subscription_id: str, service_started_time: str = None) -> bool:
+        # each subscription is renewed with its own identifier, a TerminateSubscriptionRequest would end all
+        # subscriptions of this subscriber at once
+        with self._renewal_lock:
+            subscription = self._local_node_database.get_subscription(subscription_id)
+            if subscription is None:
+                return False
+            
+            # status() and the heartbeat monitor may both detect the same restart or termination time
+            if service_started_time is not None and subscription.remote_service_startup_time == service_started_time:
+                return True
+            
+            if service_started_time is None and not self._renewal_due(subscription):
+                return True
+            
+            if service_started_time is not None:
+                subscription.remote_service_startup_time = service_started_time
+
+            subscription.termination = parse_timestamp(timestamp(60 * 60 * 24))
+
+            request = SituationExchangeSubscriptionRequest(subscription)
+            response = self._send_request(subscription, request)
+
+            return self._process_subscription_response(subscription, response) is not None
+
+    def _renewal_due(self, subscription: Subscription) -> bool:
+        return subscription.termination is not None and subscription.termination.timestamp() - time.time() <= self._subscription_renewal
+
+    def _process_status_response(self, subscription: Subscription, response: SiriResponse|None) -> bool|None:
+        # returns None if the remote server has been restarted and the subscription needs to be renewed
+        if sirixml_get_bool(response, 'Siri.CheckStatusResponse.Status', False):
+            shortest_possible_cycle = parse_interval(sirixml_get_value(response, 'Siri.CheckStatusResponse.ShortestPossibleCycle'))
+
             if subscription.remote_service_startup_time is not None:
                 if sirixml_get_value(response, 'Siri.CheckStatusResponse.ServiceStartedTime') == subscription.remote_service_startup_time:
+                    if shortest_possible_cycle is not None and shortest_possible_cycle != subscription.shortest_possible_cycle:
+                        subscription.shortest_possible_cycle = shortest_possible_cycle
+                        self._local_node_database.update_subscription(subscription.id, subscription)
+
                     self._logger.info(f"Status for subscription {subscription.id} @ {subscription.host}:{subscription.port} as {subscription.subscriber} OK")
                     return True
                 else:
                     self._logger.warn(f"Remote server for subscription {subscription.id} @ {subscription.host}:{subscription.port} as {subscription.subscriber} seems to be restarted")
-                    
-                    self.unsubscribe(subscription.id)
-                    return self.subscribe(subscription.remote_service_participant_ref) is not None
+                    return None
             else:
                 subscription.remote_service_startup_time = sirixml_get_value(response, 'Siri.CheckStatusResponse.ServiceStartedTime')
-                self._local_node_database.update_subscription(subscription_id, subscription)
+                if shortest_possible_cycle is not None:
+                    subscription.shortest_possible_cycle = shortest_possible_cycle
+
+                self._local_node_database.update_subscription(subscription.id, subscription)
 
                 self._logger.info(f"Status for subscription {subscription.id} @ {subscription.host}:{subscription.port} as {subscription.subscriber} OK")
                 return True
@@ -100,8 +262,19 @@ class Subscriber():
             return False
 
     def subscribe(self, participant_ref: str) -> str|None:
+        subscription = self._create_subscription(participant_ref)
 
-        subscription_id = str(uuid.uuid4())
+        request = SituationExchangeSubscriptionRequest(subscription)
+        response = self._send_request(subscription, request)
+
+        return self._process_subscription_response(subscription, response)
+
+    def _create_subscription(self, participant_ref: str) -> Subscription:
+        # subscriptions are kept in the database across restarts, subscribing to the same publisher again renews 
+        # the stored subscription instead of adding another one
+        stored = [s.id for s in self._local_node_database.get_subscriptions().values() if s.remote_service_participant_ref == participant_ref]
+
+        subscription_id = stored[0] if len(stored) > 0 else str(uuid.uuid4())
         subscription_host = self._participant_config[participant_ref]['host']
         subscription_port = self._participant_config[participant_ref]['port']
         subscription_protocol = self._participant_config[participant_ref]['protocol']
@@ -114,19 +287,26 @@ class Subscriber():
 
         subscription.remote_service_participant_ref = participant_ref
 
-        request = SituationExchangeSubscriptionRequest(subscription)
-        response = self._send_request(subscription, request)
+        return subscription
 
-        if sirixml_get_value(response, 'Siri.SubscriptionResponse.ResponseStatus.Status', True):
+    def _process_subscription_response(self, subscription: Subscription, response: SiriResponse|None) -> str|None:
+        # unreachable publishers and responses without status are failures, renewed subscriptions keep their termination time
+        if sirixml_get_bool(response, 'Siri.SubscriptionResponse.ResponseStatus.Status', False):
             self._logger.info(f"Initialized subscription {subscription.id} @ {subscription.host}:{subscription.port} as {subscription.subscriber} successfully")
 
             service_started_time = sirixml_get_value(response, 'Siri.SubscriptionResponse.ResponseStatus.ServiceStartedTime')
             if service_started_time is not None:
                 subscription.remote_service_startup_time = service_started_time
-                
-            self._local_node_database.add_subscription(subscription_id, subscription)
 
-            return subscription_id
+            subscription.shortest_possible_cycle = parse_interval(sirixml_get_value(response, 'Siri.SubscriptionResponse.ResponseStatus.ShortestPossibleCycle'))
+
+            # renewed subscriptions keep their identifier
+            if self._local_node_database.get_subscription(subscription.id) is not None:
+                self._local_node_database.update_subscription(subscription.id, subscription)
+            else:
+                self._local_node_database.add_subscription(subscription.id, subscription)
+
+            return subscription.id
         else:
             self._logger.error(f"Failed to initalize subscription {subscription.id} @ {subscription.host}:{subscription.port} as {subscription.subscriber}")
 
@@ -135,7 +315,7 @@ class Subscriber():
     def unsubscribe(self, subscription_id: str) -> bool:
         
         # take subscription instance from subscription stack
-        subscription = self._local_node_database.get_subscriptions()[subscription_id]
+        subscription = self._local_node_database.get_subscription(subscription_id)
 
         # delete subscription out of local database
         self._local_node_database.remove_subscription(subscription_id)
@@ -144,6 +324,10 @@ class Subscriber():
         request = TerminateSubscriptionRequest(self._service_participant_ref)
         response = self._send_request(subscription, request)
 
+        return self._process_termination_response(subscription, response)
+
+    def _process_termination_response(self, subscription: Subscription, response: SiriResponse|None) -> bool:
+
         # check each termination subscription response for success
         if sirixml_exists(response, 'Siri.TerminationSubscriptionResponse.TerminationResponseStatus'):
             for termination_response_status in sirixml_get_elements(response, 'Siri.TerminationSubscriptionResponse.TerminationResponseStatus'):
@@ -159,16 +343,83 @@ class Subscriber():
             return True
             
     def request(self, publisher_ref: str) -> bool:
+        return self._request_pages(publisher_ref, self._request_page)
+    
+    def _request_page(self, publisher_ref: str, siri_request: SiriRequest, conditional: bool) -> tuple[int, str|None, Generator[bytes, None, None]|None]|None:
+        response = self._send_direct_request(publisher_ref, siri_request, conditional)
+        if response is None:
+            return None
+        
+        if response.status_code == 304:
+            response.close()
+            return (response.status_code, None, None)
+        
+        def chunks():
+            with response:
+                yield from response.iter_content(64 * 1024)
+
+        return (response.status_code, response.headers.get('ETag'), chunks())
+    
+    def _request_pages(self, publisher_ref: str, request_page: Callable[[str, SiriRequest, bool], tuple|None]) -> bool:
+        # request_page sends a request and returns status code, ETag and a generator of body chunks, which is
+        # parsed and stored in the calling thread while the body is still being received
+
+        # generate SituationExchangeRequest, only asking for changes if data have been requested before
+        epoch, since = self._request_sequences.get(publisher_ref, (None, None))
 
-        # generate SituationExchangeRequest
-        request = SituationExchangeRequest(self._service_participant_ref)
-        delivery = self._send_direct_request(publisher_ref, request)
+        request = SituationExchangeRequest(self._service_participant_ref, epoch, since)
+        page = request_page(publisher_ref, request, True)
 
-        if delivery is not None:
-            # process service delivery ...
-            for pts in sirixml_get_elements(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement'):
-                situation_id = sirixml_get_value(pts, 'SituationNumber')
-                self._local_node_database.add_situation(situation_id, pts)
+        if page is not None and page[0] == 304:
+            self._logger.info(f"Data of {publisher_ref} not modified since last request")
+
+            return True
+        elif page is not None:
+            etag = page[1]
+            sequence = None
+            incremental = None
+
+            # situations of a full snapshot are collected to remove the ones the publisher doesn't have anymore
+            _, local_sequence = self._local_node_database.get_situation_changes_sequence()
+            situation_ids = set()
+
+            while True:
+                reader = SituationExchangeDeliveryReader(self._ingest_batch_size)
+
+                try:
+                    # store situations in batches while the response is still being received
+                    if not self._store_request_chunks(reader, page[2], publisher_ref, situation_ids):
+                        return False
+                except Exception as ex:
+                    self._logger.error(ex)
+                    return False
+                finally:
+                    # the rest of the body isn't needed if storing failed
+                    page[2].close()
+
+                if not self._remove_request_situations(reader):
+                    return False
+                
+                # sequence number of the first page covers all following pages
+                if sequence is None:
+                    sequence = (reader.values.get('Epoch'), reader.sequence)
+                    incremental = reader.incremental
+
+                if not reader.more_data or reader.num_situations == 0:
+                    break
+
+                # request next page after the last situation received
+                request = SituationExchangeRequest(self._service_participant_ref, start_after=reader.last_situation_id)
+                page = request_page(publisher_ref, request, False)
+
+                if page is None:
+                    self._logger.error(f"Failed to request more data from {publisher_ref}")
+                    return False
+
+            if incremental == False and not self._reconcile_request_situations(publisher_ref, situation_ids, local_sequence):
+                return False
+
+            self._complete_request(publisher_ref, etag, sequence)
 
             return True
         else:
@@ -176,9 +427,56 @@ class Subscriber():
 
             return False
 
+    def _store_request_chunks(self, reader: SituationExchangeDeliveryReader, chunks: Iterable[bytes], publisher_ref: str, situation_ids: set[str]) -> bool:
+        for situations in reader.read(chunks):
+            if not self._store_request_situations(situations, publisher_ref):
+                return False
+            
+            situation_ids.update(situations.keys())
+            
+        return True
+
+    def _store_request_situations(self, situations: dict, publisher_ref: str) -> bool:
+        rows = self._local_node_database.situation_rows(situations, publisher_ref)
+
+        outcomes = self._local_node_database.upsert_situation_rows(rows)
+        if UpsertOutcome.FAILED in outcomes.values():
+            return False
+        
+        self._events.emit_outcomes(rows, outcomes)
+        return True
+
+    def _remove_request_situations(self, reader: SituationExchangeDeliveryReader) -> bool:
+        if len(reader.removed) == 0:
+            return True
+        
+        if not self._local_node_database.remove_situations(reader.removed):
+            return False
+        
+        self._events.emit_removed(reader.removed)
+        return True
+
+    def _reconcile_request_situations(self, publisher_ref: str, situation_ids: set[str], local_sequence: int) -> bool:
+        # a full snapshot follows a new epoch or pruned tombstones, removals since the last request are only known by omission
+        removed = self._local_node_database.remove_source_situations(publisher_ref, situation_ids, local_sequence)
+        if removed is None:
+            return False
+        
+        if len(removed) > 0:
+            self._logger.info(f"Removed {len(removed)} situation(s) missing in the snapshot of {publisher_ref}")
+            self._events.emit_removed(removed)
+        
+        return True
+
+    def _complete_request(self, publisher_ref: str, etag: str|None, sequence: tuple) -> None:
+        if etag is not None:
+            self._request_etags[publisher_ref] = etag
+
+        if sequence[0] is not None and sequence[1] is not None:
+            self._request_sequences[publisher_ref] = sequence
 
     def _run_endpoint(self) -> None:
-        self._endpoint = SubscriberEndpoint(self._service_participant_ref)
+        self._endpoint = SubscriberEndpoint(self._service_participant_ref, self._pretty_print, self._compression_threshold, self._compression_level, self._ingest_batch_size, self._events, self._delivery_durability, self._delivery_message_window)
 
         # disable uvicorn logs
         logging.getLogger('uvicorn.error').handlers = []
@@ -198,18 +496,12 @@ class Subscriber():
 
     def _send_request(self, subscription: Subscription, siri_request: SiriRequest) -> SiriResponse|None:
         try:
-            if isinstance(siri_request, CheckStatusRequest):
-                endpoint = f"{subscription.protocol}://{subscription.host}:{subscription.port}/{subscription.status_endpoint}"
-            elif isinstance(siri_request, SituationExchangeSubscriptionRequest):
-                endpoint = f"{subscription.protocol}://{subscription.host}:{subscription.port}/{subscription.subscribe_endpoint}"
-            elif isinstance(siri_request, TerminateSubscriptionRequest):
-                endpoint = f"{subscription.protocol}://{subscription.host}:{subscription.port}/{subscription.unsubscribe_endpoint}"
-            
+            endpoint = self._request_endpoint(subscription, siri_request)
             headers = {
                 "Content-Type": "application/xml"
             }
             
-            response_xml = requests.post(endpoint, headers=headers, data=siri_request.xml())
+            response_xml = self._transport.post(subscription.remote_service_participant_ref, endpoint, siri_request.xml(self._pretty_print), headers)
             response = xml2siri_response(response_xml.content)
 
             return response
@@ -217,81 +509,176 @@ class Subscriber():
             self._logger.error(ex)
             return None
         
-    def _send_direct_request(self, publisher_ref: str, siri_request: SiriRequest) -> SituationExchangeDelivery|None:
+    def _send_direct_request(self, publisher_ref: str, siri_request: SiriRequest, conditional: bool = True) -> HttpResponse|None:
         try:
-            subscription_host = self._participant_config[publisher_ref]['host']
-            subscription_port = self._participant_config[publisher_ref]['port']
-            subscription_protocol = self._participant_config[publisher_ref]['protocol']
-            
-            if isinstance(siri_request, SituationExchangeRequest):
-                request_endpoint = self._participant_config[publisher_ref]['request_endpoint']
-                endpoint = f"{subscription_protocol}://{subscription_host}:{subscription_port}/{request_endpoint}"
-            
-            headers = {
-                "Content-Type": "application/xml"
-            }
+            endpoint = self._participant_config[publisher_ref]['request_endpoint']
+            headers = self._direct_request_headers(publisher_ref, conditional)
             
-            response_xml = requests.post(endpoint, headers=headers, data=siri_request.xml())
-            delivery = xml2siri_delivery(response_xml.content)
+            response = self._transport.post(publisher_ref, endpoint, siri_request.xml(self._pretty_print), headers, stream=True)
 
-            return delivery
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.close()
+                raise
+
+            return response
         except Exception as ex:
             self._logger.error(ex)
             return None
 
+    def _request_endpoint(self, subscription: Subscription, siri_request: SiriRequest) -> str:
+        if isinstance(siri_request, CheckStatusRequest):
+            return subscription.status_endpoint
+        elif isinstance(siri_request, SituationExchangeSubscriptionRequest):
+            return subscription.subscribe_endpoint
+        elif isinstance(siri_request, TerminateSubscriptionRequest):
+            return subscription.unsubscribe_endpoint
+        
+        raise ValueError(f"Unsupported request {type(siri_request).__name__}")
+
+    def _direct_request_headers(self, publisher_ref: str, conditional: bool) -> dict:
+        headers = {
+            "Content-Type": "application/xml"
+        }
+
+        if conditional and publisher_ref in self._request_etags:
+            headers['If-None-Match'] = self._request_etags[publisher_ref]
+
+        return headers
+
 
 class SubscriberEndpoint():
 
-    def __init__(self, participant_ref: str):
+    def __init__(self, participant_ref: str, pretty_print: bool = True, compression_threshold: int = 1024, compression_level: int = 6, ingest_batch_size: int = 500, events: EventDispatcher = None, durability: Durability = Durability.COMMITTED, message_window: float = 3600.0):
         self._service_participant_ref = participant_ref
         self._service_startup_time = timestamp()
         self._logger = logging.getLogger('uvicorn')
 
+        self._ingest_batch_size = ingest_batch_size
+        self._events = events if events is not None else EventDispatcher()
+
+        self._pretty_print = pretty_print
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+
         self._router = APIRouter()
         self._endpoint = FastAPI()
 
         self._local_node_database = local_node_database('vdv736.subscriber')
 
+        # deliveries are parsed in worker threads and stored by a single writer in group commits
+        self._writer = SituationWriter(self._local_node_database, durability, events=self._events)
+
+        # deliveries processed within the message window survive restarts, retries of them are only acknowledged
+        self._received_messages = ReceivedMessages(message_window)
+        self._received_messages.load(self._local_node_database.get_delivery_messages(time.time() - message_window))
+
+        # queued deliveries waiting to be remembered, the event loop only keeps weak references to tasks
+        self._pending_deliveries = set()
+
     def create_endpoint(self, participant_ref: str, delivery_endpoint='/delivery') -> FastAPI:
         self.participant_ref = participant_ref
 
+        self._writer.start()
+
         self._router.add_api_route(delivery_endpoint, self._delivery, methods=['POST'])
         
         self._endpoint.include_router(self._router)
+        self._endpoint.add_middleware(GZipMiddleware, minimum_size=self._compression_threshold, compresslevel=self._compression_level)
 
         return self._endpoint
     
     def terminate(self) -> None:
+        self._writer.stop()
         self._local_node_database.close()
     
     async def _delivery(self, req: Request) -> Response:
+        reader = SituationExchangeDeliveryReader(self._ingest_batch_size)
+
         try:
-            delivery = xml2siri_delivery(await req.body())
+            decompressor = compression_decompressor(req.headers.get('Content-Encoding'))
 
-            # process service delivery ...
-            for pts in sirixml_get_elements(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.Situations.PtSituationElement'):
-                situation_id = sirixml_get_value(pts, 'SituationNumber')
-                self._local_node_database.add_situation(situation_id, pts)
+            # parse off the event loop while the body is still being received, lxml parsers must stay in one thread
+            chunks = queue.SimpleQueue()
+            parsing = asyncio.create_task(asyncio.to_thread(self._parse, reader, chunks))
 
-            # create data acknowledgement with OK status
-            acknowledgement = DataReceivedAcknowledgement(
-                sirixml_get_value(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.SubscriberRef'), 
-                sirixml_get_value(delivery, 'Siri.ServiceDelivery.ResponseMessageIdentifier')
-            )
+            try:
+                async for chunk in req.stream():
+                    chunks.put(decompressor.decompress(chunk))
+
+                chunks.put(decompressor.flush())
+            finally:
+                chunks.put(None)
+
+            results = await parsing
+
+            if results is None:
+                self._logger.info(f"Skipped delivery {reader.values.get('ResponseMessageIdentifier')} of {reader.values.get('ProducerRef')} which has been processed before")
 
+                acknowledgement = DataReceivedAcknowledgement(reader.values.get('SubscriberRef'), reader.values.get('ResponseMessageIdentifier'))
+                acknowledgement.ok()
+
+                return Response(content=acknowledgement.xml(self._pretty_print), media_type='application/xml')
+
+            # acknowledge as soon as the configured durability level has been reached, queued deliveries are 
+            # remembered in the background once they're stored
+            if self._writer.durability != Durability.QUEUED:
+                if not await self._remember(reader.values, results):
+                    raise RuntimeError(f"Failed to store delivery {reader.values.get('ResponseMessageIdentifier')}")
+            else:
+                remembering = asyncio.create_task(self._remember(reader.values, results))
+
+                self._pending_deliveries.add(remembering)
+                remembering.add_done_callback(self._pending_deliveries.discard)
+
+            # create data acknowledgement with OK status
+            acknowledgement = DataReceivedAcknowledgement(reader.values.get('SubscriberRef'), reader.values.get('ResponseMessageIdentifier'))
             acknowledgement.ok()
 
-            return Response(content=acknowledgement.xml(), media_type='application/xml')
+            return Response(content=acknowledgement.xml(self._pretty_print), media_type='application/xml')
         except Exception as ex:
             self._logger.error(ex)
 
             # create data acknowledgement
-            acknowledgement = DataReceivedAcknowledgement(
-                sirixml_get_value(delivery, 'Siri.ServiceDelivery.SituationExchangeDelivery.SubscriberRef'), 
-                sirixml_get_value(delivery, 'Siri.ServiceDelivery.ResponseMessageIdentifier')
-            )
-
+            acknowledgement = DataReceivedAcknowledgement(reader.values.get('SubscriberRef'), reader.values.get('ResponseMessageIdentifier'))
             acknowledgement.error()
 
-            return Response(content=acknowledgement.xml(), media_type='application/xml')
+            return Response(content=acknowledgement.xml(self._pretty_print), media_type='application/xml')
         
+    async def _remember(self, values: dict, results: list[Future]) -> bool:
+        # delivery is only remembered once stored, failed deliveries are processed again when retried
+        for result in results:
+            outcomes = await asyncio.wrap_future(result)
+            if UpsertOutcome.FAILED in outcomes.values():
+                self._logger.error(f"Failed to store {len(outcomes)} situation(s) of delivery {values.get('ResponseMessageIdentifier')}")
+                return False
+
+        delivery_message = self._received_messages.add(values.get('ProducerRef'), values.get('ResponseMessageIdentifier'))
+        if delivery_message is not None:
+            self._writer.submit(dict(), [delivery_message])
+
+        return True
+
+    def _parse(self, reader: SituationExchangeDeliveryReader, chunks: queue.SimpleQueue) -> list[Future]|None:
+        results = list()
+        for chunk in iter(chunks.get, None):
+
+            # the header is fed in small steps, so retried deliveries are detected before any situation is parsed
+            while not reader.header_complete and len(chunk) > 0:
+                results.extend(self._submit(reader, reader.feed(chunk[:1024])))
+                chunk = chunk[1024:]
+
+                if reader.header_complete and self._received_messages.contains(reader.values.get('ProducerRef'), reader.values.get('ResponseMessageIdentifier')):
+                    return None
+
+            results.extend(self._submit(reader, reader.feed(chunk)))
+
+        results.extend(self._submit(reader, reader.close()))
+
+        return results
+    
+    def _submit(self, reader: SituationExchangeDeliveryReader, batches: Iterator[dict]) -> list[Future]:
+        # batches are queued for the writer as rows, so no element leaves the parsing thread, 
+        # ProducerRef precedes the situations and is known once a batch is complete
+        return [self._writer.submit(self._local_node_database.situation_rows(situations, reader.values.get('ProducerRef'))) for situations in batches]
@@ -0,0 +1,75 @@
+import logging
+import time
+
+from .database import LocalNodeDatabase
+
+from threading import Event
+from threading import Thread
+
+
+class SweepResult():
+
+    def __init__(self, situations: int, subscriptions: int, tombstones: int, duration: float, messages: int = 0):
+        self.situations = situations
+        self.subscriptions = subscriptions
+        self.tombstones = tombstones
+        self.duration = duration
+        self.messages = messages
+
+
+class ExpirySweeper():
+
+    def __init__(self, local_node_database: LocalNodeDatabase, interval: float = 60.0, tombstone_retention: float = 86400.0, message_retention: float = 3600.0, sweep_subscriptions: bool = True):
+        self._local_node_database = local_node_database
+        self._interval = interval
+        self._tombstone_retention = tombstone_retention
+        self._message_retention = message_retention
+
+        # subscribers renew their own subscriptions, only the publisher's view of remote subscriptions expires
+        self._sweep_subscriptions = sweep_subscriptions
+        self._logger = logging.getLogger('uvicorn')
+
+        self._thread = None
+        self._stop = Event()
+
+        self.last_result = None
+
+    def start(self) -> None:
+        self._stop.clear()
+
+        self._thread = Thread(target=self._run, args=(), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(1)
+
+    def sweep(self) -> SweepResult:
+        start = time.perf_counter()
+        now = time.time()
+
+        # remove situations whose validity ended and subscriptions past their termination time
+        situations = self._local_node_database.remove_expired_situations(now)
+        subscriptions = self._local_node_database.remove_expired_subscriptions(now) if self._sweep_subscriptions else 0
+
+        # subscribers which didn't request changes within the retention time get a full snapshot instead
+        tombstones = self._local_node_database.remove_situation_tombstones(now - self._tombstone_retention)
+
+        # retried deliveries older than the retention are processed again
+        messages = self._local_node_database.remove_delivery_messages(now - self._message_retention)
+
+        self.last_result = SweepResult(situations, subscriptions, tombstones, time.perf_counter() - start, messages)
+
+        if situations > 0 or subscriptions > 0:
+            self._logger.info(f"Removed {situations} expired situation(s) and {subscriptions} expired subscription(s) in {self.last_result.duration:.3f}s")
+
+        return self.last_result
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                self.sweep()
+            except Exception as ex:
+                self._logger.exception(ex)
@@ -0,0 +1,100 @@
+import requests
+
+from .compression import compress
+from .compression import SUPPORTED_ENCODINGS
+
+from requests.adapters import HTTPAdapter
+from threading import Lock
+
+
+class TransportStats():
+
+    def __init__(self, participant_ref: str, requests: int, connections: int):
+        self.participant_ref = participant_ref
+        self.requests = requests
+        self.connections = connections
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+
+class HttpTransport():
+
+    def __init__(self, participant_config: dict, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 30.0, compression_threshold: int = 1024, compression_level: int = 6):
+        self._participant_config = participant_config if participant_config is not None else dict()
+
+        self._pool_size = pool_size
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+
+        # request bodies are only compressed for participants with a content_encoding and above the threshold
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+
+        # one keep-alive session per remote participant, created on first use
+        self._sessions = dict()
+        self._lock = Lock()
+
+    def url(self, participant_ref: str, endpoint: str) -> str:
+        participant_host = self._participant_config[participant_ref]['host']
+        participant_port = self._participant_config[participant_ref]['port']
+        participant_protocol = self._participant_config[participant_ref]['protocol']
+
+        return f"{participant_protocol}://{participant_host}:{participant_port}/{endpoint.lstrip('/')}"
+
+    def post(self, participant_ref: str, endpoint: str, data: bytes, headers: dict = None, timeout: float = None, stream: bool = False) -> requests.Response:
+        read_timeout = timeout if timeout is not None else self._read_timeout
+        data, headers = self._encode(participant_ref, data, headers)
+
+        session = self._session(participant_ref)
+        return session.post(self.url(participant_ref, endpoint), headers=headers, data=data, timeout=(self._connect_timeout, read_timeout), stream=stream)
+
+    def stats(self) -> dict[str, TransportStats]:
+        stats = dict()
+
+        with self._lock:
+            for participant_ref, session in self._sessions.items():
+                num_requests = 0
+                num_connections = 0
+
+                for adapter in set(session.adapters.values()):
+                    for key in adapter.poolmanager.pools.keys():
+                        pool = adapter.poolmanager.pools.get(key)
+                        if pool is not None:
+                            num_requests = num_requests + pool.num_requests
+                            num_connections = num_connections + pool.num_connections
+
+                stats[participant_ref] = TransportStats(participant_ref, num_requests, num_connections)
+
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+
+    def _encode(self, participant_ref: str, data: bytes, headers: dict|None) -> tuple[bytes, dict|None]:
+        content_encoding = self._participant_config[participant_ref].get('content_encoding')
+        if content_encoding in SUPPORTED_ENCODINGS and len(data) >= self._compression_threshold:
+            data = compress(data, content_encoding, self._compression_level)
+
+            headers = dict(headers) if headers is not None else dict()
+            headers['Content-Encoding'] = content_encoding
+
+        return data, headers
+
+    def _session(self, participant_ref: str) -> requests.Session:
+        with self._lock:
+            if participant_ref not in self._sessions:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+
+                self._sessions[participant_ref] = session
+
+            return self._sessions[participant_ref]
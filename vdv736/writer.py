@@ -0,0 +1,126 @@
+import logging
+import queue
+
+from .database import LocalNodeDatabase
+from .database import UpsertOutcome
+from .events import EventDispatcher
+
+from concurrent.futures import Future
+from enum import Enum
+from threading import Thread
+
+
+class Durability(Enum):
+    QUEUED = 'queued'
+    COMMITTED = 'committed'
+    SYNCED = 'synced'
+
+
+class SituationWriter():
+
+    def __init__(self, local_node_database: LocalNodeDatabase, durability: Durability = Durability.COMMITTED, max_group_size: int = 5000, events: EventDispatcher = None):
+        self._local_node_database = local_node_database
+        self._durability = durability
+        self._max_group_size = max_group_size
+        self._events = events
+        self._logger = logging.getLogger('uvicorn')
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    @property
+    def durability(self) -> Durability:
+        return self._durability
+
+    def start(self) -> None:
+        # synced deliveries are only acknowledged after the WAL has been flushed to disk on every commit
+        if self._durability == Durability.SYNCED:
+            self._local_node_database.set_synchronous('FULL')
+
+        self._thread = Thread(target=self._run, args=(), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        # pending batches are still written before the thread ends
+        self._queue.put(None)
+
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def submit(self, rows: dict[str, dict], delivery_messages: list[tuple[str, str, float]] = None) -> Future:
+        # rows are prepared by LocalNodeDatabase.situation_rows in the parsing thread, the writer never touches XML
+        future = Future()
+        self._queue.put((rows, future, delivery_messages))
+
+        return future
+
+    def _run(self) -> None:
+        pending = None
+        running = True
+
+        while running:
+            group = [pending] if pending is not None else [self._queue.get()]
+            pending = None
+
+            if group[0] is None:
+                break
+
+            # collect everything queued meanwhile into one transaction, a situation appearing twice starts the next group
+            situation_ids = set(group[0][0].keys())
+            while len(situation_ids) < self._max_group_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    running = False
+                    break
+
+                if not situation_ids.isdisjoint(item[0].keys()):
+                    pending = item
+                    break
+
+                situation_ids.update(item[0].keys())
+                group.append(item)
+
+            self._write(group)
+
+    def _write(self, group: list[tuple[dict, Future, list|None]]) -> None:
+        # waiters may give up, e.g. when their event loop shuts down, but queued rows are written anyway
+        group = [(batch, future if future.set_running_or_notify_cancel() else None, messages) for batch, future, messages in group]
+
+        rows = dict()
+        delivery_messages = list()
+        for batch, _, messages in group:
+            rows.update(batch)
+            delivery_messages.extend(messages if messages is not None else list())
+
+        outcomes = self._commit(rows, delivery_messages)
+
+        # a failed group commit is retried batch by batch, so only the batches causing the failure fail
+        if UpsertOutcome.FAILED in outcomes.values() and len(group) > 1:
+            self._logger.warning(f"Retrying {len(group)} batch(es) in separate transactions")
+
+            outcomes = dict()
+            for batch, _, messages in group:
+                outcomes.update(self._commit(batch, messages))
+
+        for batch, future, _ in group:
+            if future is not None:
+                future.set_result({situation_id: outcomes[situation_id] for situation_id in batch.keys()})
+
+    def _commit(self, rows: dict[str, dict], delivery_messages: list[tuple[str, str, float]]|None) -> dict[str, UpsertOutcome]:
+        try:
+            outcomes = self._local_node_database.upsert_situation_rows(rows, delivery_messages=delivery_messages)
+        except Exception as ex:
+            self._logger.exception(ex)
+            outcomes = {situation_id: UpsertOutcome.FAILED for situation_id in rows.keys()}
+
+        if UpsertOutcome.FAILED in outcomes.values():
+            self._logger.error(f"Failed to store {len(rows)} situation(s)")
+        elif self._events is not None:
+            self._events.emit_outcomes(rows, outcomes)
+
+        return outcomes